@@ -0,0 +1,122 @@
+import os
+import sys
+from datetime import datetime
+
+import psycopg
+from psycopg import sql
+
+from benchmarks.baseline import (
+    build_report,
+    compare_reports,
+    load_report,
+    save_report,
+)
+from benchmarks.consistency import check_person_name_paths
+from benchmarks.macro import generate_backup, run_import_benchmarks
+from benchmarks.memory import run_memory_benchmarks
+from benchmarks.micro import run_db_benchmarks, run_model_benchmarks
+from modules.logger import Logger
+from modules.models.charter_db import CharterDb
+
+log = Logger()
+
+# Benchmark settings
+sizes = [int(size) for size in os.environ.get("BENCH_SIZES", "1000,10000").split(",")]
+data_path = str(os.environ.get("BENCH_DATA_PATH", "benchmarks/data"))
+baseline_path = str(os.environ.get("BENCH_BASELINE_PATH", "benchmarks/baseline.json"))
+save_baseline = os.environ.get("BENCH_SAVE_BASELINE", "").lower() in [
+    "1",
+    "true",
+    "yes",
+]
+tolerance = float(os.environ.get("BENCH_TOLERANCE", "0.1"))
+memory_size = int(os.environ.get("BENCH_MEMORY_SIZE", "10000"))
+
+# Postgres settings, the database benchmarks are skipped without a host
+pg_password = str(os.environ.get("PG_PW"))
+pg_host = os.environ.get("PG_HOST")
+pg_port = int(os.environ.get("PG_PORT", "5432"))
+pg_user = str(os.environ.get("PG_USER", "postgres"))
+pg_db = "momcheck_bench"
+
+
+def drop_bench_dbs():
+    dsn = f"dbname='postgres' user='{pg_user}' host='{pg_host}' password='{pg_password}' port='{pg_port}'"
+    with psycopg.connect(dsn, autocommit=True) as conn:
+        databases = conn.execute(
+            "SELECT datname FROM pg_database WHERE starts_with(datname, %s)", [pg_db]
+        ).fetchall()
+        for (database,) in databases:
+            conn.execute(
+                sql.SQL("DROP DATABASE IF EXISTS {} WITH (FORCE)").format(
+                    sql.Identifier(database)
+                )
+            )
+
+
+results = []
+mismatches = []
+
+# micro benchmarks on the smallest size
+backup_env = generate_backup(data_path, min(sizes))
+log.info("Running model benchmarks...")
+model_results, mismatches = run_model_benchmarks(
+    backup_env["BACKUP_PATH"], backup_env["IMAGE_LIST_PATH"]
+)
+results += model_results
+
+# memory report on a backup of a fixed size
+log.info("Running memory benchmarks...")
+memory_env = generate_backup(data_path, memory_size)
+memory = run_memory_benchmarks(memory_env["BACKUP_PATH"], memory_size)
+
+targets = {
+    "dry_run": {"DRY_RUN": "1"},
+    "sqlite": {"SQLITE_PATH": os.path.join(data_path, "bench.sqlite")},
+}
+try:
+    if pg_host is not None:
+        log.info("Running database benchmarks...")
+        with CharterDb(pg_host, pg_password, pg_port, pg_user, pg_db) as db:
+            results += run_db_benchmarks(
+                backup_env["BACKUP_PATH"], backup_env["IMAGE_LIST_PATH"], db
+            )
+        targets["postgres"] = {"PG_DB": pg_db}
+        log.info("Checking the person name processing paths...")
+        mismatches += check_person_name_paths(
+            backup_env["BACKUP_PATH"],
+            lambda path: CharterDb(
+                pg_host, pg_password, pg_port, pg_user, f"{pg_db}_{path}"
+            ),
+        )
+
+    # macro benchmarks
+    log.info("Running import benchmarks...")
+    results += run_import_benchmarks(data_path, sizes, targets)
+finally:
+    if pg_host is not None:
+        drop_bench_dbs()
+
+report = build_report(results)
+report["memory"] = memory
+timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+save_report(f"logs/benchmark_{timestamp}.json", report)
+
+baseline = load_report(baseline_path)
+regressions = []
+if baseline is not None:
+    log.info(f"Comparing with baseline {baseline_path} from {baseline['created']}")
+    regressions = compare_reports(baseline, report, tolerance)
+else:
+    compare_reports({"results": []}, report, tolerance)
+
+if save_baseline:
+    save_report(baseline_path, report)
+    log.info(f"Baseline saved to {baseline_path}")
+
+for mismatch in mismatches:
+    log.error(mismatch)
+if len(regressions) > 0:
+    log.error(f"{len(regressions)} benchmarks regressed: {', '.join(regressions)}")
+if len(regressions) > 0 or len(mismatches) > 0:
+    sys.exit(1)
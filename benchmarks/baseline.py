@@ -0,0 +1,56 @@
+import json
+import os
+import platform
+from datetime import datetime
+from typing import Dict, List
+
+from modules.logger import Logger
+
+log = Logger()
+
+
+def build_report(results: List[Dict]) -> Dict:
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "results": results,
+    }
+
+
+def save_report(path: str, report: Dict):
+    directory = os.path.dirname(path)
+    if directory != "":
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(report, file, indent=2)
+
+
+def load_report(path: str) -> None | Dict:
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as file:
+        return json.load(file)
+
+
+def compare_reports(baseline: Dict, report: Dict, tolerance: float) -> List[str]:
+    """
+    Logs the throughput of every benchmark relative to the `baseline` and returns the
+    names of the benchmarks that got slower by more than `tolerance`.
+    """
+    baseline_results = {result["name"]: result for result in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        previous = baseline_results.get(result["name"], None)
+        if previous is None or previous["ops_per_second"] == 0:
+            log.info(f"{result['name']:<40} {result['ops_per_second']:>14.1f} ops/s")
+            continue
+        ratio = result["ops_per_second"] / previous["ops_per_second"]
+        message = f"{result['name']:<40} {result['ops_per_second']:>14.1f} ops/s {ratio:>7.2f}x"
+        if ratio < 1 - tolerance:
+            regressions.append(result["name"])
+            log.warn(f"{message} regression")
+        else:
+            log.info(message)
+    return regressions
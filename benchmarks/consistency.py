@@ -0,0 +1,206 @@
+import copy
+import itertools
+from collections import Counter
+from typing import Callable, Dict, List, Tuple
+
+from lxml import etree
+from psycopg import sql
+
+from modules.constants import NAMESPACES
+from modules.logger import Logger
+from modules.models.charter_db import CharterDb, _dates_to_range, _serialize_xml
+from modules.models.charter_edit import CharterEdit
+from modules.models.mom_backup import MomBackup
+from modules.models.xml_fond_charter import XmlFondCharter
+
+log = Logger()
+
+# Person name ids depend on the order in which a path processes the names, so the
+# XML is compared without them and the person names by their contents
+_NORMALIZED_XML_QUERY = r"""
+    SELECT
+        atom_id,
+        regexp_replace(abstract::TEXT, '<\?person_names [0-9]+\?>', '<?person_names?>', 'g'),
+        regexp_replace(tenor::TEXT, '<\?person_names [0-9]+\?>', '<?person_names?>', 'g')
+    FROM charters
+"""
+_PERSON_NAMES_QUERY = """
+    SELECT c.atom_id, l.location, pn.key, pn.reg, pn.text, pn.person_id
+    FROM charters_person_names cpn
+    JOIN charters c ON c.id = cpn.charter_id
+    JOIN person_names pn ON pn.id = cpn.person_name_id
+    JOIN index_locations l ON l.id = pn.location_id
+"""
+# Charters whose person name processing instructions don't match their person names
+_UNMATCHED_CHARTERS_QUERY = r"""
+    SELECT c.atom_id
+    FROM charters c
+    WHERE ARRAY(
+        SELECT m[1]::INT
+        FROM regexp_matches(
+            COALESCE(c.abstract::TEXT, '') || COALESCE(c.tenor::TEXT, ''),
+            '<\?person_names ([0-9]+)\?>',
+            'g'
+        ) m
+        ORDER BY 1
+    ) IS DISTINCT FROM ARRAY(
+        SELECT cpn.person_name_id
+        FROM charters_person_names cpn
+        JOIN person_names pn ON pn.id = cpn.person_name_id
+        JOIN index_locations l ON l.id = pn.location_id
+        WHERE cpn.charter_id = c.id AND l.location IN ('ABSTRACT', 'TENOR')
+        ORDER BY 1
+    )
+"""
+
+
+def _remove_pers_name(pers_name: etree._Element):
+    parent = pers_name.getparent()
+    if parent is None:
+        return
+    if pers_name.tail:
+        previous = pers_name.getprevious()
+        if previous is not None:
+            previous.tail = (previous.tail or "") + pers_name.tail
+        else:
+            parent.text = (parent.text or "") + pers_name.tail
+    parent.remove(pers_name)
+
+
+def _add_pers_name(element: etree._Element, text: str):
+    pers_name = etree.SubElement(element, f"{{{NAMESPACES['cei']}}}persName")
+    pers_name.text = text
+
+
+def _build_edits(charters: List[XmlFondCharter]) -> List[CharterEdit]:
+    """
+    Returns edits of the `charters` that remove, change and add person names in their
+    abstracts and tenors, and edits that don't touch the XML.
+    """
+    edits: List[CharterEdit] = []
+    for index, charter in enumerate(charters):
+        edit = CharterEdit(charter.atom_id)
+        if index % 3 == 0 and charter.abstract is not None:
+            abstract = copy.deepcopy(charter.abstract)
+            pers_names = abstract.findall(".//cei:persName", NAMESPACES)
+            if len(pers_names) > 0:
+                _remove_pers_name(pers_names[0])
+            _add_pers_name(abstract, f"Added abstract name {index}")
+            edit.set_abstract(abstract)
+        elif index % 3 == 1 and charter.tenor is not None:
+            tenor = copy.deepcopy(charter.tenor)
+            pers_names = tenor.findall(".//cei:persName", NAMESPACES)
+            if len(pers_names) > 0:
+                pers_names[0].set("reg", f"Changed name {index}")
+            _add_pers_name(tenor, f"Added tenor name {index}")
+            edit.set_tenor(tenor)
+        else:
+            edit.set_idno(f"edited-{index}")
+        edits.append(edit)
+    return edits
+
+
+def _update_row_by_row(db: CharterDb, edits: List[CharterEdit]):
+    """
+    Applies the `edits` with one UPDATE statement per charter, so that the installed
+    triggers fire for every charter on its own.
+    """
+    if not db._con or not db._cur:
+        return
+    for edit in edits:
+        values = []
+        for field in edit.fields:
+            value = getattr(edit, field)
+            if field in ["abstract", "tenor"]:
+                value = _serialize_xml(value)
+            elif field == "issued_date":
+                value = _dates_to_range(value)
+            values.append(value)
+        db._cur.execute(
+            sql.SQL("UPDATE charters SET {} WHERE atom_id = %s").format(
+                sql.SQL(", ").join(
+                    sql.SQL("{} = %s").format(sql.Identifier(field))
+                    for field in edit.fields
+                )
+            ),
+            values + [edit.atom_id],
+        )
+    db._con.commit()
+
+
+# The paths that process person names, by whether they install the statement-level
+# triggers and how they apply the edits. The first path is the reference.
+_PATHS: Dict[str, Tuple[bool, Callable[[CharterDb, List[CharterEdit]], object]]] = {
+    "row": (False, _update_row_by_row),
+    "statement": (True, _update_row_by_row),
+    "batch": (True, lambda db, edits: db.update_charters(edits)),
+}
+
+
+def _first_difference(expected: List, actual: List) -> str:
+    missing = Counter(expected) - Counter(actual)
+    unexpected = Counter(actual) - Counter(expected)
+    if len(missing) > 0:
+        return f"missing {next(iter(missing))}"
+    return f"unexpected {next(iter(unexpected))}"
+
+
+def check_person_name_paths(
+    backup_path: str, connect: Callable[[str], CharterDb], sample: int = 50
+) -> List[str]:
+    """
+    Imports the first `sample` fond charters of the backup at `backup_path` once per
+    path in `_PATHS`, each into the database returned by `connect` for the path name,
+    applies the same edits through the path and compares the person names, charter
+    person names, abstracts and tenors with the row-level trigger. Returns the
+    mismatches, which are empty if all paths agree.
+    """
+    with MomBackup(backup_path) as backup:
+        users = backup.list_users()
+        person_index = backup.init_person_index()
+        archives = backup.list_archives()
+        fonds = backup.list_fonds(archives)
+        charters = list(
+            itertools.islice(
+                backup.iter_fond_charters(fonds, users, person_index), sample
+            )
+        )
+    edits = _build_edits(charters)
+    mismatches: List[str] = []
+    states: Dict[str, Tuple[List, List]] = {}
+    for name, (statement_level, update) in _PATHS.items():
+        with connect(name) as db:
+            db.setup_db()
+            db.insert_index_locations()
+            db.insert_users(users)
+            db.insert_archives(archives)
+            db.insert_fonds(fonds)
+            db.insert_fonds_charters(charters)
+            db.insert_persons(person_index, charters, [], [])
+            db.reset_serial_id_sequences()
+            db.enable_triggers(statement_level)
+            update(db, edits)
+            if not db._cur:
+                continue
+            db._cur.execute(_NORMALIZED_XML_QUERY)
+            xml = db._cur.fetchall()
+            db._cur.execute(_PERSON_NAMES_QUERY)
+            person_names = db._cur.fetchall()
+            db._cur.execute(_UNMATCHED_CHARTERS_QUERY)
+            for (atom_id,) in db._cur.fetchall():
+                mismatches.append(
+                    f"{name}: person names of {atom_id} don't match its processing instructions"
+                )
+            states[name] = (xml, person_names)
+        log.debug(f"Applied {len(edits)} edits through the {name} path")
+    reference, (reference_xml, reference_names) = next(iter(states.items()))
+    for name, (xml, person_names) in states.items():
+        if Counter(xml) != Counter(reference_xml):
+            mismatches.append(
+                f"{name}: abstracts and tenors differ from {reference}, {_first_difference(reference_xml, xml)}"
+            )
+        if Counter(person_names) != Counter(reference_names):
+            mismatches.append(
+                f"{name}: person names differ from {reference}, {_first_difference(reference_names, person_names)}"
+            )
+    return mismatches
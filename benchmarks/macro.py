@@ -0,0 +1,57 @@
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+from modules.backup_generator import BackupGenerator
+from modules.logger import Logger
+
+log = Logger()
+
+
+def generate_backup(data_path: str, charters: int, seed: int = 42) -> Dict[str, str]:
+    """
+    Generates the backup and image list for `charters` fond charters in `data_path`,
+    unless they already exist, and returns their paths as import environment.
+    """
+    os.makedirs(data_path, exist_ok=True)
+    backup_path = os.path.join(data_path, f"backup_{charters}_{seed}.zip")
+    image_list_path = os.path.join(data_path, f"images_{charters}_{seed}.txt")
+    if not os.path.exists(backup_path) or not os.path.exists(image_list_path):
+        BackupGenerator(charters, seed).write(backup_path, image_list_path)
+    return {"BACKUP_PATH": backup_path, "IMAGE_LIST_PATH": image_list_path}
+
+
+def run_import_benchmarks(
+    data_path: str, sizes: List[int], targets: Dict[str, Dict[str, str]]
+) -> List[Dict]:
+    """
+    Runs `sql_import.py` end to end on generated backups of each size for each of
+    the `targets`, which map a name to the environment that selects the output.
+    Every import runs in its own process, as the parsed state is process wide.
+    """
+    results: List[Dict] = []
+    for size in sizes:
+        backup_env = generate_backup(data_path, size)
+        for target, target_env in targets.items():
+            env = {**os.environ, **backup_env, **target_env}
+            log.info(f"Importing {size} charters into {target}...")
+            start = time.perf_counter()
+            subprocess.run(
+                [sys.executable, "sql_import.py"],
+                env=env,
+                check=True,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            seconds = time.perf_counter() - start
+            results.append(
+                {
+                    "name": f"import[{target}]@{size}",
+                    "ops": size,
+                    "seconds": seconds,
+                    "ops_per_second": size / seconds if seconds > 0 else 0.0,
+                }
+            )
+    return results
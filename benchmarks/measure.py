@@ -0,0 +1,31 @@
+import time
+from typing import Callable, Dict, List, TypeVar
+
+T = TypeVar("T")
+
+
+def measure(
+    name: str,
+    run: Callable[[T], int],
+    setup: Callable[[], T],
+    repeat: int = 5,
+) -> Dict:
+    """
+    Calls `setup` untimed and then times `run` with its result, `repeat` times.
+    `run` returns the number of operations it performed. The fastest repetition is
+    reported, as it is the one least disturbed by the rest of the system.
+    """
+    timings: List[float] = []
+    ops = 0
+    for _ in range(repeat):
+        state = setup()
+        start = time.perf_counter()
+        ops = run(state)
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    return {
+        "name": name,
+        "ops": ops,
+        "seconds": best,
+        "ops_per_second": ops / best if best > 0 else 0.0,
+    }
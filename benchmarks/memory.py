@@ -0,0 +1,93 @@
+import gc
+import tracemalloc
+from typing import Dict, List
+
+import modules.utils
+from modules.logger import Logger
+from modules.models.mom_backup import MomBackup
+
+log = Logger()
+
+
+def _parse_backup(backup_path: str) -> List:
+    """
+    Parses everything the import keeps alive until the end and returns it.
+    """
+    with MomBackup(backup_path) as backup:
+        users = backup.list_users()
+        person_index = backup.init_person_index()
+        archives = backup.list_archives()
+        fonds = backup.list_fonds(archives)
+        fond_charters = backup.list_fond_charters(fonds, users, person_index)
+        collections = backup.list_collections(fonds)
+        collection_charters = backup.list_collection_charters(
+            collections, users, person_index
+        )
+        saved_charters = backup.list_saved_charters(
+            users, fonds, collections, person_index
+        )
+        private_mycollections = backup.list_private_mycollections(users)
+        private_mycharters = backup.list_private_charters(
+            users,
+            private_mycollections,
+            fond_charters + collection_charters,
+            person_index,
+        )
+        public_mycollections = backup.list_public_mycollections(
+            users, private_mycollections
+        )
+        public_mycharters = backup.list_public_charters(
+            private_mycharters, public_mycollections, person_index
+        )
+    return [
+        users,
+        person_index,
+        archives,
+        fonds,
+        fond_charters,
+        collections,
+        collection_charters,
+        saved_charters,
+        private_mycollections,
+        private_mycharters,
+        public_mycollections,
+        public_mycharters,
+    ]
+
+
+def _measure_heap(backup_path: str) -> int:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        # Kept alive until the heap is measured
+        parsed = _parse_backup(backup_path)
+        gc.collect()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return size
+
+
+def run_memory_benchmarks(backup_path: str, charters: int) -> List[Dict]:
+    """
+    Measures the heap that the parsed backup at `backup_path` occupies, without and
+    with string interning, and logs the difference.
+    """
+    results: List[Dict] = []
+    for intern in [False, True]:
+        modules.utils.INTERN_STRINGS = intern
+        try:
+            size = _measure_heap(backup_path)
+        finally:
+            modules.utils.INTERN_STRINGS = True
+        name = "interned" if intern else "not interned"
+        results.append({"name": f"heap[{name}]@{charters}", "bytes": size})
+        log.info(f"Heap of the parsed backup, {name}: {size / 2**20:.1f} MiB")
+    before = results[0]["bytes"]
+    after = results[1]["bytes"]
+    if before > 0:
+        log.info(
+            f"String interning saves {(before - after) / 2**20:.1f} MiB "
+            f"({(before - after) / before * 100:.1f}%)"
+        )
+    return results
@@ -0,0 +1,315 @@
+import copy
+import time
+from typing import Dict, List, Tuple
+
+import validators
+from lxml import etree
+
+from benchmarks.measure import measure
+from modules.constants import NAMESPACES, IndexLocation
+from modules.models.charter_db import CharterDb, _serialize_xml
+from modules.models.images_file import ImagesFile
+from modules.models.mom_backup import MomBackup
+from modules.models.xml_charter import _decode_date, _parse_date
+from modules.models.xml_fond_charter import XmlFondCharter
+from modules.models.xml_person_name import XmlPersonName
+from modules.utils import _is_valid_origin, is_valid_url, join_url_parts
+
+
+def _charter_paths(backup: MomBackup, fonds, count: int) -> List[str]:
+    paths: List[str] = []
+    for fond in fonds:
+        base = f"db/mom-data/metadata.charter.public/{fond.archive_file}/{fond.file}"
+        for entry in backup._get_contents(base).resources:
+            paths.append(f"{base}/{entry.file}")
+            if len(paths) == count:
+                return paths
+    return paths
+
+
+def run_model_benchmarks(
+    backup_path: str, image_list_path: str, sample: int = 500, repeat: int = 5
+) -> Tuple[List[Dict], List[str]]:
+    """
+    Micro benchmarks of the parsing side of the import on a sample of the charters
+    in the backup at `backup_path`. Returns the results and the mismatches between
+    the replaced and the replacing functions, which are empty if they agree.
+    """
+    results: List[Dict] = []
+    mismatches: List[str] = []
+    with MomBackup(backup_path) as backup:
+        users = backup.list_users()
+        person_index = backup.init_person_index()
+        fonds = backup.list_fonds(backup.list_archives())
+        fond_by_path = {
+            f"db/mom-data/metadata.charter.public/{fond.archive_file}/{fond.file}": fond
+            for fond in fonds
+        }
+        paths = _charter_paths(backup, fonds, sample)
+        trees = {path: backup._get_xml(path) for path in paths}
+
+        def get_xml(_) -> int:
+            for path in paths:
+                backup._get_xml(path)
+            return len(paths)
+
+        results.append(measure("MomBackup._get_xml", get_xml, lambda: None, repeat))
+
+        # Charter construction adds processing instructions to the tree, so it
+        # has to work on fresh copies
+        def construct_charters(copies: Dict[str, etree._ElementTree]) -> int:
+            for path, tree in copies.items():
+                folder, file = path.rsplit("/", 1)
+                XmlFondCharter(file, fond_by_path[folder], tree, person_index, users)
+            return len(copies)
+
+        results.append(
+            measure(
+                "XmlCharter.__init__",
+                construct_charters,
+                lambda: {path: copy.deepcopy(tree) for path, tree in trees.items()},
+                repeat,
+            )
+        )
+
+        pers_names = [
+            element
+            for tree in trees.values()
+            for element in tree.iterfind(".//cei:persName", NAMESPACES)
+        ]
+
+        def construct_person_names(_) -> int:
+            for element in pers_names:
+                XmlPersonName(1, element, IndexLocation.ABSTRACT)
+            return len(pers_names)
+
+        results.append(
+            measure(
+                "XmlPersonName.__init__", construct_person_names, lambda: None, repeat
+            )
+        )
+
+        names = [
+            XmlPersonName(1, element, IndexLocation.ABSTRACT) for element in pers_names
+        ]
+
+        def find_for_name(_) -> int:
+            for name in names:
+                person_index.find_for_name(name)
+            return len(names)
+
+        results.append(
+            measure("PersonIndex.find_for_name", find_for_name, lambda: None, repeat)
+        )
+
+        date_values = [
+            value
+            for tree in trees.values()
+            for element in tree.iterfind(".//cei:issued/*", NAMESPACES)
+            for value in [
+                element.attrib.get("value"),
+                element.attrib.get("from"),
+                element.attrib.get("to"),
+            ]
+            if value is not None
+        ]
+
+        def parse_dates(_) -> int:
+            for value in date_values:
+                try:
+                    _parse_date(value)
+                except ValueError:
+                    pass
+            return len(date_values)
+
+        # Starts from an empty memo, so that each run pays for the distinct values
+        results.append(
+            measure("_parse_date", parse_dates, _decode_date.cache_clear, repeat)
+        )
+
+        # The full graphic URLs as `XmlCharter` builds them
+        graphic_urls: List[str] = []
+        for path, tree in trees.items():
+            image_base = fond_by_path[path.rsplit("/", 1)[0]].image_base
+            for element in tree.iterfind(".//cei:graphic", NAMESPACES):
+                url = element.attrib.get("url")
+                if not url:
+                    continue
+                if url.startswith("http"):
+                    graphic_urls.append(url)
+                elif image_base is not None:
+                    graphic_urls.append(join_url_parts(image_base, url))
+        for url in graphic_urls:
+            if is_valid_url(url) != bool(validators.url(url)):
+                mismatches.append(f"is_valid_url differs from validators.url for {url}")
+
+        def validate_urls(_) -> int:
+            for url in graphic_urls:
+                validators.url(url)
+            return len(graphic_urls)
+
+        def validate_urls_cached(_) -> int:
+            for url in graphic_urls:
+                is_valid_url(url)
+            return len(graphic_urls)
+
+        results.append(measure("validators.url", validate_urls, lambda: None, repeat))
+        results.append(
+            measure(
+                "is_valid_url",
+                validate_urls_cached,
+                _is_valid_origin.cache_clear,
+                repeat,
+            )
+        )
+
+        charters = [
+            XmlFondCharter(
+                path.rsplit("/", 1)[1],
+                fond_by_path[path.rsplit("/", 1)[0]],
+                copy.deepcopy(tree),
+                person_index,
+                users,
+            )
+            for path, tree in trees.items()
+        ]
+        elements = [
+            element
+            for charter in charters
+            for element in [charter.abstract, charter.tenor]
+            if element is not None
+        ]
+
+        def serialize_xml(_) -> int:
+            for element in elements:
+                _serialize_xml(element)
+            return len(elements)
+
+        results.append(measure("_serialize_xml", serialize_xml, lambda: None, repeat))
+
+    def list_images(_) -> int:
+        return len(ImagesFile(image_list_path).list_images())
+
+    results.append(measure("ImagesFile.list_images", list_images, lambda: None, repeat))
+    return results, mismatches
+
+
+def run_db_benchmarks(
+    backup_path: str, image_list_path: str, db: CharterDb, repeat: int = 3
+) -> List[Dict]:
+    """
+    Times each `CharterDb.insert_*` method on the full backup at `backup_path`.
+    The database is recreated before every repetition.
+    """
+    with MomBackup(backup_path) as backup:
+        users = backup.list_users()
+        images = ImagesFile(image_list_path).list_images()
+        person_index = backup.init_person_index()
+        archives = backup.list_archives()
+        fonds = backup.list_fonds(archives)
+        fond_charters = backup.list_fond_charters(fonds, users, person_index)
+        collections = backup.list_collections(fonds)
+        collection_charters = backup.list_collection_charters(
+            collections, users, person_index
+        )
+        saved_charters = backup.list_saved_charters(
+            users, fonds, collections, person_index
+        )
+        private_mycollections = backup.list_private_mycollections(users)
+        private_mycharters = backup.list_private_charters(
+            users,
+            private_mycollections,
+            fond_charters + collection_charters,
+            person_index,
+        )
+        public_mycollections = backup.list_public_mycollections(
+            users, private_mycollections
+        )
+        public_mycharters = backup.list_public_charters(
+            private_mycharters, public_mycollections, person_index
+        )
+    public_charters = fond_charters + collection_charters + public_mycharters
+
+    # In import order, as every step depends on the previous ones
+    steps = [
+        ("insert_index_locations", lambda: db.insert_index_locations(), 3),
+        ("insert_users", lambda: db.insert_users(users), len(users)),
+        ("insert_images", lambda: db.insert_images(images), len(images)),
+        ("insert_archives", lambda: db.insert_archives(archives), len(archives)),
+        ("insert_fonds", lambda: db.insert_fonds(fonds), len(fonds)),
+        (
+            "insert_fonds_charters",
+            lambda: db.insert_fonds_charters(fond_charters),
+            len(fond_charters),
+        ),
+        (
+            "insert_collections",
+            lambda: db.insert_collections(collections),
+            len(collections),
+        ),
+        (
+            "insert_collections_charters",
+            lambda: db.insert_collections_charters(collection_charters),
+            len(collection_charters),
+        ),
+        (
+            "insert_user_charter_bookmarks",
+            lambda: db.insert_user_charter_bookmarks(users),
+            sum(len(user.bookmarks) for user in users),
+        ),
+        (
+            "insert_saved_charters",
+            lambda: db.insert_saved_charters(saved_charters),
+            len(saved_charters),
+        ),
+        (
+            "insert_private_collections",
+            lambda: db.insert_private_collections(private_mycollections),
+            len(private_mycollections),
+        ),
+        (
+            "insert_private_mycharters",
+            lambda: db.insert_private_mycharters(private_mycharters),
+            len(private_mycharters),
+        ),
+        (
+            "insert_public_mycollections",
+            lambda: db.insert_public_mycollections(public_mycollections),
+            len(public_mycollections),
+        ),
+        (
+            "insert_public_mycharters",
+            lambda: db.insert_public_mycharters(public_mycharters),
+            len(public_mycharters),
+        ),
+        (
+            "insert_persons",
+            lambda: db.insert_persons(
+                person_index, public_charters, private_mycharters, saved_charters
+            ),
+            sum(
+                len(charter.person_names)
+                for charters in [public_charters, private_mycharters, saved_charters]
+                for charter in charters
+            ),
+        ),
+    ]
+    timings: Dict[str, List[float]] = {name: [] for name, _, _ in steps}
+    for _ in range(repeat):
+        db.setup_db()
+        for name, step, _ in steps:
+            start = time.perf_counter()
+            step()
+            timings[name].append(time.perf_counter() - start)
+    results = []
+    for name, _, ops in steps:
+        best = min(timings[name])
+        results.append(
+            {
+                "name": f"CharterDb.{name}",
+                "ops": ops,
+                "seconds": best,
+                "ops_per_second": ops / best if best > 0 else 0.0,
+            }
+        )
+    return results
@@ -0,0 +1,18 @@
+import os
+
+from modules.backup_generator import BackupGenerator
+from modules.logger import Logger
+
+log = Logger()
+
+# Backup settings
+backup_zip = str(os.environ.get("BACKUP_PATH"))
+
+# Image file list settings
+image_files_path = str(os.environ.get("IMAGE_LIST_PATH"))
+
+# Generator settings
+charters = int(os.environ.get("GENERATOR_CHARTERS", "1000"))
+seed = int(os.environ.get("GENERATOR_SEED", "42"))
+
+BackupGenerator(charters, seed).write(backup_zip, image_files_path)
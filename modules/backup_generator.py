@@ -0,0 +1,603 @@
+import bisect
+import random
+import zipfile
+from datetime import datetime, timedelta, timezone
+from typing import IO, List, Tuple
+from xml.sax.saxutils import escape, quoteattr
+
+from modules.constants import NAMESPACES
+from modules.logger import Logger
+
+log = Logger()
+
+_TAG = "tag:www.monasterium.net,2011:"
+_IMAGE_SERVER = "http://images.monasterium.net"
+_TIMESTAMP = (2021, 8, 19, 4, 0, 0)
+
+_COUNTRY_CODES = ["AT", "CZ", "DE", "HU", "IT", "SK", "SI"]
+_FIRST_NAMES = [
+    "Albrecht",
+    "Agnes",
+    "Conrad",
+    "Elisabeth",
+    "Friedrich",
+    "Gertrud",
+    "Heinrich",
+    "Kunigunde",
+    "Leopold",
+    "Margarete",
+    "Otto",
+    "Rudolf",
+]
+_SURNAMES = [
+    "von Wallsee",
+    "von Kuenring",
+    "von Liechtenstein",
+    "von Puchheim",
+    "von Schaunberg",
+    "von Starhemberg",
+]
+_WORDS = [
+    "abbas",
+    "capitulum",
+    "ecclesia",
+    "monasterium",
+    "decima",
+    "vinea",
+    "donatio",
+    "privilegium",
+    "confirmat",
+    "testes",
+    "sigillum",
+    "curia",
+]
+
+
+def _contents(collections: List[str], resources: List[str]) -> str:
+    entries = [
+        f"<subcollection name={quoteattr(c)} filename={quoteattr(c)}/>"
+        for c in collections
+    ] + [
+        f'<resource type="XMLResource" name={quoteattr(r)} filename={quoteattr(r)}/>'
+        for r in resources
+    ]
+    return f'<collection xmlns="{NAMESPACES["exist"]}">{"".join(entries)}</collection>'
+
+
+def _writestr(zip: zipfile.ZipFile, path: str, data: str):
+    # A fixed timestamp keeps the zip itself reproducible
+    info = zipfile.ZipInfo(path, date_time=_TIMESTAMP)
+    info.compress_type = zipfile.ZIP_DEFLATED
+    zip.writestr(info, data, compresslevel=1)
+
+
+def _split(total: int, parts: int, rng: random.Random) -> List[int]:
+    """
+    Splits `total` into `parts` random, non-negative counts.
+    """
+    if parts <= 0:
+        return []
+    weights = [rng.random() + 0.5 for _ in range(parts)]
+    weight_sum = sum(weights)
+    counts = [int(total * w / weight_sum) for w in weights]
+    counts[0] += total - sum(counts)
+    return counts
+
+
+class BackupGenerator:
+    """
+    Writes a synthetic, structurally valid MOM-CA backup zip and a matching image list.
+    The amount of data is derived from the number of fond `charters`, and all
+    content is reproducible for a given `seed`.
+    """
+
+    def __init__(self, charters: int = 1000, seed: int = 42):
+        self.seed = seed
+        self.charter_count = charters
+        self.fond_count = max(1, charters // 500)
+        self.archive_count = max(1, self.fond_count // 10)
+        self.collection_count = max(1, charters // 10000)
+        self.collection_charter_count = charters // 10
+        self.user_count = max(3, charters // 100)
+        self.saved_charter_count = charters // 100
+        self.person_count = max(10, charters // 50)
+        self.mycollection_count = max(1, self.user_count // 10)
+        self.mycharters_per_collection = 10
+        self.image_count = 0
+        # layout of the charters in archives, fonds and collections
+        rng = self._rng("layout")
+        self._fonds_per_archive = _split(self.fond_count, self.archive_count, rng)
+        self._fond_archives: List[int] = [
+            a for a, count in enumerate(self._fonds_per_archive) for _ in range(count)
+        ]
+        self._fond_offsets = self._offsets(
+            _split(self.charter_count, self.fond_count, rng)
+        )
+        self._collection_offsets = self._offsets(
+            _split(self.collection_charter_count, self.collection_count, rng)
+        )
+
+    def _offsets(self, counts: List[int]) -> List[int]:
+        offsets = [0]
+        for count in counts:
+            offsets.append(offsets[-1] + count)
+        return offsets
+
+    def _rng(self, part: str) -> random.Random:
+        return random.Random(f"{self.seed}-{part}")
+
+    def _archive_file(self, index: int) -> str:
+        return f"AR{index:04d}"
+
+    def _fond_file(self, index: int) -> str:
+        return f"F{index:05d}"
+
+    def _collection_file(self, index: int) -> str:
+        return f"COL{index:04d}"
+
+    def _user_email(self, index: int) -> str:
+        return f"user{index:06d}@example.org"
+
+    def _mycollection_uuid(self, index: int) -> str:
+        return f"{index:08x}-0000-4000-8000-{self.seed:012x}"
+
+    def _charter_atom_id(self, *parts: str) -> str:
+        return f"{_TAG}/charter/{'/'.join(parts)}"
+
+    def _fond_atom_id(self, fond: int) -> str:
+        return f"{_TAG}/fond/{self._archive_file(self._fond_archives[fond])}/{self._fond_file(fond)}"
+
+    def _public_charter(self, index: int) -> Tuple[List[str], str]:
+        """
+        Returns the path parts and atom id of the fond or collection charter at `index`.
+        """
+        if index < self.charter_count:
+            fond = bisect.bisect_right(self._fond_offsets, index) - 1
+            parts = [
+                self._archive_file(self._fond_archives[fond]),
+                self._fond_file(fond),
+                f"C{index:08d}",
+            ]
+        else:
+            index -= self.charter_count
+            collection = bisect.bisect_right(self._collection_offsets, index) - 1
+            parts = [self._collection_file(collection), f"K{index:08d}"]
+        return parts, self._charter_atom_id(*parts)
+
+    def _public_charter_count(self) -> int:
+        return self.charter_count + self.collection_charter_count
+
+    def _has_wikidata(self, person: int) -> bool:
+        return person % 5 != 0
+
+    def _person_name(self, rng: random.Random, in_index: bool) -> str:
+        attributes = ""
+        if in_index and rng.random() < 0.7:
+            person = rng.randrange(self.person_count)
+            attributes = (
+                f' key="wikidata:Q{person + 1000}"'
+                if self._has_wikidata(person) and rng.random() < 0.5
+                else f' key="P_{person:07d}"'
+            )
+        if rng.random() < 0.3:
+            attributes += f' reg="{rng.choice(_FIRST_NAMES)}"'
+        return f"<cei:persName{attributes}>{rng.choice(_FIRST_NAMES)} {rng.choice(_SURNAMES)}</cei:persName>"
+
+    def _words(self, rng: random.Random, count: int) -> str:
+        return " ".join(rng.choice(_WORDS) for _ in range(count))
+
+    def _date(self, rng: random.Random) -> str:
+        roll = rng.random()
+        year = rng.randint(800, 1800)
+        month = rng.randint(1, 12)
+        day = rng.randint(1, 28)
+        if roll < 0.05:
+            return '<cei:date value="99999999">ohne Datum</cei:date>'
+        if roll < 0.15:
+            return f'<cei:date value="{year:04d}9999">{year}</cei:date>'
+        if roll < 0.25:
+            return f'<cei:date value="{year:04d}{month:02d}99">{year}-{month:02d}</cei:date>'
+        if roll < 0.35:
+            return f'<cei:dateRange from="{year:04d}{month:02d}{day:02d}" to="{year + 1:04d}{month:02d}{day:02d}">{year}-{year + 1}</cei:dateRange>'
+        return f'<cei:date value="{year:04d}{month:02d}{day:02d}">{year}-{month:02d}-{day:02d}</cei:date>'
+
+    def _charter_cei(
+        self,
+        rng: random.Random,
+        atom_id: str,
+        idno: str,
+        graphics: List[str],
+        link: None | str = None,
+    ) -> str:
+        editor = (
+            f"<atom:author><atom:email>{self._user_email(rng.randrange(self.user_count))}</atom:email></atom:author>"
+            if rng.random() < 0.6
+            else ""
+        )
+        abstract_names = "".join(
+            f" {self._person_name(rng, True)}" for _ in range(rng.randint(0, 3))
+        )
+        tenor_names = "".join(
+            f" {self._person_name(rng, True)}" for _ in range(rng.randint(0, 2))
+        )
+        back_names = "".join(
+            self._person_name(rng, True) for _ in range(rng.randint(0, 4))
+        )
+        figures = "".join(
+            f"<cei:figure><cei:graphic url={quoteattr(graphic)}/></cei:figure>"
+            for graphic in graphics
+        )
+        link_element = f'<atom:link ref="{link}"/>' if link is not None else ""
+        abstract = (
+            f"<cei:abstract><cei:issuer>{rng.choice(_FIRST_NAMES)} {rng.choice(_SURNAMES)}</cei:issuer> {self._words(rng, 12)}{abstract_names}</cei:abstract>"
+            if rng.random() < 0.9
+            else ""
+        )
+        tenor = (
+            f"<cei:tenor>{self._words(rng, 60)}{tenor_names}</cei:tenor>"
+            if rng.random() < 0.5
+            else ""
+        )
+        return (
+            f'<atom:entry xmlns:atom="{NAMESPACES["atom"]}" xmlns:cei="{NAMESPACES["cei"]}">'
+            f"<atom:id>{escape(atom_id)}</atom:id>{link_element}{editor}"
+            '<atom:content type="application/xml"><cei:text type="charter"><cei:body>'
+            f'<cei:idno id="{escape(idno)}">{escape(idno)}</cei:idno>'
+            f"<cei:chDesc>{abstract}<cei:issued>{self._date(rng)}</cei:issued>"
+            f"<cei:witnessOrig>{figures}</cei:witnessOrig></cei:chDesc>{tenor}</cei:body>"
+            f"<cei:back>{back_names}</cei:back></cei:text></atom:content></atom:entry>"
+        )
+
+    def _write_person_index(self, zip: zipfile.ZipFile):
+        rng = self._rng("persons")
+        per_index = 10000
+        index_files: List[str] = []
+        for start in range(0, self.person_count, per_index):
+            file = f"persons{start // per_index:04d}.xml"
+            index_files.append(file)
+            persons = []
+            for person in range(start, min(start + per_index, self.person_count)):
+                uri = (
+                    f'<momtei:idno type="URI">http://www.wikidata.org/entity/Q{person + 1000}</momtei:idno>'
+                    if self._has_wikidata(person)
+                    else ""
+                )
+                persons.append(
+                    f'<momtei:person xml:id="P_{person:07d}"><momtei:persName>{rng.choice(_FIRST_NAMES)} {rng.choice(_SURNAMES)}</momtei:persName>{uri}</momtei:person>'
+                )
+            _writestr(
+                zip,
+                f"db/mom-data/metadata.person.public/{file}",
+                f'<atom:entry xmlns:atom="{NAMESPACES["atom"]}" xmlns:momtei="{NAMESPACES["momtei"]}">'
+                f"<atom:id>{_TAG}/index/{file.split('.')[0]}</atom:id>"
+                f"<atom:content><momtei:TEI><momtei:listPerson>{''.join(persons)}</momtei:listPerson></momtei:TEI></atom:content></atom:entry>",
+            )
+        _writestr(
+            zip,
+            "db/mom-data/metadata.person.public/__contents__.xml",
+            _contents([], index_files),
+        )
+
+    def _write_fonds(self, zip: zipfile.ZipFile, images: IO[str]):
+        """
+        Writes archives, fonds and their charters.
+        """
+        rng = self._rng("fonds")
+        archive_files = [self._archive_file(a) for a in range(self.archive_count)]
+        _writestr(
+            zip,
+            "db/mom-data/metadata.archive.public/__contents__.xml",
+            _contents(archive_files, []),
+        )
+        fond_index = 0
+        for archive_index, archive_file in enumerate(archive_files):
+            fond_files = [
+                self._fond_file(fond_index + f)
+                for f in range(self._fonds_per_archive[archive_index])
+            ]
+            country_code = _COUNTRY_CODES[archive_index % len(_COUNTRY_CODES)]
+            _writestr(
+                zip,
+                f"db/mom-data/metadata.archive.public/{archive_file}/{archive_file}.eag.xml",
+                f'<atom:entry xmlns:atom="{NAMESPACES["atom"]}" xmlns:eag="{NAMESPACES["eag"]}">'
+                f"<atom:id>{_TAG}/archive/{archive_file}</atom:id><atom:content><eag:eag><eag:archguide><eag:identity>"
+                f'<eag:repositorid countrycode="{country_code}">{country_code}-{archive_file}</eag:repositorid>'
+                f"<eag:autform>Archive {archive_file}</eag:autform>"
+                "</eag:identity></eag:archguide></eag:eag></atom:content></atom:entry>",
+            )
+            if archive_index % 2 == 0:
+                oai_fonds = "".join(f"<oei:fond>{f}</oei:fond>" for f in fond_files)
+                _writestr(
+                    zip,
+                    f"db/mom-data/metadata.archive.public/{archive_file}/oai.xml",
+                    f'<oei:oai xmlns:oei="{NAMESPACES["oei"]}">{oai_fonds}<oei:harvester>europeana</oei:harvester></oei:oai>',
+                )
+            _writestr(
+                zip,
+                f"db/mom-data/metadata.fond.public/{archive_file}/__contents__.xml",
+                _contents(fond_files, []),
+            )
+            for fond_file in fond_files:
+                image_base = f"{_IMAGE_SERVER}/img/{archive_file}/{fond_file}"
+                _writestr(
+                    zip,
+                    f"db/mom-data/metadata.fond.public/{archive_file}/{fond_file}/{fond_file}.ead.xml",
+                    f'<atom:entry xmlns:atom="{NAMESPACES["atom"]}" xmlns:ead="{NAMESPACES["ead"]}">'
+                    f"<atom:id>{_TAG}/fond/{archive_file}/{fond_file}</atom:id><atom:content><ead:ead><ead:archdesc><ead:did>"
+                    f"<ead:unitid>{fond_file}</ead:unitid><ead:unittitle>Fond {fond_file} of {archive_file}</ead:unittitle>"
+                    "</ead:did></ead:archdesc></ead:ead></atom:content></atom:entry>",
+                )
+                _writestr(
+                    zip,
+                    f"db/mom-data/metadata.fond.public/{archive_file}/{fond_file}/{fond_file}.preferences.xml",
+                    f'<xrx:preferences xmlns:xrx="{NAMESPACES["xrx"]}">'
+                    f'<xrx:param name="image-access">{"free" if rng.random() < 0.7 else "restricted"}</xrx:param>'
+                    f'<xrx:param name="image-server-base-url">{image_base}</xrx:param></xrx:preferences>',
+                )
+                charter_files = []
+                for c in range(
+                    self._fond_offsets[fond_index], self._fond_offsets[fond_index + 1]
+                ):
+                    name = f"C{c:08d}"
+                    charter_files.append(f"{name}.cei.xml")
+                    atom_id = self._charter_atom_id(archive_file, fond_file, name)
+                    graphics = [f"{name}_{g}.jpg" for g in range(rng.randint(0, 3))]
+                    for graphic in graphics:
+                        images.write(f"./img/{archive_file}/{fond_file}/{graphic}\n")
+                        self.image_count += 1
+                    _writestr(
+                        zip,
+                        f"db/mom-data/metadata.charter.public/{archive_file}/{fond_file}/{name}.cei.xml",
+                        self._charter_cei(rng, atom_id, name, graphics),
+                    )
+                _writestr(
+                    zip,
+                    f"db/mom-data/metadata.charter.public/{archive_file}/{fond_file}/__contents__.xml",
+                    _contents([], charter_files),
+                )
+                fond_index += 1
+
+    def _write_collections(self, zip: zipfile.ZipFile, images: IO[str]):
+        rng = self._rng("collections")
+        collection_files = [
+            self._collection_file(c) for c in range(self.collection_count)
+        ]
+        _writestr(
+            zip,
+            "db/mom-data/metadata.collection.public/__contents__.xml",
+            _contents(collection_files, []),
+        )
+        for collection_index, collection_file in enumerate(collection_files):
+            linked_fonds = "".join(
+                f'<cei:text type="collection" id="{self._fond_atom_id(f)}"/>'
+                for f in rng.sample(range(self.fond_count), min(2, self.fond_count))
+            )
+            _writestr(
+                zip,
+                f"db/mom-data/metadata.collection.public/{collection_file}/{collection_file}.cei.xml",
+                f'<atom:entry xmlns:atom="{NAMESPACES["atom"]}" xmlns:cei="{NAMESPACES["cei"]}">'
+                f"<atom:id>{_TAG}/collection/{collection_file}</atom:id><atom:content><cei:cei><cei:teiHeader><cei:fileDesc>"
+                f"<cei:sourceDesc><cei:provenance>Collection {collection_file}</cei:provenance></cei:sourceDesc></cei:fileDesc></cei:teiHeader>"
+                f"<cei:text><cei:group>{linked_fonds}</cei:group></cei:text>"
+                "<cei:image_server_address>images.monasterium.net</cei:image_server_address>"
+                f"<cei:image_server_folder>pics/{collection_file}</cei:image_server_folder>"
+                "</cei:cei></atom:content></atom:entry>",
+            )
+            charter_files = []
+            for c in range(
+                self._collection_offsets[collection_index],
+                self._collection_offsets[collection_index + 1],
+            ):
+                name = f"K{c:08d}"
+                charter_files.append(f"{name}.cei.xml")
+                atom_id = self._charter_atom_id(collection_file, name)
+                graphics = [f"{name}_{g}.jpg" for g in range(rng.randint(0, 2))]
+                for graphic in graphics:
+                    images.write(f"./pics/{collection_file}/{graphic}\n")
+                    self.image_count += 1
+                _writestr(
+                    zip,
+                    f"db/mom-data/metadata.charter.public/{collection_file}/{name}.cei.xml",
+                    self._charter_cei(rng, atom_id, name, graphics),
+                )
+            _writestr(
+                zip,
+                f"db/mom-data/metadata.charter.public/{collection_file}/__contents__.xml",
+                _contents([], charter_files),
+            )
+
+    def _write_users(self, zip: zipfile.ZipFile):
+        rng = self._rng("users")
+        user_files = [f"{self._user_email(u)}.xml" for u in range(self.user_count)]
+        _writestr(
+            zip,
+            "db/mom-data/xrx.user/__contents__.xml",
+            _contents([], ["admin.xml", "guest.xml"] + user_files),
+        )
+        # saved charters
+        saved_by_user: List[List[str]] = [[] for _ in range(self.user_count)]
+        saved_files = []
+        start = datetime(2015, 1, 1, tzinfo=timezone.utc)
+        public_count = self._public_charter_count()
+        for index in rng.sample(
+            range(public_count), min(self.saved_charter_count, public_count)
+        ):
+            parts, atom_id = self._public_charter(index)
+            user = rng.randrange(self.user_count)
+            start_time = (start + timedelta(minutes=rng.randrange(5_000_000))).strftime(
+                "%Y-%m-%dT%H:%M:%S.000+01:00"
+            )
+            released = "yes" if rng.random() < 0.3 else "no"
+            saved_by_user[user].append(
+                f"<xrx:saved><xrx:id>{escape(atom_id)}</xrx:id><xrx:start_time>{start_time}</xrx:start_time><xrx:freigabe>{released}</xrx:freigabe></xrx:saved>"
+            )
+            file = (
+                "#".join(["tag:www.monasterium.net,2011", "charter"] + parts) + ".xml"
+            )
+            saved_files.append(file)
+            _writestr(
+                zip,
+                f"db/mom-data/metadata.charter.saved/{file}",
+                self._charter_cei(rng, atom_id, parts[-1], []),
+            )
+        _writestr(
+            zip,
+            "db/mom-data/metadata.charter.saved/__contents__.xml",
+            _contents([], saved_files),
+        )
+        for user in range(self.user_count):
+            email = self._user_email(user)
+            moderator = (
+                f"<xrx:moderator>{self._user_email(user % 3)}</xrx:moderator>"
+                if user >= 3
+                else ""
+            )
+            bookmarks = [
+                self._public_charter(rng.randrange(public_count))[1]
+                for _ in range(rng.randint(0, 3) if public_count > 0 else 0)
+            ]
+            bookmark_elements = "".join(
+                f"<xrx:bookmark>{escape(b)}</xrx:bookmark>" for b in bookmarks
+            )
+            _writestr(
+                zip,
+                f"db/mom-data/xrx.user/{email}.xml",
+                f'<xrx:user xmlns:xrx="{NAMESPACES["xrx"]}"><xrx:username/><xrx:password/>'
+                f"<xrx:firstname>{rng.choice(_FIRST_NAMES)}</xrx:firstname><xrx:name>{rng.choice(_SURNAMES)}</xrx:name>"
+                f"<xrx:email>{email}</xrx:email>{moderator}"
+                f"<xrx:bookmarks>{bookmark_elements}</xrx:bookmarks>"
+                f"<xrx:saved_list>{''.join(saved_by_user[user])}</xrx:saved_list></xrx:user>",
+            )
+            note_files = []
+            for b, bookmark in enumerate(bookmarks[:1]):
+                note_file = f"note{b}.xml"
+                note_files.append(note_file)
+                escaped = bookmark.replace(
+                    "tag:www.monasterium.net,2011:",
+                    "tag%3Awww.monasterium.net%2C2011%3A",
+                )
+                _writestr(
+                    zip,
+                    f"db/mom-data/xrx.user/{email}/metadata.bookmark-notes/{note_file}",
+                    f'<xrx:bookmark_note xmlns:xrx="{NAMESPACES["xrx"]}"><xrx:bookmark>{escape(escaped)}</xrx:bookmark>'
+                    f"<xrx:note>{self._words(rng, 5)}</xrx:note></xrx:bookmark_note>",
+                )
+            if len(note_files) > 0:
+                _writestr(
+                    zip,
+                    f"db/mom-data/xrx.user/{email}/metadata.bookmark-notes/__contents__.xml",
+                    _contents([], note_files),
+                )
+
+    def _write_mycollections(self, zip: zipfile.ZipFile):
+        rng = self._rng("mycollections")
+        public_count = self._public_charter_count()
+        public_uuids = []
+        by_user: List[List[int]] = [[] for _ in range(self.user_count)]
+        for m in range(self.mycollection_count):
+            by_user[rng.randrange(self.user_count)].append(m)
+        for user, mycollections in enumerate(by_user):
+            if len(mycollections) == 0:
+                continue
+            email = self._user_email(user)
+            files = []
+            for m in mycollections:
+                uuid = self._mycollection_uuid(m)
+                file = f"{uuid}.mycollection.xml"
+                files.append(file)
+                cei = (
+                    f'<atom:entry xmlns:atom="{NAMESPACES["atom"]}" xmlns:cei="{NAMESPACES["cei"]}">'
+                    f"<atom:id>{_TAG}/mycollection/{uuid}</atom:id><atom:author><atom:email>{email}</atom:email></atom:author>"
+                    f"<atom:content><cei:cei><cei:teiHeader><cei:fileDesc><cei:title>My collection {m}</cei:title>"
+                    "</cei:fileDesc></cei:teiHeader></cei:cei></atom:content></atom:entry>"
+                )
+                _writestr(
+                    zip,
+                    f"db/mom-data/xrx.user/{email}/metadata.mycollection/{file}",
+                    cei,
+                )
+                is_public = rng.random() < 0.5
+                charter_files = []
+                for c in range(self.mycharters_per_collection):
+                    name = f"{uuid}-{c:04d}"
+                    charter_file = f"{name}.charter.xml"
+                    charter_files.append(charter_file)
+                    atom_id = self._charter_atom_id(uuid, name)
+                    link = (
+                        self._public_charter(rng.randrange(public_count))[1]
+                        if public_count > 0 and rng.random() < 0.5
+                        else None
+                    )
+                    graphics = (
+                        [f"{_IMAGE_SERVER}/mycharter/{name}.jpg"]
+                        if rng.random() < 0.3
+                        else []
+                    )
+                    charter_cei = self._charter_cei(rng, atom_id, name, graphics, link)
+                    _writestr(
+                        zip,
+                        f"db/mom-data/xrx.user/{email}/metadata.charter/{uuid}/{charter_file}",
+                        charter_cei,
+                    )
+                    if rng.random() < 0.2:
+                        shared_with = self._user_email(rng.randrange(self.user_count))
+                        _writestr(
+                            zip,
+                            f"db/mom-data/xrx.user/{email}/metadata.charter.share/{uuid}/{name}.charter.share.xml",
+                            f'<xrx:share xmlns:xrx="{NAMESPACES["xrx"]}"><xrx:userid type="owner">{email}</xrx:userid>'
+                            f"<xrx:userid>{shared_with}</xrx:userid></xrx:share>",
+                        )
+                    if is_public:
+                        _writestr(
+                            zip,
+                            f"db/mom-data/metadata.charter.public/{uuid}/{charter_file}",
+                            charter_cei,
+                        )
+                _writestr(
+                    zip,
+                    f"db/mom-data/xrx.user/{email}/metadata.charter/{uuid}/__contents__.xml",
+                    _contents([], charter_files),
+                )
+                if is_public:
+                    public_uuids.append(uuid)
+                    _writestr(
+                        zip,
+                        f"db/mom-data/metadata.mycollection.public/{uuid}/{uuid}.mycollection.xml",
+                        cei,
+                    )
+                    _writestr(
+                        zip,
+                        f"db/mom-data/metadata.charter.public/{uuid}/__contents__.xml",
+                        _contents([], charter_files),
+                    )
+            _writestr(
+                zip,
+                f"db/mom-data/xrx.user/{email}/metadata.mycollection/__contents__.xml",
+                _contents([], files),
+            )
+        _writestr(
+            zip,
+            "db/mom-data/metadata.mycollection.public/__contents__.xml",
+            _contents(public_uuids, []),
+        )
+
+    def write(self, zip_path: str, image_list_path: str):
+        log.info(
+            f"Generating backup with {self.charter_count} fond charters (seed {self.seed})..."
+        )
+        self.image_count = 0
+        with zipfile.ZipFile(zip_path, "w") as zip, open(
+            image_list_path, "w", encoding="iso-8859-1"
+        ) as images:
+            self._write_person_index(zip)
+            self._write_fonds(zip, images)
+            self._write_collections(zip, images)
+            self._write_users(zip)
+            self._write_mycollections(zip)
+            # images on the server that are not used by any charter
+            rng = self._rng("images")
+            for i in range(max(1, self.image_count // 10)):
+                images.write(f"./img/unused/{i:08d}.jpg\n")
+                if rng.random() < 0.1:
+                    images.write(f"./illum/IllUrk/thumbnails/{i:08d}.jpg\n")
+        log.info(f"Backup written to {zip_path}, image list to {image_list_path}")
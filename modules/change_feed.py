@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Sequence
+
+from modules.logger import Logger
+from modules.models.person_index import Person
+from modules.models.xml_charter import XmlCharter
+from modules.models.xml_mycharter import XmlMycharter
+from modules.models.xml_saved_charter import XmlSavedCharter
+
+log = Logger()
+
+ADDED = "added"
+REMOVED = "removed"
+MODIFIED = "modified"
+
+FINGERPRINTS_FILE = "fingerprints.json"
+
+
+def _hash(values: Iterable[None | str]) -> str:
+    hash = hashlib.blake2b(digest_size=8)
+    for value in values:
+        hash.update(b"\0" if value is None else value.encode() + b"\1")
+    return hash.hexdigest()
+
+
+class ChangeFeed:
+    """
+    Lists the charters, saved charters, private charters, persons and images that were
+    added, removed or modified since the previous import into the directory at `path`.
+    Every record gets a fingerprint from the checksums of its source files in the
+    backup zip, which are taken while the backup is parsed, and the fields that don't
+    come from those files. The fingerprints are kept in `fingerprints.json` for the
+    next import, and the changes are written as NDJSON to
+    `changes_<timestamp>.ndjson`, one change per line.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # Fingerprints of the records by kind and key
+        self.fingerprints: Dict[str, Dict[str, str]] = {
+            "charters": {},
+            "saved_charters": {},
+            "private_charters": {},
+            "persons": {},
+            "images": {},
+        }
+
+    def track_images(self, images: Iterable[str]) -> Iterator[str]:
+        """
+        Passes the image server `images` through while recording them.
+        """
+        fingerprints = self.fingerprints["images"]
+        for image in images:
+            fingerprints[image] = ""
+            yield image
+
+    def _add_charter(self, kind: str, key: str, charter: XmlCharter, *values: str):
+        self.fingerprints[kind][key] = _hash(
+            [charter.content_hash, charter.url, *charter.images, *values]
+        )
+        for image in charter.images:
+            self.fingerprints["images"][image] = ""
+
+    def add_charters(self, charters: Sequence[XmlCharter]):
+        for charter in charters:
+            self._add_charter("charters", charter.atom_id, charter)
+
+    def add_saved_charters(self, charters: Sequence[XmlSavedCharter]):
+        for charter in charters:
+            self._add_charter(
+                "saved_charters",
+                charter.atom_id,
+                charter,
+                str(charter.start_time),
+                str(charter.released),
+            )
+
+    def add_private_charters(self, charters: Sequence[XmlMycharter]):
+        for charter in charters:
+            self._add_charter(
+                "private_charters",
+                f"{charter.collection_atom_id} {charter.atom_id}",
+                charter,
+            )
+
+    def add_persons(self, persons: Sequence[Person]):
+        fingerprints = self.fingerprints["persons"]
+        for person in persons:
+            names = "; ".join(person.names)
+            key = person.mom_iri or person.wikidata_iri or names
+            fingerprints[key] = _hash([names, person.mom_iri, person.wikidata_iri])
+
+    def _load_previous(self) -> None | Dict[str, Dict[str, str]]:
+        path = os.path.join(self.path, FINGERPRINTS_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as file:
+            return json.load(file)
+
+    def _list_changes(self, previous: Dict[str, Dict[str, str]]) -> List[Dict]:
+        changes: List[Dict] = []
+        for kind, fingerprints in self.fingerprints.items():
+            previous_fingerprints = previous.get(kind, {})
+            for key in sorted(fingerprints.keys() | previous_fingerprints.keys()):
+                fingerprint = fingerprints.get(key, None)
+                previous_fingerprint = previous_fingerprints.get(key, None)
+                if previous_fingerprint is None:
+                    change = ADDED
+                elif fingerprint is None:
+                    change = REMOVED
+                elif fingerprint != previous_fingerprint:
+                    change = MODIFIED
+                else:
+                    continue
+                changes.append({"kind": kind, "key": key, "change": change})
+        return changes
+
+    def write(self) -> int:
+        """
+        Writes the changes since the previous import and replaces the fingerprints of
+        the previous import. Without previous fingerprints, every record is added.
+        Returns the number of changes.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        previous = self._load_previous()
+        if previous is None:
+            log.info("No fingerprints of a previous import, listing all as added")
+        changes = self._list_changes({} if previous is None else previous)
+        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        changes_path = os.path.join(self.path, f"changes_{timestamp}.ndjson")
+        with open(changes_path, "w", encoding="utf-8") as file:
+            for change in changes:
+                file.write(json.dumps(change, ensure_ascii=False))
+                file.write("\n")
+        # The fingerprints are only replaced once the changes are written
+        fingerprints_path = os.path.join(self.path, FINGERPRINTS_FILE)
+        with open(f"{fingerprints_path}.tmp", "w", encoding="utf-8") as file:
+            json.dump(self.fingerprints, file, ensure_ascii=False)
+        os.replace(f"{fingerprints_path}.tmp", fingerprints_path)
+        counts = Counter((change["kind"], change["change"]) for change in changes)
+        for kind in self.fingerprints.keys():
+            log.info(
+                f"Changes of {kind}: {counts[(kind, ADDED)]} added, {counts[(kind, REMOVED)]} removed, {counts[(kind, MODIFIED)]} modified"
+            )
+        log.info(f"Change feed written to {changes_path}")
+        return len(changes)
@@ -18,3 +18,12 @@ class IndexLocation(Enum):
     ABSTRACT = 1
     BACK = 2
     TENOR = 3
+
+
+class DiagnosticView(Enum):
+    UNUSED_IMAGES = "unused_images"
+    INCOMPLETE_CHARTERS = "incomplete_charters"
+    USER_MODERATORS = "user_moderators"
+    RELEASED_SAVED_CHARTERS = "released_saved_charters"
+    EMPTY_FONDS = "empty_fonds"
+    EMPTY_COLLECTIONS = "empty_collections"
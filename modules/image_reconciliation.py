@@ -0,0 +1,163 @@
+from typing import Dict, Iterable, Iterator, List, Sequence, Set, Tuple
+from urllib.parse import unquote
+
+from modules.models.xml_charter import XmlCharter
+from modules.models.xml_collection import XmlCollection
+from modules.models.xml_collection_charter import XmlCollectionCharter
+from modules.models.xml_fond import XmlFond
+from modules.models.xml_fond_charter import XmlFondCharter
+from modules.models.xml_mycollection import XmlMycollection
+
+USED = "used"
+UNUSED = "unused"
+DANGLING = "dangling"
+
+
+def canonical_image_key(url: str) -> str:
+    """
+    Returns a key for the image `url` that is the same for spellings of the same image,
+    ignoring the scheme, the case of the host, default ports, percent encoding,
+    `./` segments and repeated slashes. Paths starting with `./` are on the image
+    server.
+    """
+    url = url.strip()
+    # Paths in the image server list are relative to the image server
+    if url.startswith("./"):
+        url = "images.monasterium.net/" + url[2:]
+    scheme_end = url.find("://")
+    if scheme_end != -1 and url[:scheme_end].lower() in ["http", "https"]:
+        url = url[scheme_end + 3 :]
+    host, _, path = url.lstrip("/").partition("/")
+    host = host.lower()
+    if host.endswith(":80") or host.endswith(":443"):
+        host = host.rsplit(":", 1)[0]
+    segments = [
+        segment for segment in unquote(path).split("/") if segment not in ["", "."]
+    ]
+    return "/".join([host] + segments)
+
+
+class ImageReconciliation:
+    """
+    Matches the images on the image server against the images of all charters by their
+    canonical keys. Images on the server are `used` if any charter shows them and
+    `unused` otherwise. Charter images on an image server host that are not on the
+    server are `dangling`. Counts are kept per fond and per collection, where unused
+    images are attributed by the image base of the fond or collection.
+    """
+
+    def __init__(self):
+        self._server: Dict[str, str] = {}
+        self._charters: Dict[str, str] = {}
+        self._charter_counts: Dict[str, int] = {}
+        self._fond_keys: Dict[int, Set[str]] = {}
+        self._collection_keys: Dict[int, Set[str]] = {}
+        self._fond_bases: Dict[str, List[int]] = {}
+        self._collection_bases: Dict[str, List[int]] = {}
+        # Results
+        self.images: List[Tuple[str, str, str, int]] = []
+        self.fonds: List[Tuple[int, int, int, int]] = []
+        self.collections: List[Tuple[int, int, int, int]] = []
+
+    def track_server_images(self, images: Iterable[str]) -> Iterator[str]:
+        """
+        Passes the image server `images` through while recording their keys.
+        """
+        for image in images:
+            self._server.setdefault(canonical_image_key(image), image)
+            yield image
+
+    def add_fonds(self, fonds: Sequence[XmlFond]):
+        for fond in fonds:
+            self._fond_keys.setdefault(fond.id, set())
+            if fond.image_base is not None:
+                key = canonical_image_key(fond.image_base)
+                self._fond_bases.setdefault(key, []).append(fond.id)
+
+    def add_collections(self, collections: Sequence[XmlCollection | XmlMycollection]):
+        for collection in collections:
+            self._collection_keys.setdefault(collection.id, set())
+            image_base = getattr(collection, "image_base", None)
+            if image_base is not None:
+                key = canonical_image_key(image_base)
+                self._collection_bases.setdefault(key, []).append(collection.id)
+
+    def add_charters(self, charters: Iterable[XmlCharter]):
+        """
+        Records the images of the `charters`, attributed to their fond or collection
+        if they are fond or collection charters.
+        """
+        for charter in charters:
+            keys: Set[str] = set()
+            for image in charter.images:
+                key = canonical_image_key(image)
+                self._charters.setdefault(key, image)
+                keys.add(key)
+            for key in keys:
+                self._charter_counts[key] = self._charter_counts.get(key, 0) + 1
+            if isinstance(charter, XmlFondCharter):
+                self._fond_keys.setdefault(charter.fond_id, set()).update(keys)
+            elif isinstance(charter, XmlCollectionCharter):
+                self._collection_keys.setdefault(charter.collection_id, set()).update(
+                    keys
+                )
+
+    def _owners(self, key: str, bases: Dict[str, List[int]]) -> List[int]:
+        """
+        Returns the ids of the fonds or collections with the longest image base that
+        contains `key`.
+        """
+        prefix = key
+        while "/" in prefix:
+            prefix = prefix.rsplit("/", 1)[0]
+            owners = bases.get(prefix, None)
+            if owners is not None:
+                return owners
+        return []
+
+    def reconcile(self):
+        server_keys = self._server.keys()
+        charter_keys = self._charters.keys()
+        hosts = {key.split("/", 1)[0] for key in server_keys}
+        used = server_keys & charter_keys
+        unused = server_keys - charter_keys
+        dangling = {
+            key for key in charter_keys - server_keys if key.split("/", 1)[0] in hosts
+        }
+        self.images = (
+            [(key, self._server[key], USED, self._charter_counts[key]) for key in used]
+            + [(key, self._server[key], UNUSED, 0) for key in unused]
+            + [
+                (key, self._charters[key], DANGLING, self._charter_counts[key])
+                for key in dangling
+            ]
+        )
+        self.images.sort()
+        self.fonds = self._count(self._fond_keys, self._fond_bases, unused, dangling)
+        self.collections = self._count(
+            self._collection_keys, self._collection_bases, unused, dangling
+        )
+
+    def _count(
+        self,
+        owner_keys: Dict[int, Set[str]],
+        bases: Dict[str, List[int]],
+        unused: Set[str],
+        dangling: Set[str],
+    ) -> List[Tuple[int, int, int, int]]:
+        """
+        Returns the number of used, unused and dangling images per owner.
+        """
+        unused_counts: Dict[int, int] = {}
+        for key in unused:
+            for owner in self._owners(key, bases):
+                unused_counts[owner] = unused_counts.get(owner, 0) + 1
+        return [
+            (
+                owner,
+                len(keys & self._server.keys()),
+                unused_counts.get(owner, 0),
+                len(keys & dangling),
+            )
+            for owner, keys in sorted(owner_keys.items())
+        ]
@@ -0,0 +1,156 @@
+import copyreg
+import os
+import pickle
+from typing import Any, BinaryIO, Dict, List
+
+from lxml import etree
+
+from modules.logger import Logger
+from modules.models.charter_store import CharterStore
+from modules.models.person_index import PersonIndex
+from modules.models.serial_id_generator import SerialIDGenerator
+
+log = Logger()
+
+_PARSER = etree.XMLParser(huge_tree=True)
+
+
+def _restore_element(xml: bytes) -> etree._Element:
+    return etree.fromstring(xml, _PARSER)
+
+
+def _reduce_element(element: etree._Element):
+    return _restore_element, (etree.tostring(element, with_tail=False),)
+
+
+# lxml elements can't be pickled, so they are stored as XML
+_DISPATCH_TABLE = copyreg.dispatch_table.copy()
+_DISPATCH_TABLE[etree._Element] = _reduce_element
+
+
+def _person_index_state() -> List[Dict]:
+    # Copied, as the pickle memo would otherwise refer to an earlier state
+    return [
+        dict(PersonIndex._mom_person_ids),
+        dict(PersonIndex._persons),
+        dict(PersonIndex._wikidata_person_ids),
+    ]
+
+
+def _restore_person_index_state(state: List[Dict]):
+    mom_person_ids, persons, wikidata_person_ids = state
+    PersonIndex._mom_person_ids = mom_person_ids
+    PersonIndex._persons = persons
+    PersonIndex._wikidata_person_ids = wikidata_person_ids
+
+
+class ImportCheckpoint:
+    """
+    Makes the import of the backup with the `fingerprint` resumable. Every completed
+    stage is recorded in the `store`, and the values that later stages need are
+    appended to the checkpoint file at `path` together with the id counters and the
+    person index. All records share one pickle memo, so that objects are stored
+    once and keep referring to each other when they are restored. Without a `path`,
+    nothing is recorded.
+    """
+
+    def __init__(self, path: None | str, store: CharterStore, fingerprint: str):
+        self.path = path
+        self.store = store
+        self.fingerprint = fingerprint
+        # Values of the restored stages by name
+        self.state: Dict[str, Any] = {}
+        self.restored_stages: List[str] = []
+        self._file: None | BinaryIO = None
+        self._pickler: None | pickle.Pickler = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, __exc_type__, __exc_val__, __exc_tb__):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._pickler = None
+
+    def _open(self, path: str):
+        self._file = open(path, "wb")
+        self._pickler = pickle.Pickler(self._file, pickle.HIGHEST_PROTOCOL)
+        self._pickler.dispatch_table = _DISPATCH_TABLE
+
+    def _append(self, record: Dict[str, Any]):
+        if self.path is None:
+            return
+        if self._file is None or self._pickler is None:
+            self._open(self.path)
+        assert self._file is not None and self._pickler is not None
+        self._pickler.dump(record)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _record(self, stages: List[str], values: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "fingerprint": self.fingerprint,
+            "stages": stages,
+            "values": values,
+            "ids": dict(SerialIDGenerator().counters),
+            "person_index": _person_index_state(),
+        }
+
+    def resume(self):
+        """
+        Restores the values, the id counters and the person index after the stages
+        that the store recorded as completed, and starts a new checkpoint file from
+        them.
+        """
+        if self.path is None:
+            return
+        completed = set(self.store.list_completed_stages(self.fingerprint))
+        if len(completed) == 0 or not os.path.exists(self.path):
+            log.info("No completed stages to resume, importing from the start")
+            return
+        record: None | Dict[str, Any] = None
+        with open(self.path, "rb") as file:
+            unpickler = pickle.Unpickler(file)
+            while True:
+                try:
+                    next_record = unpickler.load()
+                except (EOFError, pickle.UnpicklingError):
+                    # The end of the file, or a record cut off by the failure
+                    break
+                if next_record["fingerprint"] != self.fingerprint or not all(
+                    stage in completed for stage in next_record["stages"]
+                ):
+                    break
+                self.restored_stages.extend(next_record["stages"])
+                self.state.update(next_record["values"])
+                record = next_record
+        if record is None:
+            log.info("No checkpoint of the completed stages, importing from the start")
+            return
+        SerialIDGenerator().counters = record["ids"]
+        _restore_person_index_state(record["person_index"])
+        # The old checkpoint is only replaced once the new one holds its state
+        self._open(f"{self.path}.tmp")
+        self._append(self._record(self.restored_stages, self.state))
+        os.replace(f"{self.path}.tmp", self.path)
+        log.info(f"Resuming after {len(self.restored_stages)} completed stages")
+
+    def restored(self, stage: str) -> bool:
+        """
+        Returns whether `stage` was restored and is to be skipped.
+        """
+        if stage not in self.restored_stages:
+            return False
+        log.info(f"Skipping stage {stage}, restored from the checkpoint")
+        return True
+
+    def complete(self, stage: str, **values: Any):
+        """
+        Appends the `values` of `stage` to the checkpoint file and records the stage
+        as completed in the store.
+        """
+        if self.path is None:
+            return
+        self._append(self._record([stage], values))
+        self.store.complete_stage(stage, self.fingerprint)
@@ -0,0 +1,58 @@
+import hashlib
+from typing import Dict, Iterable, Iterator, Set, Tuple
+
+from modules.logger import Logger
+
+log = Logger()
+
+
+class ImportSample:
+    """
+    A reproducible sample of the backup for fast imports. Public charters, users and
+    server images are picked if a hash of their key and the `seed` falls below
+    `fraction`, so that the same seed always picks the same entities, independent of
+    their order in the backup. The fonds, collections and archives of the picked
+    charters are sampled with them. `MomBackup.apply_sample` adds everything the
+    picked entities reference.
+    """
+
+    def __init__(self, fraction: float, seed: int = 0):
+        if fraction <= 0 or fraction > 1:
+            raise ValueError(f"Sample fraction must be in (0, 1]: {fraction}")
+        self.fraction = fraction
+        self.seed = seed
+        self._threshold = int(fraction * 2**64)
+        # Archive files, `archive/fond` files and collection files
+        self.archives: Set[str] = set()
+        self.fonds: Set[str] = set()
+        self.collections: Set[str] = set()
+        # Paths of the public charters
+        self.charter_paths: Set[str] = set()
+        # Lower case emails
+        self.users: Set[str] = set()
+        # Number of sampled and total entities by kind
+        self.counts: Dict[str, Tuple[int, int]] = {}
+
+    def picks(self, key: str) -> bool:
+        digest = hashlib.blake2b(f"{self.seed}:{key}".encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big") < self._threshold
+
+    def filter_images(self, images: Iterable[str]) -> Iterator[str]:
+        """
+        Passes the picked server `images` through. The images of sampled charters are
+        inserted with the charters.
+        """
+        picked = 0
+        total = 0
+        for image in images:
+            total += 1
+            if self.picks(image):
+                picked += 1
+                yield image
+        self.counts["images"] = (picked, total)
+
+    def log_summary(self):
+        log.info(f"Sample of {self.fraction * 100:.1f}% with seed {self.seed}:")
+        for kind, (picked, total) in self.counts.items():
+            share = picked / total * 100 if total > 0 else 0.0
+            log.info(f"{kind:<20} {picked:>10} of {total:>10} ({share:5.1f}%)")
@@ -1,9 +1,101 @@
+import atexit
 import logging
+import os
+import threading
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from typing import Dict, List, Tuple
+
+
+def _slug(category: str) -> str:
+    return category.strip().replace(" ", "_")
+
+
+class _UncategorizedFilter(logging.Filter):
+    """
+    Drops aggregated warnings from the console and the log file while aggregation is on.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return not getattr(record, "aggregated", False)
+
+
+class _CategoryFileHandler(logging.Handler):
+    """
+    Writes aggregated warnings into one detail file per category, named after `prefix`.
+    """
+
+    def __init__(self, prefix: str):
+        super().__init__(logging.WARNING)
+        self.prefix = prefix
+        self._handlers: Dict[str, logging.FileHandler] = {}
+
+    def path(self, category: str) -> str:
+        return f"{self.prefix}.warnings.{_slug(category)}.log"
+
+    def emit(self, record: logging.LogRecord):
+        if not getattr(record, "aggregated", False):
+            return
+        category = getattr(record, "category")
+        handler = self._handlers.get(category, None)
+        if handler is None:
+            handler = logging.FileHandler(self.path(category))
+            handler.setFormatter(self.formatter)
+            self._handlers[category] = handler
+        handler.emit(record)
+
+    def close(self):
+        for handler in self._handlers.values():
+            handler.close()
+        self._handlers = {}
+        super().close()
+
+
+class WarningAggregator:
+    """
+    Counts categorized warnings per stage and in total and keeps the first `samples`
+    messages of each category of the current stage.
+    """
+
+    def __init__(self, samples: int):
+        self.samples = samples
+        self.totals: Dict[str, int] = {}
+        self._counts: Dict[str, int] = {}
+        self._samples: Dict[str, List[str]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, category: str, message: str):
+        with self._lock:
+            self._counts[category] = self._counts.get(category, 0) + 1
+            self.totals[category] = self.totals.get(category, 0) + 1
+            samples = self._samples.setdefault(category, [])
+            if len(samples) < self.samples:
+                samples.append(message)
+
+    def take(self) -> Tuple[Dict[str, int], Dict[str, List[str]]]:
+        """
+        Returns the counts and samples collected since the last call and starts over.
+        """
+        with self._lock:
+            counts, samples = self._counts, self._samples
+            self._counts = {}
+            self._samples = {}
+        return counts, samples
 
 
 class Logger:
+    """
+    Logs to the console and a file in `logs/`. Records are handed to a background
+    listener through a queue, so that formatting and writing them doesn't block the
+    import. Warnings with a category can be aggregated, see `aggregate_warnings`.
+    """
+
     _logger = logging.getLogger("MOM-Check Logger")
+    _listener: None | QueueListener = None
+    _file_handler: None | logging.FileHandler = None
+    _category_handler: None | _CategoryFileHandler = None
+    _aggregator: None | WarningAggregator = None
 
     def __init__(self):
         if not self._logger.handlers:
@@ -12,11 +104,91 @@ class Logger:
             file_handler = logging.FileHandler(
                 f"logs/log_{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}.log"
             )
+            category_handler = _CategoryFileHandler(
+                os.path.splitext(file_handler.baseFilename)[0]
+            )
             formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-            console_handler.setFormatter(formatter)
-            file_handler.setFormatter(formatter)
-            self._logger.addHandler(console_handler)
-            self._logger.addHandler(file_handler)
+            for handler in [console_handler, file_handler, category_handler]:
+                handler.setFormatter(formatter)
+            console_handler.addFilter(_UncategorizedFilter())
+            file_handler.addFilter(_UncategorizedFilter())
+            queue = SimpleQueue()
+            listener = QueueListener(
+                queue,
+                console_handler,
+                file_handler,
+                category_handler,
+                respect_handler_level=True,
+            )
+            self._logger.addHandler(QueueHandler(queue))
+            listener.start()
+            atexit.register(Logger.flush)
+            Logger._listener = listener
+            Logger._file_handler = file_handler
+            Logger._category_handler = category_handler
+
+    @staticmethod
+    def flush():
+        """
+        Waits until the listener has written all queued records and stops it. Records
+        logged afterwards are written synchronously.
+        """
+        listener = Logger._listener
+        if listener is None:
+            return
+        Logger._listener = None
+        listener.stop()
+        for handler in Logger._logger.handlers[:]:
+            if isinstance(handler, QueueHandler):
+                Logger._logger.removeHandler(handler)
+        for handler in listener.handlers:
+            Logger._logger.addHandler(handler)
+
+    def file_path(self) -> None | str:
+        if self._file_handler is None:
+            return None
+        return self._file_handler.baseFilename
+
+    def aggregate_warnings(self, samples: int = 5):
+        """
+        Stops logging warnings with a category one by one. They are counted instead,
+        written to one detail file per category next to the log file, and summarized
+        with `log_warning_summary`.
+        """
+        Logger._aggregator = WarningAggregator(samples)
+
+    def category_path(self, category: str) -> None | str:
+        if self._category_handler is None:
+            return None
+        return self._category_handler.path(category)
+
+    def log_warning_summary(self, name: str) -> Dict[str, int]:
+        """
+        Logs the number and samples of the aggregated warnings of each category since the
+        last summary, titled `name`, and returns the counts.
+        """
+        if self._aggregator is None:
+            return {}
+        counts, samples = self._aggregator.take()
+        if len(counts) == 0:
+            return counts
+        self.info(f"{sum(counts.values())} warnings in {name}:")
+        for category, count in sorted(counts.items(), key=lambda item: -item[1]):
+            self.info(f"  {category}: {count} (see {self.category_path(category)})")
+            for message in samples[category]:
+                self.info(f"    e.g. {message}")
+        return counts
+
+    def log_warning_totals(self):
+        """
+        Logs the total number of aggregated warnings of each category.
+        """
+        if self._aggregator is None or len(self._aggregator.totals) == 0:
+            return
+        totals = self._aggregator.totals
+        self.info(f"{sum(totals.values())} warnings in total:")
+        for category, count in sorted(totals.items(), key=lambda item: -item[1]):
+            self.info(f"  {category}: {count} (see {self.category_path(category)})")
 
     def debug(self, message):
         self._logger.debug(message)
@@ -24,8 +196,14 @@ class Logger:
     def info(self, message):
         self._logger.info(message)
 
-    def warn(self, message):
-        self._logger.warning(message)
+    def warn(self, message, category: None | str = None):
+        if category is not None and self._aggregator is not None:
+            self._aggregator.add(category, message)
+            self._logger.warning(
+                message, extra={"aggregated": True, "category": category}
+            )
+        else:
+            self._logger.warning(message)
 
     def error(self, message):
         self._logger.error(message)
@@ -0,0 +1,574 @@
+import asyncio
+import time
+from typing import (
+    AsyncIterable,
+    Dict,
+    Iterable,
+    List,
+    LiteralString,
+    Sequence,
+    Set,
+    Tuple,
+    TypeVar,
+)
+
+import psycopg
+from psycopg import sql
+
+from modules.constants import IndexLocation
+from modules.image_reconciliation import ImageReconciliation
+from modules.logger import Logger
+from modules.models.charter_db import (
+    _PRIVATE_CHARTER_COLUMNS,
+    _PUBLIC_CHARTER_COLUMNS,
+    _SAVED_CHARTER_COLUMNS,
+    _SERIAL_SEQUENCES_QUERY,
+    _clone_template_db,
+    _moderator_records,
+    _person_name_record,
+    _private_charter_record,
+    _public_charter_record,
+    _read_sql_file,
+    _reset_sequence_statement,
+    _saved_charter_record,
+    _schema_files,
+)
+from modules.models.person_index import PersonIndex
+from modules.models.xml_archive import XmlArchive
+from modules.models.xml_charter import XmlCharter
+from modules.models.xml_collection import XmlCollection
+from modules.models.xml_collection_charter import XmlCollectionCharter
+from modules.models.xml_fond import XmlFond
+from modules.models.xml_fond_charter import XmlFondCharter
+from modules.models.xml_mycharter import XmlMycharter
+from modules.models.xml_mycollection import XmlMycollection
+from modules.models.xml_saved_charter import XmlSavedCharter
+from modules.models.xml_user import XmlUser
+
+log = Logger()
+
+C = TypeVar("C", XmlFondCharter, XmlCollectionCharter)
+
+
+def _copy_statement(table: str, columns: List[str]) -> sql.Composed:
+    return sql.SQL("COPY {table} ({columns}) FROM STDIN").format(
+        table=sql.Identifier(table),
+        columns=sql.SQL(", ").join(map(sql.Identifier, columns)),
+    )
+
+
+def _person_name_records(charters: Sequence[XmlCharter]) -> Tuple[List, List]:
+    person_name_records = []
+    link_records = []
+    for charter in charters:
+        for person_name in charter.person_names:
+            person_name_records.append(_person_name_record(person_name))
+            link_records.append([person_name.charter_id, person_name.id])
+    return person_name_records, link_records
+
+
+class AsyncCharterDb:
+    """
+    Variant of `CharterDb` on psycopg's async connection. Charter inserts consume
+    async iterables, so that rows are written with COPY while they are still being parsed.
+    """
+
+    def __init__(self, host, password, port=5432, user="postgres", db="momcheck"):
+        self._db = db
+        self._host = host
+        self._password = password
+        self._port = port
+        self._user = user
+        self._con: psycopg.AsyncConnection | None = None
+        self._cur: psycopg.AsyncCursor | None = None
+
+    async def __aenter__(self):
+        await self._connect()
+        return self
+
+    async def __aexit__(self, __exc_type__, __exc_val__, __exc_tb__):
+        await self._close()
+
+    def _dsn(self, db: str) -> str:
+        return f"dbname='{db}' user='{self._user}' host='{self._host}' password='{self._password}' port='{self._port}'"
+
+    async def _connect(self):
+        if not self._con:
+            await self._create_db()
+            self._con = await psycopg.AsyncConnection.connect(self._dsn(self._db))
+            self._cur = self._con.cursor()
+
+    async def _close(self):
+        if self._con:
+            await self._con.close()
+            self._con = None
+            self._cur = None
+
+    async def _create_db(self):
+        async with await psycopg.AsyncConnection.connect(
+            self._dsn("postgres"), autocommit=True
+        ) as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    "SELECT 1 FROM pg_database WHERE datname = %s;", [self._db]
+                )
+                db_exists = await cur.fetchone()
+                if not db_exists:
+                    log.debug(f"Database {self._db} does not exist. Creating...")
+                    await cur.execute(
+                        sql.SQL("CREATE DATABASE {};").format(sql.Identifier(self._db))
+                    )
+
+    async def _copy(self, statement: LiteralString | sql.Composed, records: Iterable):
+        if not self._cur:
+            return
+        async with self._cur.copy(statement) as copy:
+            for record in records:
+                await copy.write_row(record)
+
+    async def _insert_charter_images(
+        self, charters: Sequence[XmlCharter], link_statement: LiteralString
+    ):
+        if not self._cur:
+            return
+        await self._cur.executemany(
+            "INSERT INTO images (url, is_external) VALUES (%s, %s) ON CONFLICT (url) DO NOTHING",
+            [
+                [image, "images.monasterium.net" not in image]
+                for charter in charters
+                for image in charter.images
+            ],
+        )
+        unique_urls = list(
+            set([image for charter in charters for image in charter.images])
+        )
+        await self._cur.execute(
+            "SELECT url, id FROM images WHERE url = ANY(%s)", (unique_urls,)
+        )
+        url_to_id_map = {url: id for url, id in await self._cur.fetchall()}
+        await self._cur.executemany(
+            link_statement,
+            [
+                (charter.id, url_to_id_map[image])
+                for charter in charters
+                for image in charter.images
+                if image in url_to_id_map
+            ],
+        )
+
+    async def _insert_public_charter_stream(
+        self, charters: AsyncIterable[C]
+    ) -> List[C]:
+        """
+        Streams the `charters` into the charters table as they arrive and returns them.
+        """
+        collected: List[C] = []
+        if not self._cur:
+            return collected
+        start = time.perf_counter()
+        async with self._cur.copy(
+            _copy_statement("charters", _PUBLIC_CHARTER_COLUMNS)
+        ) as copy:
+            async for charter in charters:
+                await copy.write_row(_public_charter_record(charter))
+                collected.append(charter)
+        log.debug(
+            f"Streamed {len(collected)} charters in {time.perf_counter() - start:.2f}s"
+        )
+        return collected
+
+    async def setup_db(self, force: bool = False):
+        """
+        Recreates the database from the versioned template database, as `CharterDb.setup_db` does.
+        """
+        await self._close()
+        await asyncio.to_thread(
+            _clone_template_db, self._dsn, self._db, _schema_files(), force
+        )
+        await self._connect()
+
+    async def reset_serial_id_sequences(self):
+        if not self._con or not self._cur:
+            return
+        await self._cur.execute(_SERIAL_SEQUENCES_QUERY)
+        for sequence_name, table_name, column_name in await self._cur.fetchall():
+            await self._cur.execute(
+                _reset_sequence_statement(sequence_name, table_name, column_name)
+            )
+        await self._con.commit()
+
+    async def enable_triggers(self, statement_level: bool = False):
+        if not self._con or not self._cur:
+            return
+        if statement_level:
+            await self._cur.execute(_read_sql_file("sql/statement_triggers.sql"))
+        else:
+            await self._cur.execute(_read_sql_file("sql/triggers.sql"))
+        await self._con.commit()
+
+    async def create_diagnostic_views(self):
+        if not self._con or not self._cur:
+            return
+        await self._cur.execute(_read_sql_file("sql/views.sql"))
+        await self._con.commit()
+
+    async def insert_index_locations(self):
+        if not self._con or not self._cur:
+            return
+        await self._copy(
+            "COPY index_locations (id, location) FROM STDIN",
+            [(location.value, location.name) for location in IndexLocation],
+        )
+        await self._con.commit()
+
+    async def insert_users(self, users: List[XmlUser]):
+        if not self._con or not self._cur:
+            return
+        await self._copy(
+            "COPY users (id, email, first_name, name) FROM STDIN",
+            [[user.id, user.email, user.first_name, user.name] for user in users],
+        )
+        await self._cur.executemany(
+            "UPDATE users SET moderator_id = %s WHERE id = %s",
+            _moderator_records(users),
+        )
+        await self._con.commit()
+
+    async def insert_images(self, images: AsyncIterable[str]) -> int:
+        """
+        Streams the `images` into a staging table with COPY as they arrive, and then
+        inserts them without duplicates in the order they arrived. Returns the number of
+        inserted images.
+        """
+        if not self._con or not self._cur:
+            return 0
+        await self._cur.execute("""
+            CREATE TEMP TABLE images_staging (
+                ordinal BIGINT GENERATED ALWAYS AS IDENTITY,
+                url TEXT NOT NULL,
+                is_external BOOLEAN NOT NULL
+            ) ON COMMIT DROP
+            """)
+        async with self._cur.copy(
+            "COPY images_staging (url, is_external) FROM STDIN"
+        ) as copy:
+            async for image in images:
+                await copy.write_row((image, "images.monasterium.net" not in image))
+        await self._cur.execute("""
+            INSERT INTO images (url, is_external)
+            SELECT url, is_external FROM (
+                SELECT DISTINCT ON (url) url, is_external, ordinal
+                FROM images_staging
+                ORDER BY url, ordinal
+            ) AS unique_images
+            ORDER BY ordinal
+            ON CONFLICT (url) DO NOTHING
+            """)
+        count = self._cur.rowcount
+        await self._con.commit()
+        return count
+
+    async def insert_archives(self, archives: List[XmlArchive]):
+        if not self._con or not self._cur:
+            return
+        await self._copy(
+            "COPY archives (id, atom_id, country_code, name, oai_shared, repository_id) FROM STDIN",
+            [
+                [
+                    archive.id,
+                    archive.atom_id,
+                    archive.countrycode,
+                    archive.name,
+                    archive.oai is not None,
+                    archive.repository_id,
+                ]
+                for archive in archives
+            ],
+        )
+        await self._con.commit()
+
+    async def insert_fonds(self, fonds: List[XmlFond]):
+        if not self._con or not self._cur:
+            return
+        await self._copy(
+            "COPY fonds (id, archive_id, atom_id, free_image_access, identifier, image_base, oai_shared, title) FROM STDIN",
+            [
+                [
+                    fond.id,
+                    fond.archive_id,
+                    fond.atom_id,
+                    fond.free_image_access,
+                    fond.identifier,
+                    fond.image_base,
+                    fond.oai_shared,
+                    fond.title,
+                ]
+                for fond in fonds
+            ],
+        )
+        await self._con.commit()
+
+    async def insert_fonds_charters(
+        self, charters: AsyncIterable[XmlFondCharter]
+    ) -> List[XmlFondCharter]:
+        if not self._con or not self._cur:
+            return []
+        collected = await self._insert_public_charter_stream(charters)
+        await self._copy(
+            "COPY fonds_charters (fond_id, charter_id) FROM STDIN",
+            [[charter.fond_id, charter.id] for charter in collected],
+        )
+        await self._insert_charter_images(
+            collected,
+            "INSERT INTO charters_images (charter_id, image_id) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+        )
+        await self._con.commit()
+        return collected
+
+    async def insert_collections(self, collections: List[XmlCollection]):
+        if not self._con or not self._cur:
+            return
+        await self._copy(
+            "COPY collections (id, atom_id, identifier, image_base, oai_shared, title) FROM STDIN",
+            [
+                [
+                    collection.id,
+                    collection.atom_id,
+                    collection.identifier,
+                    collection.image_base,
+                    collection.oai_shared,
+                    collection.title,
+                ]
+                for collection in collections
+            ],
+        )
+        await self._copy(
+            "COPY collection_fonds (collection_id, fond_id) FROM STDIN",
+            [
+                (collection.id, fond_id)
+                for collection in collections
+                for fond_id in collection.linked_fonds
+            ],
+        )
+        await self._con.commit()
+
+    async def insert_collections_charters(
+        self, charters: AsyncIterable[XmlCollectionCharter]
+    ) -> List[XmlCollectionCharter]:
+        if not self._con or not self._cur:
+            return []
+        collected = await self._insert_public_charter_stream(charters)
+        await self._copy(
+            "COPY collections_charters (collection_id, charter_id) FROM STDIN",
+            [[charter.collection_id, charter.id] for charter in collected],
+        )
+        await self._insert_charter_images(
+            collected,
+            "INSERT INTO charters_images (charter_id, image_id) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+        )
+        await self._con.commit()
+        return collected
+
+    async def insert_user_charter_bookmarks(self, users: List[XmlUser]):
+        if not self._con or not self._cur:
+            return
+        unique_atom_ids: List[str] = list(
+            set([bookmark.atom_id for user in users for bookmark in user.bookmarks])
+        )
+        await self._cur.execute(
+            "SELECT atom_id, id FROM charters WHERE atom_id = ANY(%s)",
+            (unique_atom_ids,),
+        )
+        atom_id_to_charter_id_map: Dict[str, int] = {
+            atom_id: charter_id for atom_id, charter_id in await self._cur.fetchall()
+        }
+        await self._cur.executemany(
+            "INSERT INTO user_charter_bookmarks (user_id, charter_id, note) VALUES (%s, %s, %s) ON CONFLICT DO NOTHING",
+            [
+                (user.id, atom_id_to_charter_id_map[bookmark.atom_id], bookmark.note)
+                for user in users
+                for bookmark in user.bookmarks
+                if bookmark.atom_id in atom_id_to_charter_id_map
+            ],
+        )
+        await self._con.commit()
+
+    async def insert_saved_charters(self, charters: List[XmlSavedCharter]):
+        if not self._con or not self._cur:
+            return
+        await self._cur.execute(
+            "SELECT id, atom_id FROM charters WHERE atom_id = ANY(%s)",
+            ([charter.atom_id for charter in charters],),
+        )
+        atom_id_to_charter_id_map = {
+            atom_id: id for id, atom_id in await self._cur.fetchall()
+        }
+        valid_charters = []
+        charter_records = []
+        for charter in charters:
+            if charter.url is None:
+                log.warn(
+                    f"URL not found for saved charter {charter.atom_id}",
+                    "saved charter url",
+                )
+                continue
+            original_id = atom_id_to_charter_id_map.get(charter.atom_id, None)
+            if original_id is None:
+                log.warn(
+                    f"Original charter not found for saved charter {charter.atom_id}",
+                    "saved charter original",
+                )
+                continue
+            charter_records.append(_saved_charter_record(charter, original_id))
+            valid_charters.append(charter)
+        await self._copy(
+            _copy_statement("saved_charters", _SAVED_CHARTER_COLUMNS),
+            charter_records,
+        )
+        await self._insert_charter_images(
+            valid_charters,
+            "INSERT INTO saved_charters_images (saved_charter_id, image_id) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+        )
+        await self._con.commit()
+
+    async def insert_private_collections(self, mycollections: List[XmlMycollection]):
+        if not self._con or not self._cur:
+            return
+        await self._copy(
+            "COPY private_collections (id, atom_id, identifier, title, owner_id) FROM STDIN",
+            [
+                [
+                    mycollection.id,
+                    mycollection.atom_id,
+                    mycollection.identifier,
+                    mycollection.title,
+                    mycollection.owner_id,
+                ]
+                for mycollection in mycollections
+            ],
+        )
+        await self._con.commit()
+
+    async def insert_public_mycollections(self, mycollections: List[XmlMycollection]):
+        if not self._con or not self._cur:
+            return
+        await self._copy(
+            "COPY collections (id, atom_id, identifier, oai_shared, source_collection_id, title) FROM STDIN",
+            [
+                [
+                    mycollection.id,
+                    mycollection.atom_id,
+                    mycollection.identifier,
+                    mycollection.oai_shared,
+                    mycollection.private_mycollection_id,
+                    mycollection.title,
+                ]
+                for mycollection in mycollections
+            ],
+        )
+        await self._con.commit()
+
+    async def insert_private_mycharters(self, charters: List[XmlMycharter]):
+        if not self._con or not self._cur:
+            return
+        await self._copy(
+            _copy_statement("private_charters", _PRIVATE_CHARTER_COLUMNS),
+            [_private_charter_record(charter) for charter in charters],
+        )
+        await self._copy(
+            "COPY private_charter_user_shares (private_charter_id, user_id) FROM STDIN",
+            [
+                (charter.id, user_id)
+                for charter in charters
+                for user_id in charter.shared_with_user_ids
+            ],
+        )
+        await self._insert_charter_images(
+            charters,
+            "INSERT INTO private_charters_images (private_charter_id, image_id) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+        )
+        await self._con.commit()
+
+    async def insert_public_mycharters(
+        self, charters: AsyncIterable[XmlCollectionCharter]
+    ) -> List[XmlCollectionCharter]:
+        if not self._con or not self._cur:
+            return []
+        collected = await self._insert_public_charter_stream(charters)
+        await self._copy(
+            "COPY collections_charters (collection_id, charter_id, private_charter_id) FROM STDIN",
+            [
+                [charter.collection_id, charter.id, charter.source_mycharter_id]
+                for charter in collected
+            ],
+        )
+        await self._insert_charter_images(
+            collected,
+            "INSERT INTO charters_images (charter_id, image_id) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+        )
+        await self._con.commit()
+        return collected
+
+    async def insert_persons(
+        self,
+        person_index: PersonIndex,
+        public_charters: Sequence[XmlFondCharter | XmlCollectionCharter],
+        private_charters: List[XmlMycharter],
+        saved_charters: List[XmlSavedCharter],
+    ):
+        if not self._con or not self._cur:
+            return
+        await self._copy(
+            "COPY persons (id, label, mom_iri, wikidata_iri) FROM STDIN",
+            [
+                [
+                    person.id,
+                    ";".join(person.names),
+                    person.mom_iri,
+                    person.wikidata_iri,
+                ]
+                for person in person_index.list_persons()
+            ],
+        )
+        await self._cur.execute("SELECT id FROM saved_charters")
+        id_set: Set[int] = {id[0] for id in await self._cur.fetchall()}
+        public_names, public_links = _person_name_records(public_charters)
+        private_names, private_links = _person_name_records(private_charters)
+        # Skip person names of saved charters that could not be saved in the database
+        saved_names, saved_links = _person_name_records(
+            [charter for charter in saved_charters if charter.id in id_set]
+        )
+        await self._copy(
+            "COPY person_names (id, person_id, text, reg, key, location_id) FROM STDIN",
+            public_names + private_names + saved_names,
+        )
+        await self._copy(
+            "COPY charters_person_names (charter_id, person_name_id) FROM STDIN",
+            public_links,
+        )
+        await self._copy(
+            "COPY private_charters_person_names (private_charter_id, person_name_id) FROM STDIN",
+            private_links,
+        )
+        await self._copy(
+            "COPY saved_charters_person_names (saved_charter_id, person_name_id) FROM STDIN",
+            saved_links,
+        )
+        await self._con.commit()
+
+    async def insert_image_reconciliation(self, reconciliation: ImageReconciliation):
+        if not self._con or not self._cur:
+            return
+        await self._copy(
+            "COPY image_reconciliation (key, url, status, charter_count) FROM STDIN",
+            reconciliation.images,
+        )
+        await self._copy(
+            "COPY fonds_image_reconciliation (fond_id, used_count, unused_count, dangling_count) FROM STDIN",
+            reconciliation.fonds,
+        )
+        await self._copy(
+            "COPY collections_image_reconciliation (collection_id, used_count, unused_count, dangling_count) FROM STDIN",
+            reconciliation.collections,
+        )
+        await self._con.commit()
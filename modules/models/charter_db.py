@@ -1,14 +1,31 @@
+import hashlib
 import io
+import itertools
+import re
+import time
 from datetime import date
-from typing import Dict, List, LiteralString, Set, Tuple, cast
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    LiteralString,
+    Sequence,
+    Set,
+    Tuple,
+    cast,
+)
 
 import psycopg
 from lxml import etree
 from psycopg import sql
 from psycopg.types.range import Range
 
-from modules.constants import IndexLocation
+from modules.constants import DiagnosticView, IndexLocation
+from modules.image_reconciliation import ImageReconciliation
 from modules.logger import Logger
+from modules.models.charter_edit import CharterEdit
+from modules.models.charter_store import CharterStore
 from modules.models.person_index import PersonIndex
 from modules.models.xml_archive import XmlArchive
 from modules.models.xml_collection import XmlCollection
@@ -17,11 +34,45 @@ from modules.models.xml_fond import XmlFond
 from modules.models.xml_fond_charter import XmlFondCharter
 from modules.models.xml_mycharter import XmlMycharter
 from modules.models.xml_mycollection import XmlMycollection
+from modules.models.xml_person_name import XmlPersonName
 from modules.models.xml_saved_charter import XmlSavedCharter
 from modules.models.xml_user import XmlUser
+from modules.progress import Progress
+from modules.utils import iterate_in_thread
 
 log = Logger()
 
+_SCHEMA_FILES = ["sql/tables.sql", "sql/functions.sql", "sql/alterations.sql"]
+_DEDUPLICATION_FILE = "sql/deduplication.sql"
+_SNAPSHOTS_FILE = "sql/snapshots.sql"
+
+# Processing instructions with the ids of the person names and persons of a charter
+_PROC_INST_REGEX = re.compile(r"<\?(person_names|persons) [0-9]+\?>")
+
+# The sources of the snapshots, each read from the view snapshot_<source>
+_SNAPSHOT_SOURCES = [
+    "users",
+    "persons",
+    "archives",
+    "fonds",
+    "private_collections",
+    "collections",
+    "images",
+    "image_reconciliation",
+    "charters",
+    "user_charter_bookmarks",
+    "saved_charters",
+    "private_charters",
+]
+
+
+def _hash_sql_files(paths: List[str]) -> str:
+    hash = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as file:
+            hash.update(file.read())
+    return hash.hexdigest()[:16]
+
 
 def _read_sql_file(path: str) -> LiteralString:
     with open(path, "r") as file:
@@ -36,9 +87,11 @@ def _dates_to_range(date_range: None | Tuple[date, date]) -> None | Range:
     return Range(lower=lower, upper=upper, bounds=bounds)
 
 
-def _serialize_xml(element: None | etree._Element) -> None | str:
+def _serialize_xml(element: None | str | etree._Element) -> None | str:
     if element is None:
         return None
+    if isinstance(element, str):
+        return element
     string = etree.tostring(element, encoding="unicode", pretty_print=True).strip()
     if string[0] != "<" or string[-1] != ">":
         try:
@@ -53,13 +106,291 @@ def _serialize_xml(element: None | etree._Element) -> None | str:
     return string
 
 
-class CharterDb:
-    def __init__(self, host, password, port=5432, user="postgres", db="momcheck"):
+def _split_proc_insts(xml: None | str) -> Tuple[None | str, None | List[str]]:
+    """
+    Returns the `xml` with empty person name and person processing instructions,
+    which are the same for every charter, and the original instructions in order.
+    """
+    if xml is None:
+        return None, None
+    proc_insts: List[str] = []
+
+    def empty_proc_inst(match: re.Match) -> str:
+        proc_insts.append(match.group(0))
+        return f"<?{match.group(1)}?>"
+
+    xml = _PROC_INST_REGEX.sub(empty_proc_inst, xml)
+    return xml, proc_insts if len(proc_insts) > 0 else None
+
+
+def _schema_files(deduplicate_xml: bool = False, snapshots: bool = False) -> List[str]:
+    return (
+        _SCHEMA_FILES
+        + ([_DEDUPLICATION_FILE] if deduplicate_xml else [])
+        + ([_SNAPSHOTS_FILE] if snapshots else [])
+    )
+
+
+def _clone_template_db(
+    dsn: Callable[[str], str], db: str, schema_files: List[str], force: bool = False
+):
+    """
+    Recreates the database `db` from a template database that already contains the
+    schema of the `schema_files`. The template is versioned by the hash of the schema
+    files and only rebuilt if they change. Templates of other lists of schema files
+    are kept, so that imports with different storage modes don't rebuild each other's
+    templates. Imports that set up at the same time build a template only once.
+    With `force`, sessions connected to `db` are terminated, otherwise the setup fails
+    while any are connected.
+    """
+    variant = hashlib.sha256("\n".join(schema_files).encode()).hexdigest()[:8]
+    template_prefix = f"{db}_template_{variant}_"
+    template_db = f"{template_prefix}{_hash_sql_files(schema_files)}"
+    with psycopg.connect(dsn("postgres"), autocommit=True) as conn:
+        with conn.cursor() as cur:
+            # Held until the connection closes, so that concurrent setups of the same
+            # templates wait for each other
+            cur.execute("SELECT pg_advisory_lock(hashtext(%s));", [template_prefix])
+            cur.execute(
+                "SELECT datname FROM pg_database WHERE starts_with(datname, %s);",
+                [template_prefix],
+            )
+            templates = [row[0] for row in cur.fetchall()]
+            for template in templates:
+                if template != template_db:
+                    cur.execute(
+                        sql.SQL("DROP DATABASE IF EXISTS {};").format(
+                            sql.Identifier(template)
+                        )
+                    )
+                    log.debug(f"Outdated template database {template} dropped")
+            if template_db not in templates:
+                log.debug(f"Creating template database {template_db}...")
+                # Build under a temporary name so that a failed build is never reused
+                building_db = f"{template_db}_building"
+                cur.execute(
+                    sql.SQL("DROP DATABASE IF EXISTS {};").format(
+                        sql.Identifier(building_db)
+                    )
+                )
+                cur.execute(
+                    sql.SQL("CREATE DATABASE {};").format(sql.Identifier(building_db))
+                )
+                with psycopg.connect(dsn(building_db)) as template_con:
+                    with template_con.cursor() as template_cur:
+                        for path in schema_files:
+                            template_cur.execute(_read_sql_file(path))
+                    template_con.commit()
+                try:
+                    cur.execute(
+                        sql.SQL("ALTER DATABASE {} RENAME TO {};").format(
+                            sql.Identifier(building_db), sql.Identifier(template_db)
+                        )
+                    )
+                except psycopg.errors.DuplicateDatabase:
+                    # Built by a setup that doesn't take the lock, use that one
+                    cur.execute(
+                        sql.SQL("DROP DATABASE IF EXISTS {};").format(
+                            sql.Identifier(building_db)
+                        )
+                    )
+                    log.debug(f"Template database {template_db} built concurrently")
+            try:
+                cur.execute(
+                    sql.SQL(
+                        "DROP DATABASE IF EXISTS {} WITH (FORCE);"
+                        if force
+                        else "DROP DATABASE IF EXISTS {};"
+                    ).format(sql.Identifier(db))
+                )
+            except psycopg.errors.ObjectInUse:
+                raise Exception(
+                    f"Database {db} can't be recreated while other sessions are connected to it, close them or set up with force"
+                )
+            cur.execute(
+                sql.SQL("CREATE DATABASE {} TEMPLATE {};").format(
+                    sql.Identifier(db), sql.Identifier(template_db)
+                )
+            )
+            log.debug(f"Database {db} cloned from {template_db}")
+
+
+# Lists the serial id sequences with the columns they belong to
+_SERIAL_SEQUENCES_QUERY = """
+    SELECT sequence_name, table_name, column_name
+    FROM information_schema.sequences
+    JOIN information_schema.columns
+        ON CONCAT(columns.table_name, '_', columns.column_name, '_seq') = sequences.sequence_name
+    WHERE sequence_schema = 'public';
+"""
+
+
+def _reset_sequence_statement(
+    sequence_name: str, table_name: str, column_name: str
+) -> sql.Composed:
+    """
+    Returns the statement that continues the sequence after the largest id of its column.
+    """
+    return sql.SQL(
+        "SELECT setval('{sequence}', COALESCE((SELECT MAX({column}) FROM {table}) + 1, 1), false);"
+    ).format(
+        sequence=sql.Identifier(sequence_name),
+        column=sql.Identifier(column_name),
+        table=sql.Identifier(table_name),
+    )
+
+
+# Columns of the records of the charter record builders below
+_PUBLIC_CHARTER_COLUMNS = [
+    "id",
+    "abstract",
+    "atom_id",
+    "idno_id",
+    "idno_text",
+    "url",
+    "last_editor_id",
+    "issued_date",
+    "issued_date_text",
+    "sort_date",
+    "tenor",
+]
+_SAVED_CHARTER_COLUMNS = [
+    "id",
+    "abstract",
+    "atom_id",
+    "editor_id",
+    "idno_id",
+    "idno_text",
+    "is_released",
+    "original_charter_id",
+    "start_time",
+    "tenor",
+    "url",
+    "issued_date",
+    "issued_date_text",
+    "sort_date",
+]
+_PRIVATE_CHARTER_COLUMNS = [
+    "id",
+    "abstract",
+    "atom_id",
+    "private_collection_id",
+    "idno_id",
+    "idno_text",
+    "source_charter_id",
+    "issued_date",
+    "issued_date_text",
+    "sort_date",
+    "tenor",
+]
+
+
+def _public_charter_record(charter: XmlFondCharter | XmlCollectionCharter) -> List:
+    return [
+        charter.id,
+        _serialize_xml(charter.abstract),
+        charter.atom_id,
+        charter.idno_id,
+        charter.idno_text,
+        charter.url,
+        charter.last_editor_id,
+        _dates_to_range(charter.issued_date),
+        charter.issued_date_text,
+        charter.sort_date,
+        _serialize_xml(charter.tenor),
+    ]
+
+
+def _saved_charter_record(charter: XmlSavedCharter, original_id: int) -> List:
+    return [
+        charter.id,
+        _serialize_xml(charter.abstract),
+        charter.atom_id,
+        charter.editor_id,
+        charter.idno_id,
+        charter.idno_text,
+        charter.released,
+        original_id,
+        charter.start_time,
+        _serialize_xml(charter.tenor),
+        charter.url,
+        _dates_to_range(charter.issued_date),
+        charter.issued_date_text,
+        charter.sort_date,
+    ]
+
+
+def _private_charter_record(charter: XmlMycharter) -> List:
+    return [
+        charter.id,
+        _serialize_xml(charter.abstract),
+        charter.atom_id,
+        charter.collection_id,
+        charter.idno_id,
+        charter.idno_text,
+        charter.source_charter_id,
+        _dates_to_range(charter.issued_date),
+        charter.issued_date_text,
+        charter.sort_date,
+        _serialize_xml(charter.tenor),
+    ]
+
+
+def _person_name_record(person_name: XmlPersonName) -> List:
+    return [
+        person_name.id,
+        person_name.person_id,
+        person_name.text,
+        person_name.reg,
+        person_name.key,
+        person_name.location.value,
+    ]
+
+
+def _moderator_records(users: List[XmlUser]) -> List[Tuple[int, int]]:
+    """
+    Returns the moderator ids and user ids of the `users` with a known moderator other
+    than themselves.
+    """
+    email_id_map = {user.email.lower(): user.id for user in users}
+    moderated_records = []
+    for user in users:
+        moderator_email = user.moderater_email
+        if moderator_email is None:
+            continue
+        moderator_id = email_id_map.get(moderator_email.lower())
+        if moderator_id is None or moderator_id == user.id:
+            continue
+        moderated_records.append((moderator_id, user.id))
+    return moderated_records
+
+
+class CharterDb(CharterStore):
+    def __init__(
+        self,
+        host,
+        password,
+        port=5432,
+        user="postgres",
+        db="momcheck",
+        atomic_stages=False,
+        deduplicate_xml=False,
+        snapshots=False,
+    ):
         self._db = db
         self._host = host
         self._password = password
         self._port = port
         self._user = user
+        # Commit the inserts of a stage together with its completion
+        self._atomic_stages = atomic_stages
+        # Store every distinct abstract and tenor once in xml_contents
+        self._deduplicate_xml = deduplicate_xml
+        # Keep the history of the imports in the schema snapshots
+        self._snapshots = snapshots
+        self._schema_files = _schema_files(deduplicate_xml, snapshots)
+        # Ids of the stored XML contents by their hash, loaded on first use
+        self._xml_content_ids: None | Dict[str, int] = None
         self._con: psycopg.connection.Connection | None = None
         self._cur: psycopg.cursor.Cursor | None = None
 
@@ -70,11 +401,13 @@ class CharterDb:
     def __exit__(self, __exc_type__, __exc_val__, __exc_tb__):
         self._close()
 
+    def _dsn(self, db: str) -> str:
+        return f"dbname='{db}' user='{self._user}' host='{self._host}' password='{self._password}' port='{self._port}'"
+
     def _connect(self):
         if not self._con:
             self._create_db()
-            dsn = f"dbname='{self._db}' user='{self._user}' host='{self._host}' password='{self._password}' port='{self._port}'"
-            self._con = psycopg.connect(dsn)
+            self._con = psycopg.connect(self._dsn(self._db))
             self._cur = self._con.cursor()
 
     def _close(self):
@@ -83,9 +416,13 @@ class CharterDb:
             self._con = None
             self._cur = None
 
+    def _commit(self):
+        if not self._con or self._atomic_stages:
+            return
+        self._con.commit()
+
     def _create_db(self):
-        dsn = f"dbname='postgres' user='{self._user}' host='{self._host}' password='{self._password}' port='{self._port}'"
-        with psycopg.connect(dsn, autocommit=True) as conn:
+        with psycopg.connect(self._dsn("postgres"), autocommit=True) as conn:
             with conn.cursor() as cur:
                 cur.execute("SELECT 1 FROM pg_database WHERE datname = %s;", [self._db])
                 db_exists = cur.fetchone()
@@ -95,81 +432,268 @@ class CharterDb:
                         sql.SQL("CREATE DATABASE {};").format(sql.Identifier(self._db))
                     )
 
-    def _list_tables(self) -> List[str]:
+    def _reset_db(self):
         if not self._con or not self._cur:
-            return []
-        self._cur.execute(
-            "SELECT table_name FROM information_schema.tables WHERE table_schema = 'public'"
-        )
-        return [table[0] for table in self._cur.fetchall()]
+            return
+        # Drop all tables, views and functions at once
+        self._cur.execute("DROP SCHEMA IF EXISTS public CASCADE")
+        self._cur.execute("CREATE SCHEMA public")
+        log.debug("Schema public recreated")
+        self._con.commit()
 
-    def _reset_db(self):
+    def _clone_template_db(self, force: bool):
+        self._close()
+        _clone_template_db(self._dsn, self._db, self._schema_files, force)
+        self._connect()
+
+    def reset_serial_id_sequences(self):
         if not self._con or not self._cur:
             return
-        # Drop tables
-        tables: List[str] = self._list_tables()
-        for table in tables:
+        self._cur.execute(_SERIAL_SEQUENCES_QUERY)
+        for sequence_name, table_name, column_name in self._cur.fetchall():
             self._cur.execute(
-                sql.SQL("DROP TABLE IF EXISTS {} CASCADE").format(sql.Identifier(table))
+                _reset_sequence_statement(sequence_name, table_name, column_name)
             )
-            log.debug(f"Table {table} dropped")
-        # Drop all functions
-        self._cur.execute(
-            """
-            SELECT 'DROP FUNCTION IF EXISTS ' || ns.nspname || '.' || proname || '(' || oidvectortypes(proargtypes) || ');'
-            FROM pg_proc INNER JOIN pg_namespace ns ON (pg_proc.pronamespace = ns.oid)
-            WHERE ns.nspname NOT IN ('pg_catalog', 'information_schema')
+        self._commit()
+
+    def _setup_db_structures(self):
+        if not self._con or not self._cur:
+            return
+        for path in self._schema_files:
+            self._cur.execute(_read_sql_file(path))
+        self._commit()
+
+    def setup_db(self, use_template: bool = True, force: bool = False):
         """
-        )
-        functions = self._cur.fetchall()
-        for func in functions:
-            self._cur.execute(func[0])
-            log.debug(f"Function dropped: {func[0]}")
-        self._con.commit()
+        Sets up an empty database with the current schema. By default, the database is
+        cloned from a template database, otherwise the schema is dropped and recreated.
+        With snapshots, only the schema is recreated to keep the earlier snapshots.
+        Cloning fails while other sessions are connected to the database, unless
+        `force` terminates them.
+        """
+        self._xml_content_ids = None
+        if use_template and not self._snapshots:
+            self._clone_template_db(force)
+        else:
+            self._reset_db()
+            self._setup_db_structures()
 
-    def reset_serial_id_sequences(self):
+    def _xml_content_id(self, xml: None | str, contents: List[Tuple]) -> None | int:
+        """
+        Returns the id of the content with the `xml`. Contents that aren't stored yet
+        get a new id and are added to `contents`.
+        """
+        if xml is None or not self._cur:
+            return None
+        if self._xml_content_ids is None:
+            self._cur.execute("SELECT hash, id FROM xml_contents")
+            self._xml_content_ids = {hash: id for hash, id in self._cur.fetchall()}
+        hash = hashlib.blake2b(xml.encode(), digest_size=16).hexdigest()
+        id = self._xml_content_ids.get(hash, None)
+        if id is None:
+            id = len(self._xml_content_ids) + 1
+            self._xml_content_ids[hash] = id
+            contents.append((id, hash, xml))
+        return id
+
+    def _copy_charters(self, table: str, columns: List[str], records: List[List]):
+        """
+        Copies the charter `records` with the `columns` into `table`. If the XML is
+        deduplicated, the abstracts and tenors are replaced by the ids of their
+        contents, and new contents are copied into `xml_contents` first. The person
+        name and person ids of a charter are kept out of the shared contents and
+        stored with the charter in `abstract_proc_insts` and `tenor_proc_insts`.
+        """
         if not self._con or not self._cur:
             return
-        query = """
-            SELECT sequence_name, table_name, column_name 
-            FROM information_schema.sequences 
-            JOIN information_schema.columns 
-                ON CONCAT(columns.table_name, '_', columns.column_name, '_seq') = sequences.sequence_name
-            WHERE sequence_schema = 'public';
+        if self._deduplicate_xml:
+            xml_indexes = [columns.index("abstract"), columns.index("tenor")]
+            contents: List[Tuple] = []
+            for record in records:
+                for index in xml_indexes:
+                    xml, proc_insts = _split_proc_insts(record[index])
+                    record[index] = self._xml_content_id(xml, contents)
+                    record.append(proc_insts)
+            with self._cur.copy("COPY xml_contents (id, hash, xml) FROM STDIN") as copy:
+                for content in contents:
+                    copy.write_row(content)
+            log.debug(
+                f"{len(contents)} new of {len(records) * 2} abstracts and tenors of {table}"
+            )
+            table = f"{table}_deduplicated"
+            columns = [
+                f"{column}_id" if column in ["abstract", "tenor"] else column
+                for column in columns
+            ] + ["abstract_proc_insts", "tenor_proc_insts"]
+        with self._cur.copy(
+            sql.SQL("COPY {table} ({columns}) FROM STDIN").format(
+                table=sql.Identifier(table),
+                columns=sql.SQL(", ").join(map(sql.Identifier, columns)),
+            )
+        ) as copy:
+            for record in records:
+                copy.write_row(record)
+
+    def enable_triggers(self, statement_level: bool = False):
         """
-        self._cur.execute(query)
-        sequences = self._cur.fetchall()
-        for sequence_name, table_name, column_name in sequences:
-            self._cur.execute(
-                sql.SQL(
-                    "SELECT setval('{sequence}', COALESCE((SELECT MAX({column}) FROM {table}) + 1, 1), false);"
-                ).format(
-                    sequence=sql.Identifier(sequence_name),
-                    column=sql.Identifier(column_name),
-                    table=sql.Identifier(table_name),
-                ),
+        Enables the charter triggers. With `statement_level`, person names are
+        processed once per statement for all affected charters instead of once per row.
+        """
+        if not self._con or not self._cur:
+            return
+        if self._deduplicate_xml:
+            log.warn(
+                "Charter triggers are not supported with deduplicated XML, the database has no charter triggers"
             )
+            return
+        if statement_level:
+            self._cur.execute(_read_sql_file("sql/statement_triggers.sql"))
+        else:
+            self._cur.execute(_read_sql_file("sql/triggers.sql"))
+        self._commit()
+
+    def create_diagnostic_views(self):
+        if not self._con or not self._cur:
+            return
+        self._cur.execute(_read_sql_file("sql/views.sql"))
+        self._commit()
+
+    def list_completed_stages(self, fingerprint: str) -> List[str]:
+        if not self._con or not self._cur:
+            return []
+        self._cur.execute("SELECT to_regclass('import_stages')")
+        row = self._cur.fetchone()
+        if row is None or row[0] is None:
+            return []
+        self._cur.execute(
+            "SELECT stage FROM import_stages WHERE fingerprint = %s ORDER BY completed_at",
+            (fingerprint,),
+        )
+        return [stage for stage, in self._cur.fetchall()]
 
+    def complete_stage(self, stage: str, fingerprint: str):
+        """
+        Records the completion of `stage` and commits it, together with everything the
+        stage inserted if the stages are atomic.
+        """
+        if not self._con or not self._cur:
+            return
+        self._cur.execute(
+            """
+            INSERT INTO import_stages (stage, fingerprint) VALUES (%s, %s)
+            ON CONFLICT (stage) DO UPDATE
+            SET fingerprint = EXCLUDED.fingerprint, completed_at = now()
+            """,
+            (stage, fingerprint),
+        )
         self._con.commit()
 
-    def _setup_db_structures(self):
+    def refresh_diagnostic_views(self, concurrently: bool = True):
+        """
+        Refreshes all diagnostic views. With `concurrently`, the views stay readable
+        while they are being refreshed.
+        """
         if not self._con or not self._cur:
             return
-        self._cur.execute(_read_sql_file("sql/tables.sql"))
-        self._cur.execute(_read_sql_file("sql/functions.sql"))
-        self._cur.execute(_read_sql_file("sql/alterations.sql"))
+        for view in DiagnosticView:
+            query = (
+                "REFRESH MATERIALIZED VIEW CONCURRENTLY {}"
+                if concurrently
+                else "REFRESH MATERIALIZED VIEW {}"
+            )
+            self._cur.execute(sql.SQL(query).format(sql.Identifier(view.value)))
+            log.debug(f"View {view.value} refreshed")
         self._con.commit()
 
-    def setup_db(self):
-        self._reset_db()
-        self._setup_db_structures()
+    def list_diagnostic(
+        self, view: DiagnosticView, limit: None | int = None
+    ) -> List[Tuple]:
+        if not self._con or not self._cur:
+            return []
+        self._cur.execute(
+            sql.SQL("SELECT * FROM {} LIMIT %s").format(sql.Identifier(view.value)),
+            (limit,),
+        )
+        return self._cur.fetchall()
 
-    def enable_triggers(self):
+    def reprocess_person_names(self, charter_ids: List[int]):
+        """
+        Reprocesses the person names in the abstracts and tenors of the given charters
+        with set-based SQL. Yields the same results as the row-level trigger.
+        """
         if not self._con or not self._cur:
             return
-        self._cur.execute(_read_sql_file("sql/triggers.sql"))
+        if self._deduplicate_xml:
+            raise Exception("Reprocessing person names with deduplicated XML")
+        self._cur.execute(
+            "SELECT public.reprocess_charters_person_names(%s)", (charter_ids,)
+        )
         self._con.commit()
 
+    def take_snapshot(self, snapshot_date: date, fingerprint: str) -> int:
+        """
+        Records the imported tables as the snapshot of `snapshot_date`. For every
+        snapshot source, the current versions whose content changed or disappeared are
+        closed, and new versions are only stored for new or changed content. Returns
+        the number of new versions.
+        """
+        if not self._con or not self._cur:
+            return 0
+        self._cur.execute("SELECT MAX(snapshot_date) FROM snapshots.snapshots")
+        latest = cast(Tuple[None | date], self._cur.fetchone())[0]
+        if latest is not None and snapshot_date <= latest:
+            raise Exception(
+                f"Snapshot of {snapshot_date} is not later than the latest snapshot of {latest}"
+            )
+        self._cur.execute(
+            "INSERT INTO snapshots.snapshots (snapshot_date, fingerprint) VALUES (%s, %s)",
+            (snapshot_date, fingerprint),
+        )
+        version_count = 0
+        for source in _SNAPSHOT_SOURCES:
+            # Keys are expected to be unique, duplicates keep a single version
+            self._cur.execute(
+                sql.SQL(
+                    """
+                    CREATE TEMP TABLE snapshot_rows AS
+                    SELECT DISTINCT ON (key) key, md5(content::TEXT) AS hash, content
+                    FROM {view}
+                    ORDER BY key, content
+                    """
+                ).format(view=sql.Identifier(f"snapshot_{source}"))
+            )
+            self._cur.execute("ANALYZE snapshot_rows")
+            self._cur.execute(
+                """
+                UPDATE snapshots.versions v SET valid_to = %(date)s
+                WHERE v.source = %(source)s AND v.valid_to IS NULL AND NOT EXISTS (
+                    SELECT 1 FROM snapshot_rows r WHERE r.key = v.key AND r.hash = v.hash
+                )
+                """,
+                {"date": snapshot_date, "source": source},
+            )
+            closed_count = self._cur.rowcount
+            self._cur.execute(
+                """
+                INSERT INTO snapshots.versions (source, key, hash, content, valid_from)
+                SELECT %(source)s, r.key, r.hash, r.content, %(date)s
+                FROM snapshot_rows r
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM snapshots.versions v
+                    WHERE v.source = %(source)s AND v.key = r.key AND v.valid_to IS NULL
+                )
+                """,
+                {"date": snapshot_date, "source": source},
+            )
+            new_count = self._cur.rowcount
+            self._cur.execute("DROP TABLE snapshot_rows")
+            log.info(
+                f"Snapshot of {source}: {new_count} new versions, {closed_count} closed versions"
+            )
+            version_count += new_count
+        self._commit()
+        return version_count
+
     def insert_index_locations(self):
         if not self._con or not self._cur:
             return
@@ -211,7 +735,7 @@ class CharterDb:
         ) as copy:
             for record in fonds_records:
                 copy.write_row(record)
-        self._con.commit()
+        self._commit()
 
     def insert_archives(self, archives: List[XmlArchive]):
         if not self._con or not self._cur:
@@ -232,7 +756,7 @@ class CharterDb:
         ) as copy:
             for record in records:
                 copy.write_row(record)
-        self._con.commit()
+        self._commit()
 
     def insert_fonds(self, fonds: List[XmlFond]):
         if not self._con or not self._cur:
@@ -255,7 +779,7 @@ class CharterDb:
         ) as copy:
             for record in records:
                 copy.write_row(record)
-        self._con.commit()
+        self._commit()
 
     def insert_saved_charters(self, charters: List[XmlSavedCharter]):
         if not self._con or not self._cur:
@@ -272,38 +796,25 @@ class CharterDb:
         charter_records = []
         for charter in charters:
             if charter.url is None:
-                log.warn(f"URL not found for saved charter {charter.atom_id}")
+                log.warn(
+                    f"URL not found for saved charter {charter.atom_id}",
+                    "saved charter url",
+                )
                 continue
             original_id = atom_id_to_charter_id_map.get(charter.atom_id, None)
             if original_id is None:
                 log.warn(
-                    f"Original charter not found for saved charter {charter.atom_id}"
+                    f"Original charter not found for saved charter {charter.atom_id}",
+                    "saved charter original",
                 )
                 continue
-            charter_records.append(
-                [
-                    charter.id,
-                    _serialize_xml(charter.abstract),
-                    charter.atom_id,
-                    charter.editor_id,
-                    charter.idno_id,
-                    charter.idno_text,
-                    charter.released,
-                    original_id,
-                    charter.start_time,
-                    _serialize_xml(charter.tenor),
-                    charter.url,
-                    _dates_to_range(charter.issued_date),
-                    charter.issued_date_text,
-                    charter.sort_date,
-                ]
-            )
+            charter_records.append(_saved_charter_record(charter, original_id))
             valid_charters.append(charter)
-        with self._cur.copy(
-            "COPY saved_charters (id, abstract, atom_id, editor_id, idno_id, idno_text, is_released, original_charter_id, start_time, tenor, url, issued_date, issued_date_text, sort_date) FROM STDIN"
-        ) as copy:
-            for record in charter_records:
-                copy.write_row(record)
+        self._copy_charters(
+            "saved_charters",
+            _SAVED_CHARTER_COLUMNS,
+            charter_records,
+        )
         image_records = [
             [image, "images.monasterium.net" not in image]
             for charter in valid_charters
@@ -330,33 +841,18 @@ class CharterDb:
             "INSERT INTO saved_charters_images (saved_charter_id, image_id) VALUES (%s, %s) ON CONFLICT DO NOTHING",
             charters_images_records,
         )
-        self._con.commit()
+        self._commit()
 
     def insert_collections_charters(self, charters: List[XmlCollectionCharter]):
         if not self._con or not self._cur:
             return
         # Insert charters
-        charter_records = [
-            [
-                charter.id,
-                _serialize_xml(charter.abstract),
-                charter.atom_id,
-                charter.idno_id,
-                charter.idno_text,
-                charter.url,
-                charter.last_editor_id,
-                _dates_to_range(charter.issued_date),
-                charter.issued_date_text,
-                charter.sort_date,
-                _serialize_xml(charter.tenor),
-            ]
-            for charter in charters
-        ]
-        with self._cur.copy(
-            "COPY charters (id, abstract, atom_id, idno_id, idno_text, url, last_editor_id, issued_date, issued_date_text, sort_date, tenor) FROM STDIN"
-        ) as copy:
-            for record in charter_records:
-                copy.write_row(record)
+        charter_records = [_public_charter_record(charter) for charter in charters]
+        self._copy_charters(
+            "charters",
+            _PUBLIC_CHARTER_COLUMNS,
+            charter_records,
+        )
         # Insert collections_charters
         collections_charters_records = [
             [charter.collection_id, charter.id] for charter in charters
@@ -394,33 +890,18 @@ class CharterDb:
             "INSERT INTO charters_images (charter_id, image_id) VALUES (%s, %s) ON CONFLICT DO NOTHING",
             charters_images_records,
         )
-        self._con.commit()
+        self._commit()
 
     def insert_fonds_charters(self, charters: List[XmlFondCharter]):
         if not self._con or not self._cur:
             return
-        charter_records = [
-            [
-                charter.id,
-                _serialize_xml(charter.abstract),
-                charter.atom_id,
-                charter.idno_id,
-                charter.idno_text,
-                charter.url,
-                charter.last_editor_id,
-                _dates_to_range(charter.issued_date),
-                charter.issued_date_text,
-                charter.sort_date,
-                _serialize_xml(charter.tenor),
-            ]
-            for charter in charters
-        ]
+        charter_records = [_public_charter_record(charter) for charter in charters]
         # Insert charters
-        with self._cur.copy(
-            "COPY charters (id, abstract, atom_id, idno_id, idno_text, url, last_editor_id, issued_date, issued_date_text, sort_date, tenor) FROM STDIN"
-        ) as copy:
-            for record in charter_records:
-                copy.write_row(record)
+        self._copy_charters(
+            "charters",
+            _PUBLIC_CHARTER_COLUMNS,
+            charter_records,
+        )
         # Insert fonds_charters
         fonds_charters_records = [[charter.fond_id, charter.id] for charter in charters]
         with self._cur.copy(
@@ -456,24 +937,49 @@ class CharterDb:
             "INSERT INTO charters_images (charter_id, image_id) VALUES (%s, %s) ON CONFLICT DO NOTHING",
             charters_images_records,
         )
-        self._con.commit()
+        self._commit()
 
-    def insert_images(self, images: List[str]):
+    def insert_images(self, images: Iterable[str]) -> int:
+        """
+        Streams the `images` into a staging table with COPY while they are being read in
+        a background thread, and then inserts them without duplicates in the order they
+        were read. Returns the number of inserted images.
+        """
         if not self._con or not self._cur:
-            return
-        records_dict: Dict[str, Tuple[str, bool]] = {
-            image: (image, "images.monasterium.net" not in image) for image in images
-        }
-        records = list(records_dict.values())
-        with self._cur.copy("COPY images (url, is_external) FROM STDIN") as copy:
-            for record in records:
-                copy.write_row(record)
-        self._con.commit()
+            return 0
+        self._cur.execute(
+            """
+            CREATE TEMP TABLE images_staging (
+                ordinal BIGINT GENERATED ALWAYS AS IDENTITY,
+                url TEXT NOT NULL,
+                is_external BOOLEAN NOT NULL
+            ) ON COMMIT DROP
+            """
+        )
+        with self._cur.copy(
+            "COPY images_staging (url, is_external) FROM STDIN"
+        ) as copy:
+            for image in iterate_in_thread(lambda: images):
+                copy.write_row((image, "images.monasterium.net" not in image))
+        self._cur.execute(
+            """
+            INSERT INTO images (url, is_external)
+            SELECT url, is_external FROM (
+                SELECT DISTINCT ON (url) url, is_external, ordinal
+                FROM images_staging
+                ORDER BY url, ordinal
+            ) AS unique_images
+            ORDER BY ordinal
+            ON CONFLICT (url) DO NOTHING
+            """
+        )
+        count = self._cur.rowcount
+        self._commit()
+        return count
 
     def insert_users(self, users: List[XmlUser]):
         if not self._con or not self._cur:
             return
-        email_id_map = {user.email.lower(): user.id for user in users}
         records = [
             [
                 user.id,
@@ -488,19 +994,10 @@ class CharterDb:
         ) as copy:
             for record in records:
                 copy.write_row(record)
-        moderated_records = []
-        for user in users:
-            moderator_email = user.moderater_email
-            if moderator_email is None:
-                continue
-            moderator_id = email_id_map.get(moderator_email.lower())
-            if moderator_id is None or moderator_id == user.id:
-                continue
-            moderated_records.append((moderator_id, user.id))
         self._cur.executemany(
-            "UPDATE users SET moderator_id = %s WHERE id = %s", moderated_records
+            "UPDATE users SET moderator_id = %s WHERE id = %s", _moderator_records(users)
         )
-        self._con.commit()
+        self._commit()
 
     def insert_user_charter_bookmarks(self, users: List[XmlUser]):
         if not self._con or not self._cur:
@@ -525,7 +1022,7 @@ class CharterDb:
             "INSERT INTO user_charter_bookmarks (user_id, charter_id, note) VALUES (%s, %s, %s) ON CONFLICT DO NOTHING",
             user_bookmarks_records,
         )
-        self._con.commit()
+        self._commit()
 
     def insert_private_collections(self, mycollections: List[XmlMycollection]):
         if not self._con or not self._cur:
@@ -545,7 +1042,7 @@ class CharterDb:
         ) as copy:
             for record in records:
                 copy.write_row(record)
-        self._con.commit()
+        self._commit()
 
     def insert_public_mycollections(self, mycollections: List[XmlMycollection]):
         if not self._con or not self._cur:
@@ -566,33 +1063,18 @@ class CharterDb:
         ) as copy:
             for record in records:
                 copy.write_row(record)
-        self._con.commit()
+        self._commit()
 
     def insert_private_mycharters(self, charters: List[XmlMycharter]):
         if not self._con or not self._cur:
             return
         # Insert charters
-        records = [
-            [
-                charter.id,
-                _serialize_xml(charter.abstract),
-                charter.atom_id,
-                charter.collection_id,
-                charter.idno_id,
-                charter.idno_text,
-                charter.source_charter_id,
-                _dates_to_range(charter.issued_date),
-                charter.issued_date_text,
-                charter.sort_date,
-                _serialize_xml(charter.tenor),
-            ]
-            for charter in charters
-        ]
-        with self._cur.copy(
-            "COPY private_charters (id, abstract, atom_id, private_collection_id, idno_id, idno_text, source_charter_id, issued_date, issued_date_text, sort_date, tenor) FROM STDIN"
-        ) as copy:
-            for record in records:
-                copy.write_row(record)
+        records = [_private_charter_record(charter) for charter in charters]
+        self._copy_charters(
+            "private_charters",
+            _PRIVATE_CHARTER_COLUMNS,
+            records,
+        )
         # Insert user shares
         user_shares_records = [
             (charter.id, user_id)
@@ -633,33 +1115,18 @@ class CharterDb:
             charters_images_records,
         )
         # Commit
-        self._con.commit()
+        self._commit()
 
     def insert_public_mycharters(self, charters: List[XmlCollectionCharter]):
         if not self._con or not self._cur:
             return
         # Insert charters
-        charter_records = [
-            [
-                charter.id,
-                _serialize_xml(charter.abstract),
-                charter.atom_id,
-                charter.idno_id,
-                charter.idno_text,
-                charter.url,
-                charter.last_editor_id,
-                _dates_to_range(charter.issued_date),
-                charter.issued_date_text,
-                charter.sort_date,
-                _serialize_xml(charter.tenor),
-            ]
-            for charter in charters
-        ]
-        with self._cur.copy(
-            "COPY charters (id, abstract, atom_id, idno_id, idno_text, url, last_editor_id, issued_date, issued_date_text, sort_date, tenor) FROM STDIN"
-        ) as copy:
-            for record in charter_records:
-                copy.write_row(record)
+        charter_records = [_public_charter_record(charter) for charter in charters]
+        self._copy_charters(
+            "charters",
+            _PUBLIC_CHARTER_COLUMNS,
+            charter_records,
+        )
         # Insert collections_charters
         collections_charters_records = [
             [charter.collection_id, charter.id, charter.source_mycharter_id]
@@ -698,7 +1165,7 @@ class CharterDb:
             "INSERT INTO charters_images (charter_id, image_id) VALUES (%s, %s) ON CONFLICT DO NOTHING",
             charters_images_records,
         )
-        self._con.commit()
+        self._commit()
 
     def insert_persons(
         self,
@@ -726,19 +1193,15 @@ class CharterDb:
                 copy.write_row(record)
         person_name_records = []
         charters_person_name_records = []
+        progress = Progress(
+            "persons",
+            len(public_charters) + len(private_charters) + len(saved_charters),
+        )
         # collect public charters person names
         for charter in public_charters:
+            progress.step()
             for person_name in charter.person_names:
-                person_name_records.append(
-                    [
-                        person_name.id,
-                        person_name.person_id,
-                        person_name.text,
-                        person_name.reg,
-                        person_name.key,
-                        person_name.location.value,
-                    ]
-                )
+                person_name_records.append(_person_name_record(person_name))
                 charters_person_name_records.append(
                     [
                         person_name.charter_id,
@@ -748,17 +1211,9 @@ class CharterDb:
         # collect private charters person names
         private_charters_person_name_records = []
         for charter in private_charters:
+            progress.step()
             for person_name in charter.person_names:
-                person_name_records.append(
-                    [
-                        person_name.id,
-                        person_name.person_id,
-                        person_name.text,
-                        person_name.reg,
-                        person_name.key,
-                        person_name.location.value,
-                    ]
-                )
+                person_name_records.append(_person_name_record(person_name))
                 private_charters_person_name_records.append(
                     [
                         person_name.charter_id,
@@ -770,49 +1225,194 @@ class CharterDb:
         id_set: Set[int] = {id[0] for id in self._cur.fetchall()}
         saved_charters_person_names = []
         for charter in saved_charters:
+            progress.step()
             for person_name in charter.person_names:
                 if person_name.charter_id not in id_set:
                     # Skip person names that are from saved charters that
                     # could not be saved in the database
                     continue
-                person_name_records.append(
-                    [
-                        person_name.id,
-                        person_name.person_id,
-                        person_name.text,
-                        person_name.reg,
-                        person_name.key,
-                        person_name.location.value,
-                    ]
-                )
+                person_name_records.append(_person_name_record(person_name))
                 saved_charters_person_names.append(
                     [
                         person_name.charter_id,
                         person_name.id,
                     ]
                 )
+        progress.done()
+        progress = Progress(
+            "person name records",
+            len(person_name_records)
+            + len(charters_person_name_records)
+            + len(private_charters_person_name_records)
+            + len(saved_charters_person_names),
+        )
         # insert person name records
         with self._cur.copy(
             "COPY person_names (id, person_id, text, reg, key, location_id) FROM STDIN"
         ) as copy:
             for record in person_name_records:
                 copy.write_row(record)
+                progress.step()
         # insert charters person name records
         with self._cur.copy(
             "COPY charters_person_names (charter_id, person_name_id) FROM STDIN"
         ) as copy:
             for record in charters_person_name_records:
                 copy.write_row(record)
+                progress.step()
         # insert private charters person name records
         with self._cur.copy(
             "COPY private_charters_person_names (private_charter_id, person_name_id) FROM STDIN"
         ) as copy:
             for record in private_charters_person_name_records:
                 copy.write_row(record)
+                progress.step()
         # insert saved charters person name records
         with self._cur.copy(
             "COPY saved_charters_person_names (saved_charter_id, person_name_id) FROM STDIN"
         ) as copy:
             for record in saved_charters_person_names:
                 copy.write_row(record)
+                progress.step()
+        self._commit()
+        progress.done()
+
+    def insert_image_reconciliation(self, reconciliation: ImageReconciliation):
+        if not self._con or not self._cur:
+            return
+        with self._cur.copy(
+            "COPY image_reconciliation (key, url, status, charter_count) FROM STDIN"
+        ) as copy:
+            for record in reconciliation.images:
+                copy.write_row(record)
+        with self._cur.copy(
+            "COPY fonds_image_reconciliation (fond_id, used_count, unused_count, dangling_count) FROM STDIN"
+        ) as copy:
+            for record in reconciliation.fonds:
+                copy.write_row(record)
+        with self._cur.copy(
+            "COPY collections_image_reconciliation (collection_id, used_count, unused_count, dangling_count) FROM STDIN"
+        ) as copy:
+            for record in reconciliation.collections:
+                copy.write_row(record)
+        self._commit()
+
+    def copy_rows(
+        self, table: str, columns: List[str], rows: Iterable[Sequence]
+    ) -> int:
+        """
+        Copies the `rows` with the values of `columns` into `table` as they are and
+        returns the number of copied rows.
+        """
+        if not self._con or not self._cur:
+            return 0
+        count = 0
+        with self._cur.copy(
+            sql.SQL("COPY {table} ({columns}) FROM STDIN").format(
+                table=sql.Identifier(table),
+                columns=sql.SQL(", ").join(map(sql.Identifier, columns)),
+            )
+        ) as copy:
+            for row in rows:
+                copy.write_row(row)
+                count += 1
         self._con.commit()
+        return count
+
+    def update_charters(
+        self, edits: Iterable[CharterEdit], batch_size: int = 1000
+    ) -> int:
+        """
+        Applies a stream of charter edits in batches of `batch_size`. Each batch is
+        staged with COPY, applied with a single `UPDATE ... FROM` and its person names
+        are reprocessed once for the whole batch. Returns the number of updated charters.
+        """
+        if not self._con or not self._cur:
+            return 0
+        if self._deduplicate_xml:
+            raise Exception("Updating charters with deduplicated XML")
+        updated_count = 0
+        edits_iter = iter(edits)
+        batch_number = 0
+        while True:
+            batch = list(itertools.islice(edits_iter, batch_size))
+            if len(batch) == 0:
+                break
+            # UPDATE ... FROM applies only one of several rows for the same charter
+            merged: Dict[str, CharterEdit] = {}
+            for edit in batch:
+                merged.setdefault(edit.atom_id, CharterEdit(edit.atom_id)).merge(edit)
+            batch_number += 1
+            start = time.perf_counter()
+            self._cur.execute(
+                """
+                CREATE TEMP TABLE charter_edits (
+                    atom_id TEXT NOT NULL,
+                    fields TEXT[] NOT NULL,
+                    abstract XML,
+                    idno_id TEXT,
+                    idno_text TEXT,
+                    issued_date DATERANGE,
+                    issued_date_text TEXT,
+                    sort_date DATE,
+                    tenor XML
+                ) ON COMMIT DROP
+                """
+            )
+            with self._cur.copy(
+                "COPY charter_edits (atom_id, fields, abstract, idno_id, idno_text, issued_date, issued_date_text, sort_date, tenor) FROM STDIN"
+            ) as copy:
+                for edit in merged.values():
+                    copy.write_row(
+                        [
+                            edit.atom_id,
+                            edit.fields,
+                            _serialize_xml(edit.abstract),
+                            edit.idno_id,
+                            edit.idno_text,
+                            _dates_to_range(edit.issued_date),
+                            edit.issued_date_text,
+                            edit.sort_date,
+                            _serialize_xml(edit.tenor),
+                        ]
+                    )
+            # Person names are reprocessed below for the whole batch
+            self._cur.execute(
+                "SELECT set_config('momcheck.skip_person_names', 'on', TRUE)"
+            )
+            self._cur.execute(
+                """
+                UPDATE charters c SET
+                    abstract = CASE WHEN 'abstract' = ANY(e.fields) THEN e.abstract ELSE c.abstract END,
+                    idno_id = CASE WHEN 'idno_id' = ANY(e.fields) THEN e.idno_id ELSE c.idno_id END,
+                    idno_text = CASE WHEN 'idno_text' = ANY(e.fields) THEN e.idno_text ELSE c.idno_text END,
+                    issued_date = CASE WHEN 'issued_date' = ANY(e.fields) THEN e.issued_date ELSE c.issued_date END,
+                    issued_date_text = CASE WHEN 'issued_date_text' = ANY(e.fields) THEN e.issued_date_text ELSE c.issued_date_text END,
+                    sort_date = CASE WHEN 'sort_date' = ANY(e.fields) THEN e.sort_date ELSE c.sort_date END,
+                    tenor = CASE WHEN 'tenor' = ANY(e.fields) THEN e.tenor ELSE c.tenor END
+                FROM charter_edits e
+                WHERE c.atom_id = e.atom_id
+                RETURNING c.id, 'abstract' = ANY(e.fields) OR 'tenor' = ANY(e.fields)
+                """
+            )
+            updated = self._cur.fetchall()
+            self._cur.execute(
+                "SELECT set_config('momcheck.skip_person_names', 'off', TRUE)"
+            )
+            reprocess_ids = [id for id, touches_xml in updated if touches_xml]
+            if len(reprocess_ids) > 0:
+                self._cur.execute(
+                    "SELECT public.reprocess_charters_person_names(%s)",
+                    (reprocess_ids,),
+                )
+            self._con.commit()
+            if len(updated) < len(merged):
+                log.warn(
+                    f"{len(merged) - len(updated)} charters of batch {batch_number} not found"
+                )
+            updated_count += len(updated)
+            duration = time.perf_counter() - start
+            log.info(
+                f"Updated {len(updated)} charters in batch {batch_number} in {duration:.2f}s ({len(updated) / duration:.0f} charters/s)"
+            )
+        return updated_count
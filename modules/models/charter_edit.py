@@ -0,0 +1,81 @@
+from datetime import date
+from typing import List, Tuple
+
+from lxml import etree
+
+
+class CharterEdit:
+    """
+    A set of changes to an existing charter identified by its `atom_id`.
+    Only fields that were set explicitly are written to the database.
+    """
+
+    def __init__(self, atom_id: str):
+        # atom_id
+        self.atom_id = atom_id
+
+        # fields
+        self.fields: List[str] = []
+
+        self.abstract: None | str | etree._Element = None
+        self.tenor: None | str | etree._Element = None
+        self.idno_id: None | str = None
+        self.idno_text: None | str = None
+        self.issued_date: None | Tuple[date, date] = None
+        self.issued_date_text: None | str = None
+        self.sort_date: None | date = None
+        # Whether the sort date was set explicitly instead of from the issued date
+        self._sort_date_explicit = False
+
+    def _set_field(self, name: str):
+        if name not in self.fields:
+            self.fields.append(name)
+
+    def set_abstract(self, abstract: None | str | etree._Element):
+        self.abstract = abstract
+        self._set_field("abstract")
+
+    def set_tenor(self, tenor: None | str | etree._Element):
+        self.tenor = tenor
+        self._set_field("tenor")
+
+    def set_idno(self, idno_id: None | str, idno_text: None | str = None):
+        self.idno_id = idno_id
+        self.idno_text = idno_text if idno_text is not None else idno_id
+        self._set_field("idno_id")
+        self._set_field("idno_text")
+
+    def set_issued_date(
+        self, issued_date: None | Tuple[date, date], issued_date_text: None | str
+    ):
+        self.issued_date = issued_date
+        self.issued_date_text = issued_date_text
+        self._set_field("issued_date")
+        self._set_field("issued_date_text")
+        # Keep the sort date in line with the latest issued date, as XmlCharter does,
+        # which sorts undated charters by the current date
+        if self._sort_date_explicit:
+            return
+        self.sort_date = issued_date[1] if issued_date is not None else date.today()
+        self._set_field("sort_date")
+
+    def set_sort_date(self, sort_date: date):
+        self.sort_date = sort_date
+        self._sort_date_explicit = True
+        self._set_field("sort_date")
+
+    def merge(self, other: "CharterEdit"):
+        """
+        Applies the fields set in `other`, a later edit of the same charter, on top of
+        this edit, as if its setters had been called on this edit.
+        """
+        for field in other.fields:
+            if (
+                field == "sort_date"
+                and self._sort_date_explicit
+                and not other._sort_date_explicit
+            ):
+                continue
+            setattr(self, field, getattr(other, field))
+            self._set_field(field)
+        self._sort_date_explicit = self._sort_date_explicit or other._sort_date_explicit
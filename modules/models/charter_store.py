@@ -0,0 +1,133 @@
+from abc import ABC, abstractmethod
+from datetime import date
+from typing import Iterable, List
+
+from modules.image_reconciliation import ImageReconciliation
+from modules.models.person_index import PersonIndex
+from modules.models.xml_archive import XmlArchive
+from modules.models.xml_collection import XmlCollection
+from modules.models.xml_collection_charter import XmlCollectionCharter
+from modules.models.xml_fond import XmlFond
+from modules.models.xml_fond_charter import XmlFondCharter
+from modules.models.xml_mycharter import XmlMycharter
+from modules.models.xml_mycollection import XmlMycollection
+from modules.models.xml_saved_charter import XmlSavedCharter
+from modules.models.xml_user import XmlUser
+
+
+class CharterStore(ABC):
+    """
+    The storage interface the import writes to. Stores are context managers and
+    receive the parsed backup in the order of `sql_import.py`. Stores must implement
+    the abstract methods, the others are optional hooks that do nothing by default.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, __exc_type__, __exc_val__, __exc_tb__):
+        pass
+
+    @abstractmethod
+    def setup_db(self):
+        raise NotImplementedError
+
+    def reset_serial_id_sequences(self):
+        pass
+
+    def enable_triggers(self, statement_level: bool = False):
+        pass
+
+    def create_diagnostic_views(self):
+        pass
+
+    def list_completed_stages(self, fingerprint: str) -> List[str]:
+        """
+        Returns the import stages recorded as completed for the backup with the
+        `fingerprint`, or none if the store can't resume an import.
+        """
+        return []
+
+    def complete_stage(self, stage: str, fingerprint: str):
+        pass
+
+    def take_snapshot(self, snapshot_date: date, fingerprint: str) -> int:
+        """
+        Records the imported tables as the snapshot of `snapshot_date` and returns the
+        number of new versions.
+        """
+        return 0
+
+    @abstractmethod
+    def insert_index_locations(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_users(self, users: List[XmlUser]):
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_images(self, images: Iterable[str]) -> int:
+        """
+        Inserts the streamed `images`, skipping duplicates, and returns the number of
+        inserted images.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_archives(self, archives: List[XmlArchive]):
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_fonds(self, fonds: List[XmlFond]):
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_fonds_charters(self, charters: List[XmlFondCharter]):
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_collections(self, collections: List[XmlCollection]):
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_collections_charters(self, charters: List[XmlCollectionCharter]):
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_user_charter_bookmarks(self, users: List[XmlUser]):
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_saved_charters(self, charters: List[XmlSavedCharter]):
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_private_collections(self, mycollections: List[XmlMycollection]):
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_public_mycollections(self, mycollections: List[XmlMycollection]):
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_private_mycharters(self, charters: List[XmlMycharter]):
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_public_mycharters(self, charters: List[XmlCollectionCharter]):
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_persons(
+        self,
+        person_index: PersonIndex,
+        public_charters: List[XmlFondCharter | XmlCollectionCharter],
+        private_charters: List[XmlMycharter],
+        saved_charters: List[XmlSavedCharter],
+    ):
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_image_reconciliation(self, reconciliation: ImageReconciliation):
+        raise NotImplementedError
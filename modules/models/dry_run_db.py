@@ -0,0 +1,25 @@
+from typing import Dict, Iterable, Sequence
+
+from modules.logger import Logger
+from modules.models.table_store import TableStore
+
+log = Logger()
+
+
+class DryRunDb(TableStore):
+    """
+    Builds the same rows as the other table stores, including the XML serialization,
+    and discards them. Only the number of rows per table is kept in `records`.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.records: Dict[str, int] = {}
+
+    def _write(self, table: str, rows: Iterable[Sequence]):
+        self.records[table] = self.records.get(table, 0) + sum(1 for _ in rows)
+
+    def setup_db(self):
+        self.records = {}
+        self._reset_ids()
+        log.debug("Dry run, records are discarded")
@@ -1,4 +1,4 @@
-from typing import List
+from typing import Iterator, List
 
 
 def _use_image(image: str) -> bool:
@@ -14,12 +14,25 @@ class ImagesFile:
     def __init__(self, path: str):
         self.path = path
 
+    def iter_images(self, chunk_size: int = 1 << 20) -> Iterator[str]:
+        """
+        Yields the image URLs of the list one by one, reading the file in chunks of about
+        `chunk_size` bytes. Duplicates are not removed, that is left to the database.
+        """
+        with open(self.path, "r", encoding="iso-8859-1", buffering=chunk_size) as file:
+            while True:
+                lines = file.readlines(chunk_size)
+                if len(lines) == 0:
+                    break
+                for line in lines:
+                    image = line.strip()
+                    if not _use_image(image):
+                        continue
+                    yield (
+                        "http://images.monasterium.net/" + image[2:]
+                        if line.startswith("./")
+                        else image
+                    )
+
     def list_images(self) -> List[str]:
-        with open(self.path, "r", encoding="iso-8859-1") as file:
-            return [
-                "http://images.monasterium.net/" + line[2:].strip()
-                if line.startswith("./")
-                else line.strip()
-                for line in file.readlines()
-                if _use_image(line.strip())
-            ]
+        return list(self.iter_images())
@@ -1,10 +1,13 @@
+import hashlib
 import zipfile
-from typing import Dict, List, Sequence
+from typing import Dict, Iterator, List, Sequence, Set, Tuple
 
 from lxml import etree
 
+from modules.constants import NAMESPACES
+from modules.import_sample import ImportSample
 from modules.logger import Logger
-from modules.models.contents_xml import ContentsXml
+from modules.models.contents_xml import ContentEntryResource, ContentsXml
 from modules.models.person_index import PersonIndex
 from modules.models.xml_archive import XmlArchive
 from modules.models.xml_charter import XmlCharter
@@ -18,7 +21,8 @@ from modules.models.xml_mycollection import XmlMycollection
 from modules.models.xml_person_index import XmlPersonIndex
 from modules.models.xml_saved_charter import XmlSavedCharter
 from modules.models.xml_user import XmlUser
-from modules.utils import join_url_parts
+from modules.progress import Progress
+from modules.utils import join_url_parts, normalize_string
 
 log = Logger()
 
@@ -26,6 +30,11 @@ log = Logger()
 class MomBackup:
     def __init__(self, path):
         self.path = path
+        # Compressed and uncompressed size of all files read from the zip
+        self.bytes_read = 0
+        self.bytes_decompressed = 0
+        # Restricts the listings to a sample, see `apply_sample`
+        self.sample: None | ImportSample = None
 
     def __enter__(self):
         self.zip = zipfile.ZipFile(self.path, "r")
@@ -36,6 +45,18 @@ class MomBackup:
             self.zip.close()
             self.zip = None
 
+    def fingerprint(self) -> str:
+        """
+        Returns a hash of the names, sizes and checksums of all files in the backup,
+        which only reads the directory of the zip.
+        """
+        if not self.zip:
+            raise Exception("Zip file not open")
+        hash = hashlib.sha256()
+        for info in self.zip.infolist():
+            hash.update(f"{info.filename}\0{info.file_size}\0{info.CRC}\n".encode())
+        return hash.hexdigest()[:16]
+
     def _get_xml(self, path: str) -> etree._ElementTree:
         """
         Gets the XML file represented by the `path` from the backup zip.
@@ -43,10 +64,23 @@ class MomBackup:
         """
         if not self.zip:
             raise Exception("Zip file not open")
-        with self.zip.open(path) as contents:
+        info = self.zip.getinfo(path)
+        self.bytes_read += info.compress_size
+        self.bytes_decompressed += info.file_size
+        with self.zip.open(info) as contents:
             parser = etree.XMLParser(recover=True)
             return etree.parse(contents, parser)
 
+    def _content_hash(self, path: str) -> str:
+        """
+        Returns a hash of the contents of the file at `path` from its checksum and
+        size in the directory of the zip, without reading the file again.
+        """
+        if not self.zip:
+            raise Exception("Zip file not open")
+        info = self.zip.getinfo(path)
+        return f"{info.CRC:08x}{info.file_size:x}"
+
     def _get_xml_optional(self, path: str) -> None | etree._ElementTree:
         """
         Gets the XML file represented by the `path` from the backup zip,
@@ -95,6 +129,21 @@ class MomBackup:
         resource_paths = self._list_resource_paths(base_path)
         return [self._get_xml(path) for path in resource_paths]
 
+    def _sampled_resources(
+        self, folder_path: str, contents: ContentsXml
+    ) -> List[ContentEntryResource]:
+        """
+        Returns the resources of the `contents` of `folder_path` that are in the
+        sample, or all of them without a sample.
+        """
+        if self.sample is None:
+            return contents.resources
+        return [
+            resource
+            for resource in contents.resources
+            if join_url_parts(folder_path, resource.file) in self.sample.charter_paths
+        ]
+
     def list_users(self) -> List[XmlUser]:
         users: Dict[str, XmlUser] = {}
         contents_path = "db/mom-data/xrx.user"
@@ -105,7 +154,8 @@ class MomBackup:
             file_lower = file.lower()
             if file_lower in users:
                 log.warn(
-                    f"Different case for {file}. Potential conflict with {users[file_lower].file}. Skipping"
+                    f"Different case for {file}. Potential conflict with {users[file_lower].file}. Skipping",
+                    "user case conflict",
                 )
                 continue
             xrx = self._get_xml(f"db/mom-data/xrx.user/{file}")
@@ -121,6 +171,8 @@ class MomBackup:
         contents_path = "db/mom-data/metadata.archive.public"
         for archive_entry in self._get_contents(contents_path).collections:
             file = archive_entry.file
+            if self.sample is not None and file not in self.sample.archives:
+                continue
             eag_path = f"db/mom-data/metadata.archive.public/{file}/{file}.eag.xml"
             oai_path = f"db/mom-data/metadata.archive.public/{file}/oai.xml"
             eag = self._get_xml_optional(eag_path)
@@ -136,11 +188,16 @@ class MomBackup:
             contents_path = f"db/mom-data/metadata.fond.public/{archive.file}"
             for fond_entry in self._get_contents(contents_path).collections:
                 fond_file = fond_entry.file
+                if (
+                    self.sample is not None
+                    and f"{archive.file}/{fond_file}" not in self.sample.fonds
+                ):
+                    continue
                 ead_path = f"db/mom-data/metadata.fond.public/{archive.file}/{fond_file}/{fond_file}.ead.xml"
                 preferences_path = f"db/mom-data/metadata.fond.public/{archive.file}/{fond_file}/{fond_file}.preferences.xml"
                 ead = self._get_xml_optional(ead_path)
                 if ead is None:
-                    log.warn(f"Failed to open fond ead {ead_path}")
+                    log.warn(f"Failed to open fond ead {ead_path}", "unreadable xml")
                     continue
                 preferences = self._get_xml_optional(preferences_path)
                 fonds.append(XmlFond(fond_file, archive, ead, preferences))
@@ -149,47 +206,72 @@ class MomBackup:
     def list_fond_charters(
         self, fonds: List[XmlFond], users: List[XmlUser], person_index: PersonIndex
     ) -> List[XmlFondCharter]:
-        charters: Dict[str, XmlFondCharter] = {}
+        return list(self.iter_fond_charters(fonds, users, person_index))
+
+    def iter_fond_charters(
+        self, fonds: List[XmlFond], users: List[XmlUser], person_index: PersonIndex
+    ) -> Iterator[XmlFondCharter]:
+        """
+        Yields the charters of all `fonds` one by one as they are parsed, skipping duplicates.
+        """
+        listings: List[Tuple[XmlFond, List[ContentEntryResource]]] = []
         for fond in fonds:
             contents_path = (
                 f"db/mom-data/metadata.charter.public/{fond.archive_file}/{fond.file}"
             )
-            contents: None | ContentsXml = None
             try:
                 contents = self._get_contents(contents_path)
+                listings.append(
+                    (fond, self._sampled_resources(contents_path, contents))
+                )
             except KeyError:
-                log.warn(f"No content for fond {fond.archive_file}; {fond.identifier}")
-                continue
-            for charter_entry in contents.resources:
+                log.warn(
+                    f"No content for fond {fond.archive_file}; {fond.identifier}",
+                    "missing contents",
+                )
+        progress = Progress(
+            "fond charters", sum(len(resources) for _, resources in listings)
+        )
+        atom_ids: Set[str] = set()
+        for fond, resources in listings:
+            for charter_entry in resources:
+                progress.step()
                 charter_file = charter_entry.file
                 cei_path = f"db/mom-data/metadata.charter.public/{fond.archive_file}/{fond.file}/{charter_file}"
                 cei = self._get_xml_optional(cei_path)
                 if cei is None:
-                    log.warn(f"Failed to open charter cei {cei_path}")
+                    log.warn(f"Failed to open charter cei {cei_path}", "unreadable xml")
                     continue
                 try:
                     charter = XmlFondCharter(
                         charter_file, fond, cei, person_index, users
                     )
-                    if charter.atom_id in charters:
-                        log.warn(f"Duplicate charter {charter.atom_id}. Skipping")
+                    charter.content_hash = self._content_hash(cei_path)
+                    if charter.atom_id in atom_ids:
+                        log.warn(
+                            f"Duplicate charter {charter.atom_id}. Skipping",
+                            "duplicate charter",
+                        )
                         continue
                     else:
-                        charters[charter.atom_id] = charter
+                        atom_ids.add(charter.atom_id)
                 except Exception as e:
                     log.error(f"Failed to create charter {cei_path}: {e}")
                     continue
-        return list(charters.values())
+                yield charter
+        progress.done()
 
     def list_collections(self, fonds: List[XmlFond]) -> List[XmlCollection]:
         collections: List[XmlCollection] = []
         contents_path = "db/mom-data/metadata.collection.public"
         for collection_entry in self._get_contents(contents_path).collections:
             file = collection_entry.file
+            if self.sample is not None and file not in self.sample.collections:
+                continue
             cei_path = f"db/mom-data/metadata.collection.public/{file}/{file}.cei.xml"
             cei = self._get_xml_optional(cei_path)
             if cei is None:
-                log.warn(f"Failed to open collection cei {cei_path}")
+                log.warn(f"Failed to open collection cei {cei_path}", "unreadable xml")
                 continue
             collections.append(XmlCollection(file, cei, fonds))
         return collections
@@ -200,37 +282,61 @@ class MomBackup:
         users: List[XmlUser],
         person_index: PersonIndex,
     ) -> List[XmlCollectionCharter]:
-        charters: Dict[str, XmlCollectionCharter] = {}
+        return list(self.iter_collection_charters(collections, users, person_index))
+
+    def iter_collection_charters(
+        self,
+        collections: List[XmlCollection],
+        users: List[XmlUser],
+        person_index: PersonIndex,
+    ) -> Iterator[XmlCollectionCharter]:
+        """
+        Yields the charters of all `collections` one by one as they are parsed, skipping duplicates.
+        """
+        listings: List[Tuple[XmlCollection, List[ContentEntryResource]]] = []
         for collection in collections:
             contents_path = f"db/mom-data/metadata.charter.public/{collection.file}"
-            contents: None | ContentsXml = None
             try:
                 contents = self._get_contents(contents_path)
+                listings.append(
+                    (collection, self._sampled_resources(contents_path, contents))
+                )
             except KeyError:
                 log.warn(
-                    f"No content for collection {collection.file}; {collection.identifier}"
+                    f"No content for collection {collection.file}; {collection.identifier}",
+                    "missing contents",
                 )
-                continue
-            for charter_entry in contents.resources:
+        progress = Progress(
+            "collection charters", sum(len(resources) for _, resources in listings)
+        )
+        atom_ids: Set[str] = set()
+        for collection, resources in listings:
+            for charter_entry in resources:
+                progress.step()
                 charter_file = charter_entry.file
                 cei_path = f"db/mom-data/metadata.charter.public/{collection.file}/{charter_file}"
                 cei = self._get_xml_optional(cei_path)
                 if cei is None:
-                    log.warn(f"Failed to open charter cei {cei_path}")
+                    log.warn(f"Failed to open charter cei {cei_path}", "unreadable xml")
                     continue
                 try:
                     charter = XmlCollectionCharter(
                         charter_file, collection, cei, person_index, users
                     )
-                    if charter.atom_id in charters:
-                        log.warn(f"Duplicate charter {charter.atom_id}. Skipping")
+                    charter.content_hash = self._content_hash(cei_path)
+                    if charter.atom_id in atom_ids:
+                        log.warn(
+                            f"Duplicate charter {charter.atom_id}. Skipping",
+                            "duplicate charter",
+                        )
                         continue
                     else:
-                        charters[charter.atom_id] = charter
+                        atom_ids.add(charter.atom_id)
                 except Exception as e:
                     log.error(f"Failed to create charter {cei_path}: {e}")
                     continue
-        return list(charters.values())
+                yield charter
+        progress.done()
 
     def list_saved_charters(
         self,
@@ -249,8 +355,12 @@ class MomBackup:
                 charter = XmlSavedCharter(
                     saved_file, cei, users, fonds, collections, person_index
                 )
+                charter.content_hash = self._content_hash(cei_path)
                 if charter.atom_id in charters_map:
-                    log.warn(f"Duplicate charter {charter.atom_id}. Skipping")
+                    log.warn(
+                        f"Duplicate charter {charter.atom_id}. Skipping",
+                        "duplicate charter",
+                    )
                     continue
                 else:
                     charters_map[charter.atom_id] = charter
@@ -288,6 +398,7 @@ class MomBackup:
                     cei = self._get_xml(path)
                     try:
                         charter = XmlMycharter(file, cei, mycollection, person_index)
+                        charter.content_hash = self._content_hash(path)
                         if charter.source_atom_id is not None:
                             source_charter = charters_map.get(
                                 charter.source_atom_id, None
@@ -301,6 +412,7 @@ class MomBackup:
                         shared_xrx = self._get_xml_optional(shared_path)
                         if shared_xrx is not None:
                             charter.add_shared_users(shared_xrx, user_map)
+                            charter.content_hash += self._content_hash(shared_path)
                         mycharters[charter.atom_id] = charter
                     except Exception as e:
                         log.error(f"Failed to create mycharter {path}: {e}")
@@ -325,19 +437,22 @@ class MomBackup:
                 cei = self._get_xml(cei_path)
                 try:
                     charter = XmlCollectionCharter(file, collection, cei, person_index)
+                    charter.content_hash = self._content_hash(cei_path)
                     source_charter = private_charters_map.get(
                         collection.owner_email + collection.atom_id + charter.atom_id,
                         None,
                     )
                     if source_charter is None:
                         log.warn(
-                            f"Failed to find private source charter for {collection.owner_email}; {collection.atom_id}; {charter.atom_id}"
+                            f"Failed to find private source charter for {collection.owner_email}; {collection.atom_id}; {charter.atom_id}",
+                            "private source charter",
                         )
                     else:
                         charter.set_source_mycharter(source_charter)
                     if charter.atom_id in charters:
                         log.warn(
-                            f"Duplicate charter {collection.owner_email}; {collection.atom_id}; {charter.atom_id}. Skipping"
+                            f"Duplicate charter {collection.owner_email}; {collection.atom_id}; {charter.atom_id}. Skipping",
+                            "duplicate charter",
                         )
                         continue
                     charters[charter.atom_id] = charter
@@ -358,7 +473,8 @@ class MomBackup:
                 mycollection = XmlMycollection(file, cei, user)
                 if mycollection.atom_id in my_collections:
                     log.warn(
-                        f"Duplicate mycollection {mycollection.file}/{mycollection.atom_id}. Skipping"
+                        f"Duplicate mycollection {mycollection.file}/{mycollection.atom_id}. Skipping",
+                        "duplicate mycollection",
                     )
                     continue
                 my_collections[mycollection.atom_id] = mycollection
@@ -374,9 +490,16 @@ class MomBackup:
             cei_path = f"db/mom-data/metadata.mycollection.public/{file}/{file}.mycollection.xml"
             cei = self._get_xml_optional(cei_path)
             if cei is None:
-                log.warn(f"Failed to open mycollection cei {cei_path}")
+                log.warn(
+                    f"Failed to open mycollection cei {cei_path}", "unreadable xml"
+                )
                 continue
             mycollection = XmlMycollection(file, cei, None, True)
+            if (
+                self.sample is not None
+                and str(mycollection.author_email).lower() not in self.sample.users
+            ):
+                continue
             oai_path = f"db/mom-data/metadata.mycollection.public/{file}/oai.xml"
             oai = self._get_xml_optional(oai_path)
             if oai is not None:
@@ -417,3 +540,116 @@ class MomBackup:
         person_index = PersonIndex()
         person_index.add_all_xml_index_persons(persons)
         return person_index
+
+    def _list_public_charter_paths(
+        self,
+    ) -> Tuple[List[str], Dict[str, List[str]], Dict[str, List[str]]]:
+        """
+        Lists the archive files and the charter paths of all fonds and collections, by
+        `archive/fond` and by collection file.
+        """
+        archives: List[str] = []
+        fond_paths: Dict[str, List[str]] = {}
+        collection_paths: Dict[str, List[str]] = {}
+        archives_path = "db/mom-data/metadata.archive.public"
+        for archive_entry in self._get_contents(archives_path).collections:
+            archives.append(archive_entry.file)
+            fonds_path = f"db/mom-data/metadata.fond.public/{archive_entry.file}"
+            try:
+                fond_entries = self._get_contents(fonds_path).collections
+            except KeyError:
+                continue
+            for fond_entry in fond_entries:
+                key = f"{archive_entry.file}/{fond_entry.file}"
+                fond_paths[key] = self._list_charter_paths(key)
+        collections_path = "db/mom-data/metadata.collection.public"
+        for collection_entry in self._get_contents(collections_path).collections:
+            key = collection_entry.file
+            collection_paths[key] = self._list_charter_paths(key)
+        return archives, fond_paths, collection_paths
+
+    def _list_charter_paths(self, container: str) -> List[str]:
+        contents_path = f"db/mom-data/metadata.charter.public/{container}"
+        try:
+            contents = self._get_contents(contents_path)
+        except KeyError:
+            return []
+        return [
+            join_url_parts(contents_path, resource.file)
+            for resource in contents.resources
+        ]
+
+    def apply_sample(self, sample: ImportSample, users: List[XmlUser]) -> List[XmlUser]:
+        """
+        Picks the public charters and users of the `sample` and adds what they
+        reference, until nothing is added: the original charters of the saved charters
+        of sampled users and the last editors of sampled charters. The sampled fonds,
+        collections and archives are those of the sampled charters. From then on, the
+        listings only return sampled entities. Returns the sampled `users`, which the
+        private collections and charters follow.
+        """
+        log.info("Sampling the backup...")
+        archives, fond_paths, collection_paths = self._list_public_charter_paths()
+        # Charters by the end of their atom id, which is their container and name
+        originals: Dict[str, Tuple[str, str]] = {}
+        for containers in [fond_paths, collection_paths]:
+            for container, paths in containers.items():
+                for path in paths:
+                    name = path.rsplit("/", 1)[-1].removesuffix(".cei.xml")
+                    originals[f"/charter/{container}/{name}"] = (container, path)
+        for containers, picked in [
+            (fond_paths, sample.fonds),
+            (collection_paths, sample.collections),
+        ]:
+            for container, paths in containers.items():
+                picked_paths = [path for path in paths if sample.picks(path)]
+                if len(picked_paths) > 0:
+                    picked.add(container)
+                    sample.charter_paths.update(picked_paths)
+        users_by_email = {user.email.lower(): user for user in users}
+        new_users = [user for user in users if sample.picks(user.file)]
+        sample.users.update(user.email.lower() for user in new_users)
+        new_paths = list(sample.charter_paths)
+        while len(new_users) > 0 or len(new_paths) > 0:
+            for user in new_users:
+                for saved in user.saved_charters:
+                    tail = saved.atom_id[saved.atom_id.find("/charter/") :]
+                    container, path = originals.get(tail, ("", ""))
+                    if path == "" or path in sample.charter_paths:
+                        continue
+                    if container in fond_paths:
+                        sample.fonds.add(container)
+                    else:
+                        sample.collections.add(container)
+                    sample.charter_paths.add(path)
+                    new_paths.append(path)
+            new_users = []
+            for path in new_paths:
+                cei = self._get_xml_optional(path)
+                if cei is None:
+                    continue
+                email = normalize_string(
+                    cei.findtext(".//atom:email", "", NAMESPACES)
+                ).lower()
+                editor = users_by_email.get(email, None)
+                if editor is not None and email not in sample.users:
+                    sample.users.add(email)
+                    new_users.append(editor)
+            new_paths = []
+        sample.archives.update(fond.split("/", 1)[0] for fond in sample.fonds)
+        sampled_users = [user for user in users if user.email.lower() in sample.users]
+        sample.counts["users"] = (len(sampled_users), len(users))
+        sample.counts["archives"] = (len(sample.archives), len(archives))
+        sample.counts["fonds"] = (len(sample.fonds), len(fond_paths))
+        sample.counts["collections"] = (len(sample.collections), len(collection_paths))
+        sample.counts["charters"] = (
+            len(sample.charter_paths),
+            sum(len(paths) for paths in fond_paths.values())
+            + sum(len(paths) for paths in collection_paths.values()),
+        )
+        sample.counts["saved charters"] = (
+            sum(len(user.saved_charters) for user in sampled_users),
+            sum(len(user.saved_charters) for user in users),
+        )
+        self.sample = sample
+        return sampled_users
@@ -0,0 +1,84 @@
+import os
+from typing import Dict, Iterable, List, Sequence
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from modules.logger import Logger
+from modules.models.table_store import TABLES, TableStore
+
+log = Logger()
+
+_TYPES: Dict[str, pa.DataType] = {
+    "BOOLEAN": pa.bool_(),
+    "DATE": pa.date32(),
+    "INTEGER": pa.int32(),
+    "TEXT": pa.string(),
+    "TIMESTAMP": pa.timestamp("us", tz="UTC"),
+}
+
+SCHEMAS: Dict[str, pa.Schema] = {
+    table: pa.schema([(name, _TYPES[type]) for name, type in columns])
+    for table, columns in TABLES.items()
+}
+
+
+class ParquetDb(TableStore):
+    """
+    Writes the relational shape produced by `CharterDb` as one Parquet file per table
+    into the directory at `path`, in record batches of `batch_size` rows.
+    Can be used in place of `CharterDb` in the import.
+    """
+
+    def __init__(self, path: str, batch_size: int = 10000):
+        super().__init__()
+        self._path = path
+        self._batch_size = batch_size
+        self._writers: Dict[str, pq.ParquetWriter] = {}
+        self._buffers: Dict[str, List[Sequence]] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, __exc_type__, __exc_val__, __exc_tb__):
+        self._close()
+
+    def _close(self):
+        for table in list(self._writers.keys()):
+            self._flush(table)
+            self._writers[table].close()
+        self._writers = {}
+        self._buffers = {}
+
+    def _flush(self, table: str):
+        rows = self._buffers.get(table, [])
+        if len(rows) == 0:
+            return
+        schema = SCHEMAS[table]
+        columns = [
+            pa.array([row[i] for row in rows], type=field.type)
+            for i, field in enumerate(schema)
+        ]
+        self._writers[table].write_batch(
+            pa.RecordBatch.from_arrays(columns, schema=schema)
+        )
+        self._buffers[table] = []
+
+    def _write(self, table: str, rows: Iterable[Sequence]):
+        buffer = self._buffers[table]
+        for row in rows:
+            buffer.append(row)
+            if len(buffer) >= self._batch_size:
+                self._flush(table)
+                buffer = self._buffers[table]
+
+    def setup_db(self):
+        os.makedirs(self._path, exist_ok=True)
+        self._close()
+        self._reset_ids()
+        for table, schema in SCHEMAS.items():
+            self._writers[table] = pq.ParquetWriter(
+                os.path.join(self._path, f"{table}.parquet"), schema
+            )
+            self._buffers[table] = []
+        log.debug(f"Writing parquet files to {self._path}")
@@ -22,3 +22,9 @@ class SerialIDGenerator(_Borg):
             self.counters[class_name] = 0
         self.counters[class_name] += 1
         return self.counters[class_name]
+
+    def start_at(self, type: Type[T], first_id: int):
+        """
+        Makes `first_id` the next id of `type`.
+        """
+        self.counters[type.__name__] = first_id - 1
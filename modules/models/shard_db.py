@@ -0,0 +1,109 @@
+import os
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from modules.logger import Logger
+from modules.models.parquet_db import ParquetDb
+from modules.models.xml_mycharter import XmlMycharter
+from modules.models.xml_saved_charter import XmlSavedCharter
+from modules.models.xml_user import XmlUser
+from modules.shard import Shard
+
+log = Logger()
+
+# Tables that every shard parses in full and only the first shard writes
+GLOBAL_TABLES = [
+    "archives",
+    "collection_fonds",
+    "collections",
+    "fonds",
+    "index_locations",
+    "persons",
+    "private_collections",
+    "users",
+]
+
+# Links to charters that can be on another shard, by the atom id of the charter
+LINKS_FILE = "links.parquet"
+LINKS_SCHEMA = pa.schema(
+    [
+        ("kind", pa.string()),
+        ("id", pa.int32()),
+        ("atom_id", pa.string()),
+        ("note", pa.string()),
+    ]
+)
+SAVED_ORIGINAL = "saved original"
+MYCHARTER_SOURCE = "mycharter source"
+BOOKMARK = "bookmark"
+
+# Stands in for the id of an original charter until the merge resolves it
+UNRESOLVED_ID = 0
+
+
+class ShardDb(ParquetDb):
+    """
+    Writes the output of one shard of a sharded import as Parquet files into the
+    directory at `path`. Tables in `GLOBAL_TABLES` and the images of the image
+    server are only written by the first shard. Saved charter originals, mycharter
+    sources and bookmarks are written to `LINKS_FILE` by the atom id of the
+    charter instead, for `ShardMerge` to resolve.
+    """
+
+    def __init__(self, path: str, shard: Shard, batch_size: int = 10000):
+        super().__init__(path, batch_size)
+        self.shard = shard
+        self._links: List[Tuple[str, int, str, None | str]] = []
+
+    def _close(self):
+        if len(self._writers) > 0:
+            pq.write_table(
+                pa.Table.from_arrays(
+                    [
+                        pa.array([link[i] for link in self._links], type=field.type)
+                        for i, field in enumerate(LINKS_SCHEMA)
+                    ],
+                    schema=LINKS_SCHEMA,
+                ),
+                os.path.join(self._path, LINKS_FILE),
+            )
+        self._links = []
+        super()._close()
+
+    def _write(self, table: str, rows: Iterable[Sequence]):
+        if self.shard.index != 0 and table in GLOBAL_TABLES:
+            return
+        super()._write(table, rows)
+
+    def _original_charter_id(self, charter: XmlSavedCharter) -> None | int:
+        self._links.append((SAVED_ORIGINAL, charter.id, charter.atom_id, None))
+        return UNRESOLVED_ID
+
+    def setup_db(self):
+        super().setup_db()
+        log.info(f"Writing {self.shard.name} to {self._path}")
+
+    def insert_images(self, images: Iterable[str]) -> int:
+        if self.shard.index != 0:
+            return 0
+        return super().insert_images(images)
+
+    def insert_user_charter_bookmarks(self, users: List[XmlUser]):
+        notes: Dict[Tuple[int, str], None | str] = {}
+        for user in users:
+            for bookmark in user.bookmarks:
+                notes.setdefault((user.id, bookmark.atom_id), bookmark.note)
+        self._links.extend(
+            (BOOKMARK, user_id, atom_id, note)
+            for (user_id, atom_id), note in notes.items()
+        )
+
+    def insert_private_mycharters(self, charters: List[XmlMycharter]):
+        self._links.extend(
+            (MYCHARTER_SOURCE, charter.id, charter.source_atom_id, None)
+            for charter in charters
+            if charter.source_charter_id is None and charter.source_atom_id is not None
+        )
+        super().insert_private_mycharters(charters)
@@ -0,0 +1,133 @@
+import os
+import sqlite3
+from datetime import date, datetime
+from typing import Iterable, List, Sequence, Tuple
+
+from lxml import etree
+
+from modules.constants import DiagnosticView
+from modules.logger import Logger
+from modules.models.charter_db import _read_sql_file
+from modules.models.table_store import TABLES, TableStore, _text_content
+
+log = Logger()
+
+
+def _mom_text_content(xpath: str, xml: None | str) -> None | str:
+    """
+    SQLite version of the `mom_text_content` SQL function.
+    """
+    if xml is None:
+        return None
+    return _text_content(etree.fromstring(xml), xpath)
+
+
+def _adapt(value):
+    # Store dates as ISO strings, as the default sqlite3 adapters are deprecated
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _is_indexed(name: str, type: str) -> bool:
+    return name == "atom_id" or (type == "INTEGER" and name.endswith("_id"))
+
+
+class SqliteDb(TableStore):
+    """
+    Writes the relational shape produced by `CharterDb` into an embedded SQLite database
+    at `path`, so that the import can run without a Postgres server. XML columns are
+    stored as text, and the full text columns are computed during the import and
+    indexed with FTS5 in `charters_fulltext`.
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self._path = path
+        self._con: sqlite3.Connection | None = None
+
+    def __enter__(self):
+        self._connect()
+        return self
+
+    def __exit__(self, __exc_type__, __exc_val__, __exc_tb__):
+        self._close()
+
+    def _connect(self):
+        if not self._con:
+            self._con = sqlite3.connect(self._path)
+            self._con.create_function(
+                "mom_text_content", 2, _mom_text_content, deterministic=True
+            )
+            # The database is rebuilt on failure anyway, so skip the journal
+            self._con.execute("PRAGMA journal_mode = OFF")
+            self._con.execute("PRAGMA synchronous = OFF")
+
+    def _close(self):
+        if self._con:
+            self._con.commit()
+            self._con.close()
+            self._con = None
+
+    def _write(self, table: str, rows: Iterable[Sequence]):
+        if not self._con:
+            return
+        columns = TABLES[table]
+        self._con.executemany(
+            f"INSERT INTO {table} VALUES ({', '.join('?' * len(columns))})",
+            ([_adapt(value) for value in row] for row in rows),
+        )
+
+    def setup_db(self):
+        if not self._con:
+            return
+        self._close()
+        if os.path.exists(self._path):
+            os.remove(self._path)
+        self._connect()
+        self._reset_ids()
+        for table, columns in TABLES.items():
+            definitions = [
+                f"{name} {type} PRIMARY KEY" if name == "id" else f"{name} {type}"
+                for name, type in columns
+            ]
+            self._con.execute(f"CREATE TABLE {table} ({', '.join(definitions)})")
+            for name, type in columns:
+                if _is_indexed(name, type):
+                    self._con.execute(
+                        f"CREATE INDEX {table}_{name}_idx ON {table} ({name})"
+                    )
+        self._con.execute(
+            "CREATE VIRTUAL TABLE charters_fulltext USING fts5(abstract_fulltext, tenor_fulltext, content='charters', content_rowid='id')"
+        )
+        self._con.commit()
+        log.debug(f"SQLite database {self._path} created")
+
+    def enable_triggers(self, statement_level: bool = False):
+        """
+        Builds the full text index of the imported charters and keeps it in sync
+        from then on. There are no person name triggers in SQLite.
+        """
+        if not self._con:
+            return
+        self._con.execute(
+            "INSERT INTO charters_fulltext (charters_fulltext) VALUES ('rebuild')"
+        )
+        self._con.executescript(_read_sql_file("sql/sqlite/triggers.sql"))
+        self._con.commit()
+
+    def create_diagnostic_views(self):
+        if not self._con:
+            return
+        self._con.executescript(_read_sql_file("sql/sqlite/views.sql"))
+        self._con.commit()
+
+    def list_diagnostic(
+        self, view: DiagnosticView, limit: None | int = None
+    ) -> List[Tuple]:
+        if not self._con:
+            return []
+        return self._con.execute(
+            f"SELECT * FROM {view.value} LIMIT ?",
+            (limit if limit is not None else -1,),
+        ).fetchall()
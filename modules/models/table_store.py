@@ -0,0 +1,542 @@
+import re
+from abc import abstractmethod
+from typing import Dict, Iterable, List, Sequence, Set, Tuple
+
+from lxml import etree
+
+from modules.constants import NAMESPACES, IndexLocation
+from modules.image_reconciliation import ImageReconciliation
+from modules.logger import Logger
+from modules.models.charter_db import _serialize_xml
+from modules.models.charter_store import CharterStore
+from modules.models.person_index import PersonIndex
+from modules.models.xml_archive import XmlArchive
+from modules.models.xml_charter import XmlCharter
+from modules.models.xml_collection import XmlCollection
+from modules.models.xml_collection_charter import XmlCollectionCharter
+from modules.models.xml_fond import XmlFond
+from modules.models.xml_fond_charter import XmlFondCharter
+from modules.models.xml_mycharter import XmlMycharter
+from modules.models.xml_mycollection import XmlMycollection
+from modules.models.xml_saved_charter import XmlSavedCharter
+from modules.models.xml_user import XmlUser
+from modules.progress import Progress
+
+log = Logger()
+
+_CHARTER_FIELDS = [
+    ("abstract", "TEXT"),
+    ("atom_id", "TEXT"),
+    ("idno_id", "TEXT"),
+    ("idno_text", "TEXT"),
+    ("issued_date_from", "DATE"),
+    ("issued_date_to", "DATE"),
+    ("issued_date_text", "TEXT"),
+    ("sort_date", "DATE"),
+    ("tenor", "TEXT"),
+    ("abstract_fulltext", "TEXT"),
+    ("issuer_text", "TEXT"),
+    ("tenor_fulltext", "TEXT"),
+]
+
+# Same tables as sql/tables.sql and sql/alterations.sql with their column types,
+# with date ranges split into two columns and the generated text columns computed
+# on the client
+TABLES: Dict[str, List[Tuple[str, str]]] = {
+    "users": [
+        ("id", "INTEGER"),
+        ("email", "TEXT"),
+        ("first_name", "TEXT"),
+        ("moderator_id", "INTEGER"),
+        ("name", "TEXT"),
+    ],
+    "index_locations": [("id", "INTEGER"), ("location", "TEXT")],
+    "persons": [
+        ("id", "INTEGER"),
+        ("label", "TEXT"),
+        ("mom_iri", "TEXT"),
+        ("wikidata_iri", "TEXT"),
+    ],
+    "private_collections": [
+        ("id", "INTEGER"),
+        ("atom_id", "TEXT"),
+        ("identifier", "TEXT"),
+        ("title", "TEXT"),
+        ("owner_id", "INTEGER"),
+    ],
+    "collections": [
+        ("id", "INTEGER"),
+        ("atom_id", "TEXT"),
+        ("identifier", "TEXT"),
+        ("image_base", "TEXT"),
+        ("oai_shared", "BOOLEAN"),
+        ("source_collection_id", "INTEGER"),
+        ("title", "TEXT"),
+    ],
+    "archives": [
+        ("id", "INTEGER"),
+        ("atom_id", "TEXT"),
+        ("country_code", "TEXT"),
+        ("name", "TEXT"),
+        ("oai_shared", "BOOLEAN"),
+        ("repository_id", "TEXT"),
+    ],
+    "fonds": [
+        ("id", "INTEGER"),
+        ("archive_id", "INTEGER"),
+        ("atom_id", "TEXT"),
+        ("free_image_access", "BOOLEAN"),
+        ("identifier", "TEXT"),
+        ("image_base", "TEXT"),
+        ("oai_shared", "BOOLEAN"),
+        ("title", "TEXT"),
+    ],
+    "images": [("id", "INTEGER"), ("url", "TEXT"), ("is_external", "BOOLEAN")],
+    "charters": [("id", "INTEGER")]
+    + _CHARTER_FIELDS
+    + [("last_editor_id", "INTEGER"), ("url", "TEXT")],
+    "saved_charters": [("id", "INTEGER")]
+    + _CHARTER_FIELDS
+    + [
+        ("editor_id", "INTEGER"),
+        ("is_released", "BOOLEAN"),
+        ("original_charter_id", "INTEGER"),
+        ("start_time", "TIMESTAMP"),
+        ("url", "TEXT"),
+    ],
+    "private_charters": [("id", "INTEGER")]
+    + _CHARTER_FIELDS
+    + [
+        ("private_collection_id", "INTEGER"),
+        ("source_charter_id", "INTEGER"),
+    ],
+    "private_charter_user_shares": [
+        ("private_charter_id", "INTEGER"),
+        ("user_id", "INTEGER"),
+    ],
+    "collections_charters": [
+        ("collection_id", "INTEGER"),
+        ("charter_id", "INTEGER"),
+        ("private_charter_id", "INTEGER"),
+    ],
+    "fonds_charters": [("fond_id", "INTEGER"), ("charter_id", "INTEGER")],
+    "collection_fonds": [("collection_id", "INTEGER"), ("fond_id", "INTEGER")],
+    "user_charter_bookmarks": [
+        ("user_id", "INTEGER"),
+        ("charter_id", "INTEGER"),
+        ("note", "TEXT"),
+    ],
+    "charters_images": [("charter_id", "INTEGER"), ("image_id", "INTEGER")],
+    "saved_charters_images": [("saved_charter_id", "INTEGER"), ("image_id", "INTEGER")],
+    "private_charters_images": [
+        ("private_charter_id", "INTEGER"),
+        ("image_id", "INTEGER"),
+    ],
+    "person_names": [
+        ("id", "INTEGER"),
+        ("key", "TEXT"),
+        ("location_id", "INTEGER"),
+        ("person_id", "INTEGER"),
+        ("reg", "TEXT"),
+        ("text", "TEXT"),
+    ],
+    "charters_person_names": [("charter_id", "INTEGER"), ("person_name_id", "INTEGER")],
+    "saved_charters_person_names": [
+        ("saved_charter_id", "INTEGER"),
+        ("person_name_id", "INTEGER"),
+    ],
+    "private_charters_person_names": [
+        ("private_charter_id", "INTEGER"),
+        ("person_name_id", "INTEGER"),
+    ],
+    "image_reconciliation": [
+        ("key", "TEXT"),
+        ("url", "TEXT"),
+        ("status", "TEXT"),
+        ("charter_count", "INTEGER"),
+    ],
+    "fonds_image_reconciliation": [
+        ("fond_id", "INTEGER"),
+        ("used_count", "INTEGER"),
+        ("unused_count", "INTEGER"),
+        ("dangling_count", "INTEGER"),
+    ],
+    "collections_image_reconciliation": [
+        ("collection_id", "INTEGER"),
+        ("used_count", "INTEGER"),
+        ("unused_count", "INTEGER"),
+        ("dangling_count", "INTEGER"),
+    ],
+}
+
+
+def _text_content(element: None | etree._Element, xpath: str) -> None | str:
+    """
+    Client-side equivalent of the `mom_text_content` SQL function.
+    """
+    if element is None:
+        return None
+    nodes = element.xpath(xpath, namespaces=NAMESPACES)
+    if len(nodes) == 0:
+        return None
+    return re.sub(r"[\n\r\t]| +", " ", " ".join(str(node) for node in nodes)).strip(" ")
+
+
+def _charter_fields(charter: XmlCharter) -> List:
+    issued_from, issued_to = (
+        charter.issued_date if charter.issued_date is not None else (None, None)
+    )
+    return [
+        _serialize_xml(charter.abstract),
+        charter.atom_id,
+        charter.idno_id,
+        charter.idno_text,
+        issued_from,
+        issued_to,
+        charter.issued_date_text,
+        charter.sort_date,
+        _serialize_xml(charter.tenor),
+        _text_content(charter.abstract, ".//text()"),
+        _text_content(charter.abstract, ".//cei:issuer//text()"),
+        _text_content(charter.tenor, ".//text()"),
+    ]
+
+
+class TableStore(CharterStore):
+    """
+    Base class for stores that receive the relational shape produced by `CharterDb`
+    as plain rows per table in `TABLES`. Ids that `CharterDb` looks up in the database
+    are tracked in memory. Subclasses write the rows in `_write`.
+    """
+
+    def __init__(self):
+        self._charter_ids: Dict[str, int] = {}
+        self._image_ids: Dict[str, int] = {}
+        self._saved_charter_ids: Set[int] = set()
+
+    def _reset_ids(self):
+        self._charter_ids = {}
+        self._image_ids = {}
+        self._saved_charter_ids = set()
+
+    @abstractmethod
+    def _write(self, table: str, rows: Iterable[Sequence]):
+        raise NotImplementedError
+
+    def _image_id(self, url: str) -> int:
+        id = self._image_ids.get(url, None)
+        if id is None:
+            id = len(self._image_ids) + 1
+            self._image_ids[url] = id
+            self._write("images", [(id, url, "images.monasterium.net" not in url)])
+        return id
+
+    def _write_charter_images(self, table: str, charters: Sequence[XmlCharter]):
+        self._write(
+            table,
+            [
+                (charter.id, image_id)
+                for charter in charters
+                for image_id in dict.fromkeys(
+                    self._image_id(image) for image in charter.images
+                )
+            ],
+        )
+
+    def _write_public_charters(
+        self, charters: Sequence[XmlFondCharter | XmlCollectionCharter]
+    ):
+        self._write(
+            "charters",
+            [
+                [charter.id]
+                + _charter_fields(charter)
+                + [charter.last_editor_id, charter.url]
+                for charter in charters
+            ],
+        )
+        for charter in charters:
+            self._charter_ids[charter.atom_id] = charter.id
+        self._write_charter_images("charters_images", charters)
+
+    def _write_person_names(
+        self, link_table: str, charters: Sequence[XmlCharter], progress: Progress
+    ):
+        for charter in charters:
+            progress.step()
+            self._write(
+                "person_names",
+                [
+                    (
+                        name.id,
+                        name.key,
+                        name.location.value,
+                        name.person_id,
+                        name.reg,
+                        name.text,
+                    )
+                    for name in charter.person_names
+                ],
+            )
+            self._write(
+                link_table,
+                [(name.charter_id, name.id) for name in charter.person_names],
+            )
+
+    def _original_charter_id(self, charter: XmlSavedCharter) -> None | int:
+        """
+        Returns the id of the original charter of the saved `charter`, or `None` if
+        it wasn't written and the saved charter is skipped.
+        """
+        return self._charter_ids.get(charter.atom_id, None)
+
+    def insert_index_locations(self):
+        self._write(
+            "index_locations",
+            [(location.value, location.name) for location in IndexLocation],
+        )
+
+    def insert_users(self, users: List[XmlUser]):
+        email_id_map = {user.email.lower(): user.id for user in users}
+        records = []
+        for user in users:
+            moderator_id = None
+            if user.moderater_email is not None:
+                moderator_id = email_id_map.get(user.moderater_email.lower())
+                if moderator_id == user.id:
+                    moderator_id = None
+            records.append(
+                (user.id, user.email, user.first_name, moderator_id, user.name)
+            )
+        self._write("users", records)
+
+    def insert_images(self, images: Iterable[str]) -> int:
+        start_count = len(self._image_ids)
+        for image in images:
+            self._image_id(image)
+        return len(self._image_ids) - start_count
+
+    def insert_archives(self, archives: List[XmlArchive]):
+        self._write(
+            "archives",
+            [
+                (
+                    archive.id,
+                    archive.atom_id,
+                    archive.countrycode,
+                    archive.name,
+                    archive.oai is not None,
+                    archive.repository_id,
+                )
+                for archive in archives
+            ],
+        )
+
+    def insert_fonds(self, fonds: List[XmlFond]):
+        self._write(
+            "fonds",
+            [
+                (
+                    fond.id,
+                    fond.archive_id,
+                    fond.atom_id,
+                    fond.free_image_access,
+                    fond.identifier,
+                    fond.image_base,
+                    fond.oai_shared,
+                    fond.title,
+                )
+                for fond in fonds
+            ],
+        )
+
+    def insert_fonds_charters(self, charters: List[XmlFondCharter]):
+        self._write_public_charters(charters)
+        self._write(
+            "fonds_charters", [(charter.fond_id, charter.id) for charter in charters]
+        )
+
+    def insert_collections(self, collections: List[XmlCollection]):
+        self._write(
+            "collections",
+            [
+                (
+                    collection.id,
+                    collection.atom_id,
+                    collection.identifier,
+                    collection.image_base,
+                    collection.oai_shared,
+                    None,
+                    collection.title,
+                )
+                for collection in collections
+            ],
+        )
+        self._write(
+            "collection_fonds",
+            [
+                (collection.id, fond_id)
+                for collection in collections
+                for fond_id in collection.linked_fonds
+            ],
+        )
+
+    def insert_collections_charters(self, charters: List[XmlCollectionCharter]):
+        self._write_public_charters(charters)
+        self._write(
+            "collections_charters",
+            [(charter.collection_id, charter.id, None) for charter in charters],
+        )
+
+    def insert_user_charter_bookmarks(self, users: List[XmlUser]):
+        records: Dict[Tuple[int, int], None | str] = {}
+        for user in users:
+            for bookmark in user.bookmarks:
+                charter_id = self._charter_ids.get(bookmark.atom_id, None)
+                if charter_id is not None and (user.id, charter_id) not in records:
+                    records[(user.id, charter_id)] = bookmark.note
+        self._write(
+            "user_charter_bookmarks",
+            [
+                (user_id, charter_id, note)
+                for (user_id, charter_id), note in records.items()
+            ],
+        )
+
+    def insert_saved_charters(self, charters: List[XmlSavedCharter]):
+        valid_charters = []
+        records = []
+        for charter in charters:
+            if charter.url is None:
+                log.warn(
+                    f"URL not found for saved charter {charter.atom_id}",
+                    "saved charter url",
+                )
+                continue
+            original_id = self._original_charter_id(charter)
+            if original_id is None:
+                log.warn(
+                    f"Original charter not found for saved charter {charter.atom_id}",
+                    "saved charter original",
+                )
+                continue
+            records.append(
+                [charter.id]
+                + _charter_fields(charter)
+                + [
+                    charter.editor_id,
+                    charter.released,
+                    original_id,
+                    charter.start_time,
+                    charter.url,
+                ]
+            )
+            valid_charters.append(charter)
+            self._saved_charter_ids.add(charter.id)
+        self._write("saved_charters", records)
+        self._write_charter_images("saved_charters_images", valid_charters)
+
+    def insert_private_collections(self, mycollections: List[XmlMycollection]):
+        self._write(
+            "private_collections",
+            [
+                (
+                    mycollection.id,
+                    mycollection.atom_id,
+                    mycollection.identifier,
+                    mycollection.title,
+                    mycollection.owner_id,
+                )
+                for mycollection in mycollections
+            ],
+        )
+
+    def insert_public_mycollections(self, mycollections: List[XmlMycollection]):
+        self._write(
+            "collections",
+            [
+                (
+                    mycollection.id,
+                    mycollection.atom_id,
+                    mycollection.identifier,
+                    None,
+                    mycollection.oai_shared,
+                    mycollection.private_mycollection_id,
+                    mycollection.title,
+                )
+                for mycollection in mycollections
+            ],
+        )
+
+    def insert_private_mycharters(self, charters: List[XmlMycharter]):
+        self._write(
+            "private_charters",
+            [
+                [charter.id]
+                + _charter_fields(charter)
+                + [charter.collection_id, charter.source_charter_id]
+                for charter in charters
+            ],
+        )
+        self._write(
+            "private_charter_user_shares",
+            [
+                (charter.id, user_id)
+                for charter in charters
+                for user_id in charter.shared_with_user_ids
+            ],
+        )
+        self._write_charter_images("private_charters_images", charters)
+
+    def insert_public_mycharters(self, charters: List[XmlCollectionCharter]):
+        self._write_public_charters(charters)
+        self._write(
+            "collections_charters",
+            [
+                (charter.collection_id, charter.id, charter.source_mycharter_id)
+                for charter in charters
+            ],
+        )
+
+    def insert_persons(
+        self,
+        person_index: PersonIndex,
+        public_charters: List[XmlFondCharter | XmlCollectionCharter],
+        private_charters: List[XmlMycharter],
+        saved_charters: List[XmlSavedCharter],
+    ):
+        self._write(
+            "persons",
+            [
+                (
+                    person.id,
+                    ";".join(person.names),
+                    person.mom_iri,
+                    person.wikidata_iri,
+                )
+                for person in person_index.list_persons()
+            ],
+        )
+        # Skip person names of saved charters that could not be written
+        saved_charters = [
+            charter
+            for charter in saved_charters
+            if charter.id in self._saved_charter_ids
+        ]
+        progress = Progress(
+            "persons",
+            len(public_charters) + len(private_charters) + len(saved_charters),
+        )
+        self._write_person_names("charters_person_names", public_charters, progress)
+        self._write_person_names(
+            "private_charters_person_names", private_charters, progress
+        )
+        self._write_person_names(
+            "saved_charters_person_names", saved_charters, progress
+        )
+        progress.done()
+
+    def insert_image_reconciliation(self, reconciliation: ImageReconciliation):
+        self._write("image_reconciliation", reconciliation.images)
+        self._write("fonds_image_reconciliation", reconciliation.fonds)
+        self._write("collections_image_reconciliation", reconciliation.collections)
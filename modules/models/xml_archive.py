@@ -4,7 +4,7 @@ from lxml import etree
 
 from modules.constants import NAMESPACES
 from modules.models.serial_id_generator import SerialIDGenerator
-from modules.utils import normalize_string
+from modules.utils import intern_string, normalize_string
 
 
 class Oai:
@@ -35,7 +35,7 @@ class XmlArchive:
         self.id = SerialIDGenerator().get_serial_id(XmlArchive)
 
         # file
-        self.file = file
+        self.file = intern_string(file)
 
         # atom_id
         self.atom_id = eag.findtext("./atom:id", "", NAMESPACES)
@@ -1,9 +1,9 @@
 import calendar
 import re
 from datetime import date
-from typing import List, Set, Type
+from functools import lru_cache
+from typing import Iterable, List, Set, Tuple, Type
 
-import validators
 from lxml import etree
 
 from modules.constants import NAMESPACES, IndexLocation
@@ -12,7 +12,12 @@ from modules.models.person_index import PersonIndex
 from modules.models.serial_id_generator import SerialIDGenerator, T
 from modules.models.xml_person_name import XmlPersonName
 from modules.models.xml_user import XmlUser
-from modules.utils import join_url_parts, normalize_string
+from modules.utils import (
+    intern_string,
+    is_valid_url,
+    join_url_parts,
+    normalize_string,
+)
 
 log = Logger()
 
@@ -24,51 +29,60 @@ MIN_YEAR = 100
 MAX_YEAR = year = date.today().year
 
 
-def _parse_date(value: str) -> List[date]:
+# Days per month in common and in leap years
+_MONTH_DAYS = (
+    (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31),
+    (31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31),
+)
+
+
+@lru_cache(maxsize=65536)
+def _decode_date(value: str) -> Tuple[date, ...]:
+    """
+    Decodes a MOM date value into the dates it spans. Results are memoized, as the same
+    values repeat across charters. Invalid values raise a `ValueError` every time.
+    """
     if value == "99999999" or value == "00000000":
-        return []
-    match = re.search(MOM_DATE_REGEX, value)
+        return ()
+    match = MOM_DATE_REGEX.search(value)
     if match is None:
         raise ValueError("Invalid mom date value provided: '{}'".format(value))
-    year = match.group("year")
-    if not isinstance(year, str):
-        raise ValueError("Invalid year in mom date value: {}".format(year))
-    if int(year) < MIN_YEAR or int(year) > MAX_YEAR:
-        return []
+    year = int(match.group("year"))
+    if year < MIN_YEAR or year > MAX_YEAR:
+        return ()
     month = match.group("month")
-    if not isinstance(month, str):
-        raise ValueError("Invalid month in mom date value: {}".format(month))
     day = match.group("day")
-    if not isinstance(day, str):
-        raise ValueError("Invalid day in mom date value: {}".format(day))
     if month == "99" or month == "00":
-        return [
-            date(int(year), 1, 1),
-            date(
-                int(year),
-                12,
-                31,
-            ),
-        ]
+        return (date(year, 1, 1), date(year, 12, 31))
     if day == "99" or day == "00":
-        return [
-            date(int(year), int(month), 1),
-            date(
-                int(year),
-                int(month),
-                calendar.monthrange(int(year), int(month))[1],
-            ),
-        ]
-    return [date(int(year), int(month), int(day))]
-
-
-def _extract_date_attrib(element: None | etree._Element, name: str) -> List[date]:
+        first = date(year, int(month), 1)
+        return (
+            first,
+            first.replace(day=_MONTH_DAYS[calendar.isleap(year)][first.month - 1]),
+        )
+    return (date(year, int(month), int(day)),)
+
+
+def _parse_date(value: str) -> List[date]:
+    return list(_decode_date(value))
+
+
+def _parse_dates(values: Iterable[None | str]) -> List[date]:
+    """
+    Decodes a batch of MOM date values, skipping missing ones, and returns the distinct
+    dates they span in order.
+    """
+    dates: Set[date] = set()
+    for value in values:
+        if value is not None:
+            dates.update(_decode_date(value))
+    return sorted(dates)
+
+
+def _get_attrib(element: None | etree._Element, name: str) -> None | str:
     if element is None:
-        return []
-    value = element.attrib.get(name, None)
-    if value is None:
-        return []
-    return _parse_date(value)
+        return None
+    return element.attrib.get(name, None)
 
 
 def _extract_opt_text(element: None | etree._Element) -> None | str:
@@ -96,6 +110,9 @@ class XmlCharter:
         # file
         self.file = file
 
+        # content_hash, set by the backup from the source file
+        self.content_hash = ""
+
         # url
         self.url = url
 
@@ -111,7 +128,7 @@ class XmlCharter:
                     if image_base is not None
                     else None
                 )
-                if full_url and validators.url(full_url):
+                if full_url and is_valid_url(full_url):
                     self.images.append(full_url)
 
         # atom_id
@@ -149,23 +166,28 @@ class XmlCharter:
         )
         if date_single_element is not None or date_range_element is not None:
             try:
-                date_set: Set[date] = set()
-                date_set = date_set.union(
-                    _extract_date_attrib(date_single_element, "value"),
-                    _extract_date_attrib(date_range_element, "from"),
-                    _extract_date_attrib(date_range_element, "to"),
+                dates = _parse_dates(
+                    [
+                        _get_attrib(date_single_element, "value"),
+                        _get_attrib(date_range_element, "from"),
+                        _get_attrib(date_range_element, "to"),
+                    ]
                 )
-                dates: List[date] = list(date_set)
-                dates.sort()
                 if len(dates) == 0:
                     pass
                 elif len(dates) <= 4:
                     self.sort_date = dates[-1]
                     self.issued_date = (dates[0], dates[-1])
                 elif len(dates) > 2:
-                    log.warn(f"Too many dates found for charter {self.atom_id}")
+                    log.warn(
+                        f"Too many dates found for charter {self.atom_id}",
+                        "date parsing",
+                    )
             except ValueError as e:
-                log.warn(f"Error parsing date for charter {self.atom_id}: {e}")
+                log.warn(
+                    f"Error parsing date for charter {self.atom_id}: {e}",
+                    "date parsing",
+                )
             if self.issued_date is not None:
                 self.issued_date_is_exact = self.issued_date[0] == self.issued_date[1]
             single_text = _extract_opt_text(date_single_element)
@@ -182,7 +204,10 @@ class XmlCharter:
                 if single_text == range_text:
                     self.issued_date_text = single_text
                 else:
-                    log.warn(f"Conflicting date texts found for charter {self.atom_id}")
+                    log.warn(
+                        f"Conflicting date texts found for charter {self.atom_id}",
+                        "conflicting date texts",
+                    )
                     self.issued_date_text = single_text
             else:
                 self.issued_date_text = (
@@ -202,7 +227,7 @@ class XmlCharter:
                 None,
             )
             # last_editor_email
-            self.last_editor_email = email
+            self.last_editor_email = intern_string(email)
 
         # person_names
         self.person_names: List[XmlPersonName] = []
@@ -273,7 +298,8 @@ class XmlCharter:
                 else:
                     if name.wikidata_iri or name.key:
                         log.warn(
-                            f"Person not found in index for charter {self.atom_id}: {name.text} / {name.wikidata_iri} / {name.key}"
+                            f"Person not found in index for charter {self.atom_id}: {name.text} / {name.wikidata_iri} / {name.key}",
+                            "person not in index",
                         )
                 self.person_names.append(name)
             except Exception as e:
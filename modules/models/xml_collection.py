@@ -1,13 +1,12 @@
 from typing import List, Type
 
-import validators
 from lxml import etree
 
 from modules.constants import NAMESPACES
 from modules.models.serial_id_generator import SerialIDGenerator, T
 from modules.models.xml_fond import XmlFond
 from modules.models.xml_fond_charter import join_url_parts
-from modules.utils import normalize_string
+from modules.utils import intern_string, is_valid_url, normalize_string
 
 
 class XmlCollection:
@@ -24,7 +23,7 @@ class XmlCollection:
         )
 
         # file
-        self.file = file
+        self.file = intern_string(file)
 
         # atom_id
         self.atom_id = cei.findtext("./atom:id", "", NAMESPACES)
@@ -64,8 +63,8 @@ class XmlCollection:
             if address == "images.monasterium.net":
                 address = "http://images.monasterium.net"
             url = join_url_parts(address, folder) if folder != "" else address
-            if validators.url(url):
-                self.image_base = url
+            if is_valid_url(url):
+                self.image_base = intern_string(url)
 
         # linked_fonds
         self.linked_fonds = []
@@ -1,10 +1,9 @@
-import validators
 from lxml import etree
 
 from modules.constants import NAMESPACES
 from modules.models.serial_id_generator import SerialIDGenerator
 from modules.models.xml_archive import XmlArchive
-from modules.utils import normalize_string
+from modules.utils import intern_string, is_valid_url, normalize_string
 
 
 class XmlFond:
@@ -19,7 +18,7 @@ class XmlFond:
         self.id = SerialIDGenerator().get_serial_id(XmlFond)
 
         # file
-        self.file = file
+        self.file = intern_string(file)
 
         # atom_id
         self.atom_id = ead.findtext("./atom:id", "", NAMESPACES)
@@ -72,6 +71,6 @@ class XmlFond:
             )
             self.image_base = (
                 None
-                if image_base == "" or not validators.url(image_base)
-                else image_base
+                if image_base == "" or not is_valid_url(image_base)
+                else intern_string(image_base)
             )
@@ -2,6 +2,7 @@ from lxml import etree
 
 from modules.constants import NAMESPACES
 from modules.models.serial_id_generator import SerialIDGenerator
+from modules.utils import intern_string
 
 
 class Name:
@@ -33,8 +34,10 @@ class XmlIndexPerson:
             ".//momtei:idno[@type='URI']", None, NAMESPACES
         )
         if self.wikidata_iri is not None:
-            self.wikidata_iri = self.wikidata_iri.replace(
-                "http://wikidata.org/", "http://www.wikidata.org/"
+            self.wikidata_iri = intern_string(
+                self.wikidata_iri.replace(
+                    "http://wikidata.org/", "http://www.wikidata.org/"
+                )
             )
 
         # names
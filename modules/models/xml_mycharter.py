@@ -67,7 +67,10 @@ class XmlMycharter(XmlCharter):
             if user_email in users:
                 id = users[user_email].id
                 if id in unique_ids:
-                    log.warn(f"User {user_email} already shared with charter {self.id}")
+                    log.warn(
+                        f"User {user_email} already shared with charter {self.id}",
+                        "duplicate share",
+                    )
                     continue
                 unique_ids[id] = id
             self.shared_with_user_ids = list(unique_ids.keys())
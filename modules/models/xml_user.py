@@ -5,7 +5,7 @@ from lxml import etree
 from modules.constants import NAMESPACES
 from modules.logger import Logger
 from modules.models.serial_id_generator import SerialIDGenerator
-from modules.utils import normalize_string, parse_date
+from modules.utils import intern_string, normalize_string, parse_date
 
 log = Logger()
 
@@ -48,7 +48,9 @@ class XmlUser:
         self.file = file
 
         # email
-        self.email = normalize_string(xrx.findtext("./xrx:email", "", NAMESPACES))
+        self.email = intern_string(
+            normalize_string(xrx.findtext("./xrx:email", "", NAMESPACES))
+        )
         assert self.email != ""
 
         # first_name
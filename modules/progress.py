@@ -0,0 +1,71 @@
+import time
+
+from modules.logger import Logger
+
+log = Logger()
+
+# Number of steps between two looks at the clock
+_CHECK_EVERY = 64
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+class Progress:
+    """
+    Logs the count, rate and ETA of a long running loop over `total` items at most
+    every `interval` seconds. The clock is only read every few steps, so that
+    stepping costs no more than an addition and a comparison. An interval of 0
+    disables the updates.
+    """
+
+    interval = 10.0
+
+    def __init__(self, name: str, total: int):
+        self.name = name
+        self.total = total
+        self.count = 0
+        self._start = time.perf_counter()
+        self._last = self._start
+        self._next_check = _CHECK_EVERY
+
+    def step(self, count: int = 1):
+        self.count += count
+        if self.count >= self._next_check:
+            self._next_check = self.count + _CHECK_EVERY
+            now = time.perf_counter()
+            if self.interval > 0 and now - self._last >= self.interval:
+                self._last = now
+                self._log(now)
+
+    def _log(self, now: float):
+        elapsed = now - self._start
+        rate = self.count / elapsed if elapsed > 0 else 0.0
+        if self.total > 0 and rate > 0:
+            percent = min(self.count / self.total, 1.0) * 100
+            remaining = max(self.total - self.count, 0) / rate
+            log.info(
+                f"{self.name}: {self.count}/{self.total} ({percent:.1f}%), "
+                f"{rate:.1f}/s, ETA {_format_duration(remaining)}"
+            )
+        else:
+            log.info(f"{self.name}: {self.count}, {rate:.1f}/s")
+
+    def done(self):
+        """
+        Logs the final count and rate, if any update was logged before.
+        """
+        if self._last == self._start:
+            return
+        elapsed = time.perf_counter() - self._start
+        rate = self.count / elapsed if elapsed > 0 else 0.0
+        log.info(
+            f"{self.name}: {self.count}/{self.total} done in "
+            f"{_format_duration(elapsed)}, {rate:.1f}/s"
+        )
@@ -0,0 +1,48 @@
+import hashlib
+from typing import Callable, Iterable, List, TypeVar
+
+from modules.models.serial_id_generator import SerialIDGenerator
+from modules.models.xml_charter import XmlCharter
+from modules.models.xml_mycharter import XmlMycharter
+from modules.models.xml_person_name import XmlPersonName
+from modules.models.xml_saved_charter import XmlSavedCharter
+
+# Largest id of a Postgres INTEGER column
+_MAX_ID = 2**31 - 1
+
+T = TypeVar("T")
+
+
+class Shard:
+    """
+    One of `count` slices of a sharded import. A shard owns the archives,
+    collections and users whose name hashes to its `index` and only parses their
+    charters. Users, archives, fonds, collections and persons are parsed in full by
+    every shard, so that their ids are the same everywhere. Charters and person
+    names get their ids from a range of `id_range` ids reserved for the shard.
+    """
+
+    def __init__(self, count: int, index: int, id_range: int = 100_000_000):
+        if index < 0 or index >= count:
+            raise ValueError(f"Shard index {index} is not within {count} shards")
+        if count * id_range > _MAX_ID:
+            raise ValueError(f"{count} shards of {id_range} ids exceed integer ids")
+        self.count = count
+        self.index = index
+        self.id_range = id_range
+        self.name = f"shard_{index}_of_{count}"
+
+    def owns(self, key: str) -> bool:
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big") % self.count == self.index
+
+    def select(self, items: Iterable[T], key: Callable[[T], str]) -> List[T]:
+        """
+        Returns the `items` whose `key` the shard owns.
+        """
+        return [item for item in items if self.owns(key(item))]
+
+    def reserve_ids(self):
+        first_id = self.index * self.id_range + 1
+        for type in [XmlCharter, XmlSavedCharter, XmlMycharter, XmlPersonName]:
+            SerialIDGenerator().start_at(type, first_id)
@@ -0,0 +1,177 @@
+import os
+import re
+from typing import Dict, Iterator, List, Sequence, Set, Tuple
+
+import pyarrow.parquet as pq
+
+from modules.logger import Logger
+from modules.models.charter_db import CharterDb, _dates_to_range
+from modules.models.shard_db import (
+    BOOKMARK,
+    LINKS_FILE,
+    MYCHARTER_SOURCE,
+    SAVED_ORIGINAL,
+)
+from modules.models.table_store import TABLES
+
+log = Logger()
+
+# Columns of the Parquet files that Postgres generates itself
+_GENERATED_COLUMNS = ["abstract_fulltext", "issuer_text", "tenor_fulltext"]
+
+
+def _columns(table: str) -> List[str]:
+    """
+    Returns the Postgres columns of `table`, with the date range columns joined.
+    """
+    columns: List[str] = []
+    for name, _ in TABLES[table]:
+        if name in _GENERATED_COLUMNS or name == "issued_date_to":
+            continue
+        columns.append("issued_date" if name == "issued_date_from" else name)
+    return columns
+
+
+def list_shards(path: str) -> List[str]:
+    """
+    Returns the shard directories in `path` ordered by their index. Raises an
+    exception if shards are missing or stem from imports with different counts.
+    """
+    shards: Dict[int, str] = {}
+    counts: Set[int] = set()
+    for name in os.listdir(path):
+        match = re.fullmatch(r"shard_(\d+)_of_(\d+)", name)
+        if match is None:
+            continue
+        shards[int(match.group(1))] = os.path.join(path, name)
+        counts.add(int(match.group(2)))
+    if len(counts) != 1:
+        raise Exception(f"Expected the shards of a single import in {path}")
+    count = counts.pop()
+    missing = [index for index in range(count) if index not in shards]
+    if len(missing) > 0:
+        raise Exception(f"Shards {missing} of {count} are missing in {path}")
+    return [shards[index] for index in range(count)]
+
+
+class ShardMerge:
+    """
+    Merges the Parquet outputs of all shards of a sharded import. Image ids are
+    local to each shard and are renumbered by URL. Links to charters on any shard,
+    such as the originals of saved charters, the sources of mycharters and the
+    bookmarks, are resolved by atom id. Charters that exist on more than one shard
+    are only kept on the first, like the import does for duplicate charters.
+    """
+
+    def __init__(self, paths: List[str]):
+        self.paths = paths
+        self._images: Dict[str, Tuple[int, bool]] = {}
+        self._shard_image_ids: List[Dict[int, int]] = []
+        self._charter_ids: Dict[str, int] = {}
+        self._dropped_charters: Set[int] = set()
+        self._dropped_saved_charters: Set[int] = set()
+        self._originals: Dict[int, int] = {}
+        self._sources: Dict[int, int] = {}
+        self._bookmarks: Dict[Tuple[int, int], None | str] = {}
+
+    def _read(self, path: str, file: str, columns: None | List[str] = None):
+        """
+        Yields the rows of the Parquet `file` in the shard at `path` as dicts.
+        """
+        file_path = os.path.join(path, file)
+        if not os.path.exists(file_path):
+            return
+        for batch in pq.ParquetFile(file_path).iter_batches(columns=columns):
+            yield from batch.to_pylist()
+
+    def _resolve(self):
+        for path in self.paths:
+            image_ids: Dict[int, int] = {}
+            for row in self._read(path, "images.parquet"):
+                image = self._images.setdefault(
+                    row["url"], (len(self._images) + 1, row["is_external"])
+                )
+                image_ids[row["id"]] = image[0]
+            self._shard_image_ids.append(image_ids)
+            for row in self._read(path, "charters.parquet", ["id", "atom_id"]):
+                if row["atom_id"] in self._charter_ids:
+                    log.warn(
+                        f"Duplicate charter {row['atom_id']} in {path}. Skipping",
+                        "duplicate charter",
+                    )
+                    self._dropped_charters.add(row["id"])
+                else:
+                    self._charter_ids[row["atom_id"]] = row["id"]
+        for path in self.paths:
+            for link in self._read(path, LINKS_FILE):
+                charter_id = self._charter_ids.get(link["atom_id"], None)
+                if link["kind"] == SAVED_ORIGINAL:
+                    if charter_id is None:
+                        log.warn(
+                            f"Original charter not found for saved charter {link['atom_id']}",
+                            "saved charter original",
+                        )
+                        self._dropped_saved_charters.add(link["id"])
+                    else:
+                        self._originals[link["id"]] = charter_id
+                elif charter_id is None:
+                    continue
+                elif link["kind"] == MYCHARTER_SOURCE:
+                    self._sources[link["id"]] = charter_id
+                elif link["kind"] == BOOKMARK:
+                    self._bookmarks.setdefault((link["id"], charter_id), link["note"])
+
+    def _rows(self, table: str) -> Iterator[Sequence]:
+        columns = _columns(table)
+        if table == "images":
+            for url, (id, is_external) in self._images.items():
+                yield (id, url, is_external)
+            return
+        if table == "user_charter_bookmarks":
+            for (user_id, charter_id), note in self._bookmarks.items():
+                yield (user_id, charter_id, note)
+            return
+        for shard, path in enumerate(self.paths):
+            for row in self._read(path, f"{table}.parquet"):
+                if row.get("charter_id", None) in self._dropped_charters:
+                    continue
+                if row.get("saved_charter_id", None) in self._dropped_saved_charters:
+                    continue
+                if "image_id" in row:
+                    row["image_id"] = self._shard_image_ids[shard][row["image_id"]]
+                if "issued_date_from" in row:
+                    row["issued_date"] = (
+                        None
+                        if row["issued_date_from"] is None
+                        else _dates_to_range(
+                            (row["issued_date_from"], row["issued_date_to"])
+                        )
+                    )
+                if table == "charters" and row["id"] in self._dropped_charters:
+                    continue
+                if table == "saved_charters":
+                    if row["id"] in self._dropped_saved_charters:
+                        continue
+                    row["original_charter_id"] = self._originals[row["id"]]
+                if table == "private_charters" and row["source_charter_id"] is None:
+                    row["source_charter_id"] = self._sources.get(row["id"], None)
+                yield [row[column] for column in columns]
+
+    def load(self, db: CharterDb):
+        """
+        Sets up the database of `db`, copies the merged tables into it and runs the
+        steps that the import runs at its end.
+        """
+        log.info(f"Resolving links across {len(self.paths)} shards...")
+        self._resolve()
+        log.info("Setting up database...")
+        db.setup_db()
+        for table in TABLES.keys():
+            count = db.copy_rows(table, _columns(table), self._rows(table))
+            log.info(f"Copied {count} rows into {table}")
+        log.info("Resetting id sequences...")
+        db.reset_serial_id_sequences()
+        log.info("Enabling triggers...")
+        db.enable_triggers()
+        log.info("Creating diagnostic views...")
+        db.create_diagnostic_views()
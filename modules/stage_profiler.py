@@ -0,0 +1,102 @@
+import cProfile
+import io
+import pstats
+import tracemalloc
+from contextlib import contextmanager
+from typing import Iterator, List
+
+from modules.logger import Logger
+
+log = Logger()
+
+_TOP_COUNT = 30
+
+
+def _slug(name: str) -> str:
+    return name.strip().replace(" ", "_")
+
+
+class StageProfiler:
+    """
+    Profiles the import `stages` with cProfile, or every stage for "all", and writes one
+    `.prof` dump and a text summary per stage, named after `prefix`. With `memory`,
+    tracemalloc snapshots are taken at the boundaries of the profiled stages, or of
+    every stage if no stages are given, and the top allocations are written as well.
+    """
+
+    def __init__(self, stages: List[str], memory: bool, prefix: str):
+        self._stages = [stage.strip() for stage in stages if stage.strip() != ""]
+        self._memory = memory
+        self._prefix = prefix
+        self._dumps: List[str] = []
+        if self._memory:
+            tracemalloc.start()
+
+    def _is_profiled(self, name: str) -> bool:
+        return "all" in self._stages or name in self._stages
+
+    def _is_traced(self, name: str) -> bool:
+        return self._memory and (len(self._stages) == 0 or self._is_profiled(name))
+
+    @contextmanager
+    def profile(self, name: str) -> Iterator[None]:
+        profiler = cProfile.Profile() if self._is_profiled(name) else None
+        start_snapshot = None
+        if self._is_traced(name):
+            tracemalloc.reset_peak()
+            start_snapshot = tracemalloc.take_snapshot()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self._write_profile(name, profiler)
+            if start_snapshot is not None:
+                self._write_allocations(name, start_snapshot)
+
+    def _write_profile(self, name: str, profiler: cProfile.Profile):
+        path = f"{self._prefix}.{_slug(name)}.prof"
+        profiler.dump_stats(path)
+        self._dumps.append(path)
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(
+            _TOP_COUNT
+        )
+        with open(f"{path}.txt", "w") as file:
+            file.write(summary.getvalue())
+        log.debug(f"Profile of stage {name} written to {path}")
+
+    def _write_allocations(self, name: str, start_snapshot: tracemalloc.Snapshot):
+        current, peak = tracemalloc.get_traced_memory()
+        filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ]
+        snapshot = tracemalloc.take_snapshot().filter_traces(filters)
+        growth = snapshot.compare_to(start_snapshot.filter_traces(filters), "lineno")
+        path = f"{self._prefix}.{_slug(name)}.alloc.txt"
+        with open(path, "w") as file:
+            file.write(f"Stage: {name}\n")
+            file.write(f"Traced memory: {current / 1024 / 1024:.1f} MiB\n")
+            file.write(f"Peak traced memory: {peak / 1024 / 1024:.1f} MiB\n")
+            file.write(f"\nTop {_TOP_COUNT} allocation changes during the stage:\n")
+            for stat in growth[:_TOP_COUNT]:
+                file.write(f"{stat}\n")
+            file.write(f"\nTop {_TOP_COUNT} allocations at the end of the stage:\n")
+            for stat in snapshot.statistics("lineno")[:_TOP_COUNT]:
+                file.write(f"{stat}\n")
+        log.debug(f"Allocations of stage {name} written to {path}")
+
+    def close(self):
+        """
+        Combines the per-stage dumps into one for the whole run if all stages were
+        profiled, and stops tracemalloc.
+        """
+        if "all" in self._stages and len(self._dumps) > 0:
+            path = f"{self._prefix}.run.prof"
+            pstats.Stats(*self._dumps).dump_stats(path)
+            log.info(f"Profile of the whole run written to {path}")
+        if self._memory:
+            tracemalloc.stop()
@@ -0,0 +1,180 @@
+import json
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from modules.logger import Logger
+from modules.stage_profiler import StageProfiler
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak RSS is reported as 0 there
+    resource = None
+
+log = Logger()
+
+
+def _peak_rss() -> int:
+    """
+    Returns the peak resident set size of the process in bytes.
+    """
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Metrics:
+    def __init__(self, name: str):
+        self.name = name
+        self.rows = 0
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.bytes_read = 0
+        self.bytes_decompressed = 0
+        # The high-water mark of the whole process when the measurement ended
+        self.process_peak_rss = 0
+        # How far the measurement raised that high-water mark
+        self.peak_rss_growth = 0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.wall_seconds if self.wall_seconds > 0 else 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "rows": self.rows,
+            "wall_seconds": self.wall_seconds,
+            "cpu_seconds": self.cpu_seconds,
+            "rows_per_second": self.rows_per_second,
+            "process_peak_rss": self.process_peak_rss,
+            "peak_rss_growth": self.peak_rss_growth,
+            "bytes_read": self.bytes_read,
+            "bytes_decompressed": self.bytes_decompressed,
+        }
+
+
+class Stage(Metrics):
+    def __init__(self, name: str, report: "StageReport"):
+        super().__init__(name)
+        self.phases: List[Metrics] = []
+        self.warnings: Dict[str, int] = {}
+        self._report = report
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[Metrics]:
+        """
+        Measures a part of the stage, such as listing or inserting.
+        """
+        with self._report._measure(Metrics(name)) as phase:
+            yield phase
+        self.phases.append(phase)
+
+    def to_dict(self) -> Dict:
+        return {
+            **super().to_dict(),
+            "warnings": self.warnings,
+            "phases": [phase.to_dict() for phase in self.phases],
+        }
+
+
+class StageReport:
+    """
+    Collects the wall time, CPU time, number of rows, peak RSS and the bytes read from
+    the backup zip of each import stage. The peak RSS is that of the whole process,
+    so a stage is only charged for how far it raised the peak RSS of the stages
+    before it. `zip_counter` returns the compressed and
+    decompressed bytes read from the zip so far.
+    """
+
+    def __init__(
+        self,
+        zip_counter: Callable[[], Tuple[int, int]] = lambda: (0, 0),
+        profiler: None | StageProfiler = None,
+    ):
+        self._zip_counter = zip_counter
+        self._profiler = profiler
+        self.created = datetime.now()
+        self.stages: List[Stage] = []
+
+    @contextmanager
+    def _measure(self, metrics: Metrics):
+        start_read, start_decompressed = self._zip_counter()
+        start_peak_rss = _peak_rss()
+        start_cpu = time.process_time()
+        start = time.perf_counter()
+        try:
+            yield metrics
+        finally:
+            metrics.wall_seconds = time.perf_counter() - start
+            metrics.cpu_seconds = time.process_time() - start_cpu
+            end_read, end_decompressed = self._zip_counter()
+            metrics.bytes_read = end_read - start_read
+            metrics.bytes_decompressed = end_decompressed - start_decompressed
+            metrics.process_peak_rss = _peak_rss()
+            metrics.peak_rss_growth = metrics.process_peak_rss - start_peak_rss
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[Stage]:
+        if self._profiler is None:
+            with self._measure(Stage(name, self)) as stage:
+                yield stage
+        else:
+            with self._profiler.profile(name), self._measure(
+                Stage(name, self)
+            ) as stage:
+                yield stage
+        # Phases process the rows of their stage unless they count their own
+        for phase in stage.phases:
+            if phase.rows == 0:
+                phase.rows = stage.rows
+        stage.warnings = log.log_warning_summary(name)
+        self.stages.append(stage)
+
+    def _total(self) -> Metrics:
+        total = Metrics("total")
+        for stage in self.stages:
+            total.rows += stage.rows
+            total.wall_seconds += stage.wall_seconds
+            total.cpu_seconds += stage.cpu_seconds
+            total.bytes_read += stage.bytes_read
+            total.bytes_decompressed += stage.bytes_decompressed
+            total.process_peak_rss = max(total.process_peak_rss, stage.process_peak_rss)
+            total.peak_rss_growth += stage.peak_rss_growth
+        return total
+
+    def log_summary(self):
+        log.info(
+            f"{'Stage':<30} {'Rows':>10} {'Wall s':>8} {'CPU s':>8} {'Rows/s':>10} "
+            f"{'Peak MiB':>9} {'+Peak MiB':>9} {'Zip MiB':>8} {'XML MiB':>8}"
+        )
+        rows: List[Tuple[str, Metrics]] = []
+        for stage in self.stages:
+            rows.append((stage.name, stage))
+            rows += [(f"  {phase.name}", phase) for phase in stage.phases]
+        for name, metrics in rows + [("total", self._total())]:
+            log.info(
+                f"{name:<30} {metrics.rows:>10} {metrics.wall_seconds:>8.2f} "
+                f"{metrics.cpu_seconds:>8.2f} {metrics.rows_per_second:>10.1f} "
+                f"{metrics.process_peak_rss / 1024 / 1024:>9.1f} "
+                f"{metrics.peak_rss_growth / 1024 / 1024:>9.1f} "
+                f"{metrics.bytes_read / 1024 / 1024:>8.2f} "
+                f"{metrics.bytes_decompressed / 1024 / 1024:>8.2f}"
+            )
+
+    def write_json(self, path: str):
+        with open(path, "w") as file:
+            json.dump(
+                {
+                    "created": self.created.isoformat(timespec="seconds"),
+                    "stages": [stage.to_dict() for stage in self.stages],
+                    "total": self._total().to_dict(),
+                },
+                file,
+                indent=2,
+            )
@@ -1,9 +1,19 @@
+import asyncio
+import queue
 import random
 import re
+import sys
+import threading
+from concurrent.futures import Executor
+from functools import lru_cache
 from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Callable, Iterable, Iterator, List, TypeVar
 
+import validators
 from dateutil import tz
 
+T = TypeVar("T")
+
 
 def normalize_string(s: str) -> str:
     s = s.strip()
@@ -33,10 +43,121 @@ def join_url_parts(*parts: str) -> str:
     return full_url
 
 
+# Whether `intern_string` shares equal strings, only turned off to measure the difference
+INTERN_STRINGS = True
+
+
+def intern_string(s: None | str) -> None | str:
+    """
+    Returns a single shared copy of `s`. Used for the strings that repeat across many
+    model objects, such as file names, emails, person keys and IRIs.
+    """
+    if s is None or not INTERN_STRINGS:
+        return s
+    return sys.intern(s)
+
+
+# Path characters that `validators.url` accepts anywhere in a path
+_PATH_CHARS = frozenset(
+    "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789/-._~!$&'()*+,;=:@%"
+)
+
+
+@lru_cache(maxsize=4096)
+def _is_valid_origin(origin: str) -> bool:
+    return bool(validators.url(origin + "/"))
+
+
+def is_valid_url(url: str) -> bool:
+    """
+    Returns the same verdict as `validators.url`. The scheme and host part of a URL
+    is validated once and cached, so that the path of URLs sharing it only needs to
+    be checked for characters the path validation accepts. URLs with a query, a
+    fragment or any other path characters are validated in full.
+    """
+    host_start = url.find("://")
+    if host_start != -1:
+        path_start = url.find("/", host_start + 3)
+        if path_start != -1:
+            origin = url[:path_start]
+            if (
+                "?" not in origin
+                and "#" not in origin
+                and _PATH_CHARS.issuperset(url[path_start:])
+            ):
+                return _is_valid_origin(origin)
+    return bool(validators.url(url))
+
+
+_DATE_PATTERN = re.compile(
+    r"(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(?:\.(\d{1,3}))?([+-]\d{2}:?\d{2}|Z)"
+)
+_DIGITS = frozenset("0123456789")
+_UTC = tz.tzutc()
+
+
+@lru_cache(maxsize=256)
+def _iso_timezone(tz_part: str) -> None | timezone:
+    """
+    Returns the timezone of a `Z` or `+HH:MM` suffix, or `None` for any other suffix.
+    """
+    if tz_part == "Z":
+        return timezone.utc
+    if (
+        len(tz_part) != 6
+        or tz_part[0] not in "+-"
+        or tz_part[3] != ":"
+        or not _DIGITS.issuperset(tz_part[1:3] + tz_part[4:])
+    ):
+        return None
+    sign = 1 if tz_part[0] == "+" else -1
+    return timezone(timedelta(hours=int(tz_part[1:3]) * sign, minutes=int(tz_part[4:])))
+
+
+def _parse_iso_date(date_string: str) -> None | datetime:
+    """
+    Parses the common `YYYY-MM-DDTHH:MM:SS[.fff](Z|+HH:MM)` timestamps without the
+    regular expression. Returns `None` for anything else, which is left to the
+    general path.
+    """
+    if (
+        len(date_string) < 20
+        or date_string[4] != "-"
+        or date_string[7] != "-"
+        or date_string[10] != "T"
+        or date_string[13] != ":"
+        or date_string[16] != ":"
+    ):
+        return None
+    rest = date_string[19:]
+    fraction = ""
+    if rest.startswith("."):
+        end = 1
+        while end < len(rest) and end <= 3 and rest[end] in _DIGITS:
+            end += 1
+        fraction = rest[1:end]
+        rest = rest[end:]
+        if fraction == "":
+            return None
+    tzinfo = _iso_timezone(rest)
+    if tzinfo is None:
+        return None
+    try:
+        dt = datetime.fromisoformat(date_string[:19])
+    except ValueError:
+        return None
+    # Milliseconds are taken as microseconds, like the general path does
+    microsecond = int(fraction.ljust(3, "0"))
+    return dt.replace(microsecond=microsecond, tzinfo=tzinfo).astimezone(_UTC)
+
+
 def parse_date(date_string):
+    # Most timestamps are plain ISO timestamps, which skip the regular expression
+    dt = _parse_iso_date(date_string)
+    if dt is not None:
+        return dt
     # Pattern that includes optional milliseconds and handles both 'Z' and offset-based timezones
-    pattern = r"(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(?:\.(\d{1,3}))?([+-]\d{2}:?\d{2}|Z)"
-    match = re.match(pattern, date_string)
+    match = _DATE_PATTERN.match(date_string)
     if match:
         parts = match.groups()
         # Extract parts
@@ -57,6 +178,100 @@ def parse_date(date_string):
         dt = datetime(
             year, month, day, hour, minute, second, microsecond, tzinfo=tzinfo
         )
-        return dt.astimezone(tz.tzutc())
+        return dt.astimezone(_UTC)
     else:
         raise ValueError("Invalid date string: {}".format(date_string))
+
+
+def iterate_in_executor(
+    executor: Executor, func: Callable[[], Iterable[T]], maxsize: int = 1000
+) -> AsyncIterator[T]:
+    """
+    Starts iterating the iterable returned by `func` in the `executor` right away and returns
+    an async iterator over its items, fed through a bounded queue. Producing and consuming
+    the items overlap. Must be called from within a running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize)
+    stopped = threading.Event()
+    done = object()
+
+    def produce():
+        try:
+            for item in func():
+                if stopped.is_set():
+                    break
+                asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+        finally:
+            asyncio.run_coroutine_threadsafe(queue.put(done), loop).result()
+
+    future = loop.run_in_executor(executor, produce)
+
+    async def consume() -> AsyncIterator[T]:
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                yield item
+        finally:
+            stopped.set()
+            while not queue.empty():
+                queue.get_nowait()
+        # Re-raise any exception of the producer
+        await future
+
+    return consume()
+
+
+def iterate_in_thread(
+    func: Callable[[], Iterable[T]], maxsize: int = 100, chunk_size: int = 1000
+) -> Iterator[T]:
+    """
+    Iterates the iterable returned by `func` in a background thread and yields its items,
+    handed over in chunks of `chunk_size` through a queue of at most `maxsize` chunks.
+    Producing and consuming the items overlap.
+    """
+    chunks: queue.Queue = queue.Queue(maxsize)
+    stopped = threading.Event()
+    done = object()
+    errors: List[BaseException] = []
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def produce():
+        try:
+            chunk: List[T] = []
+            for item in func():
+                if stopped.is_set():
+                    return
+                chunk.append(item)
+                if len(chunk) >= chunk_size:
+                    put(chunk)
+                    chunk = []
+            put(chunk)
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            put(done)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is done:
+                break
+            yield from chunk
+    finally:
+        stopped.set()
+        thread.join()
+    # Re-raise any exception of the producer
+    if len(errors) > 0:
+        raise errors[0]
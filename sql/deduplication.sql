@@ -0,0 +1,145 @@
+-- Storage mode that stores every distinct abstract and tenor only once. The
+-- charter tables reference the XML in xml_contents, and views with the names
+-- and columns of the charter tables join it back in. The shared XML has empty
+-- person name and person processing instructions, and the charter tables keep
+-- the instructions with the ids of their own person names and persons in order.
+
+-- Table for storing each distinct XML fragment once, by the hash of its text
+CREATE TABLE IF NOT EXISTS xml_contents (
+    id SERIAL PRIMARY KEY,
+    hash TEXT NOT NULL UNIQUE,
+    xml XML NOT NULL,
+    fulltext TEXT GENERATED ALWAYS AS (
+        public.mom_text_content('.//text()', xml)
+    ) STORED,
+    issuer_text TEXT GENERATED ALWAYS AS (
+        public.mom_text_content('.//cei:issuer//text()', xml)
+    ) STORED
+);
+CREATE INDEX ON xml_contents USING gin (TO_TSVECTOR('simple', fulltext));
+CREATE INDEX ON xml_contents USING btree (issuer_text);
+
+-- Fills the empty person name and person processing instructions of the XML with
+-- the given processing instructions, in order
+CREATE OR REPLACE FUNCTION public.mom_restore_proc_insts(
+    input_xml XML, proc_insts TEXT []
+)
+RETURNS XML
+LANGUAGE plpgsql
+IMMUTABLE
+AS $function$
+DECLARE
+    xml_text TEXT;
+    i INTEGER;
+BEGIN
+    IF input_xml IS NULL OR COALESCE(array_length(proc_insts, 1), 0) = 0 THEN
+        RETURN input_xml;
+    END IF;
+    xml_text := input_xml::TEXT;
+    FOR i IN 1..array_length(proc_insts, 1) LOOP
+        xml_text := regexp_replace(
+            xml_text, '<\?(person_names|persons)\?>', proc_insts[i]
+        );
+    END LOOP;
+    RETURN xml_text::XML;
+END;
+$function$;
+
+-- Replace the XML columns of the charters with references
+ALTER TABLE charters
+    DROP COLUMN abstract_fulltext,
+    DROP COLUMN issuer_text,
+    DROP COLUMN tenor_fulltext,
+    DROP COLUMN abstract,
+    DROP COLUMN tenor,
+    ADD COLUMN abstract_id INTEGER REFERENCES xml_contents (id),
+    ADD COLUMN tenor_id INTEGER REFERENCES xml_contents (id),
+    ADD COLUMN abstract_proc_insts TEXT [],
+    ADD COLUMN tenor_proc_insts TEXT [];
+CREATE INDEX ON charters (abstract_id);
+CREATE INDEX ON charters (tenor_id);
+ALTER TABLE charters RENAME TO charters_deduplicated;
+
+-- Replace the XML columns of the saved charters with references
+ALTER TABLE saved_charters
+    DROP COLUMN abstract,
+    DROP COLUMN tenor,
+    ADD COLUMN abstract_id INTEGER REFERENCES xml_contents (id),
+    ADD COLUMN tenor_id INTEGER REFERENCES xml_contents (id),
+    ADD COLUMN abstract_proc_insts TEXT [],
+    ADD COLUMN tenor_proc_insts TEXT [];
+CREATE INDEX ON saved_charters (abstract_id);
+CREATE INDEX ON saved_charters (tenor_id);
+ALTER TABLE saved_charters RENAME TO saved_charters_deduplicated;
+
+-- Replace the XML columns of the private charters with references
+ALTER TABLE private_charters
+    DROP COLUMN abstract,
+    DROP COLUMN tenor,
+    ADD COLUMN abstract_id INTEGER REFERENCES xml_contents (id),
+    ADD COLUMN tenor_id INTEGER REFERENCES xml_contents (id),
+    ADD COLUMN abstract_proc_insts TEXT [],
+    ADD COLUMN tenor_proc_insts TEXT [];
+CREATE INDEX ON private_charters (abstract_id);
+CREATE INDEX ON private_charters (tenor_id);
+ALTER TABLE private_charters RENAME TO private_charters_deduplicated;
+
+-- Charters with the columns of the charters table
+CREATE VIEW charters AS
+SELECT
+    c.id,
+    public.mom_restore_proc_insts(a.xml, c.abstract_proc_insts) AS abstract,
+    c.atom_id,
+    c.idno_id,
+    c.idno_text,
+    c.issued_date,
+    c.issued_date_text,
+    c.last_editor_id,
+    c.sort_date,
+    public.mom_restore_proc_insts(t.xml, c.tenor_proc_insts) AS tenor,
+    c.url,
+    a.fulltext AS abstract_fulltext,
+    a.issuer_text,
+    t.fulltext AS tenor_fulltext
+FROM charters_deduplicated c
+LEFT JOIN xml_contents a ON a.id = c.abstract_id
+LEFT JOIN xml_contents t ON t.id = c.tenor_id;
+
+-- Saved charters with the columns of the saved charters table
+CREATE VIEW saved_charters AS
+SELECT
+    s.id,
+    public.mom_restore_proc_insts(a.xml, s.abstract_proc_insts) AS abstract,
+    s.atom_id,
+    s.editor_id,
+    s.idno_id,
+    s.idno_text,
+    s.is_released,
+    s.issued_date,
+    s.issued_date_text,
+    s.original_charter_id,
+    s.sort_date,
+    s.start_time,
+    public.mom_restore_proc_insts(t.xml, s.tenor_proc_insts) AS tenor,
+    s.url
+FROM saved_charters_deduplicated s
+LEFT JOIN xml_contents a ON a.id = s.abstract_id
+LEFT JOIN xml_contents t ON t.id = s.tenor_id;
+
+-- Private charters with the columns of the private charters table
+CREATE VIEW private_charters AS
+SELECT
+    p.id,
+    public.mom_restore_proc_insts(a.xml, p.abstract_proc_insts) AS abstract,
+    p.atom_id,
+    p.idno_id,
+    p.idno_text,
+    p.issued_date,
+    p.issued_date_text,
+    p.private_collection_id,
+    p.sort_date,
+    p.source_charter_id,
+    public.mom_restore_proc_insts(t.xml, p.tenor_proc_insts) AS tenor
+FROM private_charters_deduplicated p
+LEFT JOIN xml_contents a ON a.id = p.abstract_id
+LEFT JOIN xml_contents t ON t.id = p.tenor_id;
@@ -209,6 +209,10 @@ AS $function$
 DECLARE
     current_location_id INTEGER;
 BEGIN
+    -- Skip charters that are being rewritten by reprocess_charters_person_names
+    IF current_setting('momcheck.skip_person_names', TRUE) = 'on' THEN
+        RETURN NEW;
+    END IF;
     -- Handle abstract xml related to person names
     SELECT id INTO current_location_id FROM public.index_locations WHERE location = 'ABSTRACT' LIMIT 1;
     NEW.abstract = public.process_charter_person_names(NEW.id, current_location_id, NEW.abstract);
@@ -219,3 +223,154 @@ BEGIN
     RETURN NEW;
 END;
 $function$;
+
+-- Applies the given replacements one after another to a text, in array order.
+CREATE OR REPLACE FUNCTION public.replace_all_in_order(
+    input_text TEXT, search_texts TEXT [], replacement_texts TEXT []
+)
+RETURNS TEXT
+LANGUAGE plpgsql
+IMMUTABLE
+AS $function$
+DECLARE
+    i INTEGER;
+BEGIN
+    FOR i IN 1..COALESCE(array_length(search_texts, 1), 0) LOOP
+        input_text := REPLACE(input_text, search_texts[i], replacement_texts[i]);
+    END LOOP;
+    RETURN input_text;
+END;
+$function$;
+
+-- Set-based variant of process_charter_person_names for many charters at
+-- once. Extracts all person names of the abstracts and tenors of the given
+-- charters in one pass, upserts person_names and charters_person_names with
+-- single statements and rewrites each XML field at most once.
+CREATE OR REPLACE FUNCTION public.reprocess_charters_person_names(
+    charter_ids INTEGER []
+)
+RETURNS VOID
+LANGUAGE plpgsql
+VOLATILE
+AS $function$
+DECLARE
+    abstract_location_id INTEGER;
+    tenor_location_id INTEGER;
+BEGIN
+    SELECT id INTO abstract_location_id FROM public.index_locations WHERE location = 'ABSTRACT' LIMIT 1;
+    SELECT id INTO tenor_location_id FROM public.index_locations WHERE location = 'TENOR' LIMIT 1;
+    -- Collect all person names of the charters
+    CREATE TEMP TABLE person_names_stage ON COMMIT DROP AS
+    SELECT
+        n.charter_id,
+        n.location_id,
+        n.ord,
+        n.pers_name,
+        public.mom_proc_inst_content('person_names', '/*', n.pers_name)::INT AS person_name_id,
+        public.mom_proc_inst_content('persons', '/*', n.pers_name)::INT AS person_id,
+        public.mom_text_content('/cei:persName//text()', n.pers_name) AS text,
+        public.mom_text_content('/cei:persName/@key', n.pers_name) AS "key",
+        public.mom_text_content('/cei:persName/@reg', n.pers_name) AS reg,
+        FALSE AS is_new
+    FROM (
+        SELECT c.id AS charter_id, abstract_location_id AS location_id, p.ord, p.pers_name
+        FROM public.charters c
+        CROSS JOIN LATERAL unnest(COALESCE(mom_xpath('.//cei:persName', c.abstract), ARRAY[]::XML[]))
+            WITH ORDINALITY AS p(pers_name, ord)
+        WHERE c.id = ANY(charter_ids)
+        UNION ALL
+        SELECT c.id AS charter_id, tenor_location_id AS location_id, p.ord, p.pers_name
+        FROM public.charters c
+        CROSS JOIN LATERAL unnest(COALESCE(mom_xpath('.//cei:persName', c.tenor), ARRAY[]::XML[]))
+            WITH ORDINALITY AS p(pers_name, ord)
+        WHERE c.id = ANY(charter_ids)
+    ) n;
+    -- Names without text are dropped, just like in the row-level processing
+    DELETE FROM pg_temp.person_names_stage WHERE text IS NULL;
+    -- Reserve ids for new person names in document order
+    UPDATE pg_temp.person_names_stage s
+    SET person_name_id = r.new_id, is_new = TRUE
+    FROM (
+        SELECT charter_id, location_id, ord,
+            nextval(pg_get_serial_sequence('public.person_names', 'id')) AS new_id
+        FROM pg_temp.person_names_stage
+        WHERE person_name_id IS NULL
+        ORDER BY charter_id, location_id, ord
+    ) r
+    WHERE s.charter_id = r.charter_id AND s.location_id = r.location_id AND s.ord = r.ord;
+    -- Upsert person_names rows
+    UPDATE public.person_names pn
+    SET "key" = s."key",
+        location_id = s.location_id,
+        person_id = s.person_id,
+        reg = s.reg,
+        text = s.text
+    FROM pg_temp.person_names_stage s
+    WHERE pn.id = s.person_name_id AND NOT s.is_new;
+    INSERT INTO public.person_names (id, "key", location_id, person_id, reg, text)
+    SELECT person_name_id, "key", location_id, person_id, reg, text
+    FROM pg_temp.person_names_stage
+    WHERE is_new;
+    -- Upsert charters_person_names rows
+    INSERT INTO public.charters_person_names (charter_id, person_name_id)
+    SELECT DISTINCT charter_id, person_name_id FROM pg_temp.person_names_stage
+    ON CONFLICT (charter_id, person_name_id) DO NOTHING;
+    -- Remove person names that are no longer part of the XML
+    CREATE TEMP TABLE person_names_to_delete ON COMMIT DROP AS
+    SELECT cpn.person_name_id AS id
+    FROM public.charters_person_names cpn
+    JOIN public.person_names pn ON pn.id = cpn.person_name_id
+    WHERE cpn.charter_id = ANY(charter_ids)
+        AND pn.location_id IN (abstract_location_id, tenor_location_id)
+        AND NOT EXISTS (
+            SELECT 1 FROM pg_temp.person_names_stage s
+            WHERE s.charter_id = cpn.charter_id
+                AND s.location_id = pn.location_id
+                AND s.person_name_id = cpn.person_name_id
+        );
+    DELETE FROM public.charters_person_names WHERE person_name_id IN (SELECT id FROM pg_temp.person_names_to_delete);
+    DELETE FROM public.person_names WHERE id IN (SELECT id FROM pg_temp.person_names_to_delete);
+    DROP TABLE pg_temp.person_names_to_delete;
+    -- Add processing instructions to new person names, once per XML field
+    PERFORM set_config('momcheck.skip_person_names', 'on', TRUE);
+    UPDATE public.charters c
+    SET abstract = CASE WHEN r.abstract_search IS NULL THEN c.abstract
+            ELSE public.replace_all_in_order(c.abstract::TEXT, r.abstract_search, r.abstract_replace)::XML END,
+        tenor = CASE WHEN r.tenor_search IS NULL THEN c.tenor
+            ELSE public.replace_all_in_order(c.tenor::TEXT, r.tenor_search, r.tenor_replace)::XML END
+    FROM (
+        SELECT
+            charter_id,
+            array_agg(public.remove_xml_namespaces(pers_name::TEXT) ORDER BY ord)
+                FILTER (WHERE location_id = abstract_location_id) AS abstract_search,
+            array_agg(public.remove_xml_namespaces(public.mom_replace_proc_inst('person_names', person_name_id::TEXT, pers_name)::TEXT) ORDER BY ord)
+                FILTER (WHERE location_id = abstract_location_id) AS abstract_replace,
+            array_agg(public.remove_xml_namespaces(pers_name::TEXT) ORDER BY ord)
+                FILTER (WHERE location_id = tenor_location_id) AS tenor_search,
+            array_agg(public.remove_xml_namespaces(public.mom_replace_proc_inst('person_names', person_name_id::TEXT, pers_name)::TEXT) ORDER BY ord)
+                FILTER (WHERE location_id = tenor_location_id) AS tenor_replace
+        FROM pg_temp.person_names_stage
+        WHERE is_new
+        GROUP BY charter_id
+    ) r
+    WHERE c.id = r.charter_id;
+    PERFORM set_config('momcheck.skip_person_names', 'off', TRUE);
+    DROP TABLE pg_temp.person_names_stage;
+END;
+$function$;
+
+-- Statement-level trigger function to transform charter data using the
+-- transition table of the triggering statement
+CREATE OR REPLACE FUNCTION public.charters_on_upsert_statement()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+VOLATILE
+AS $function$
+BEGIN
+    IF current_setting('momcheck.skip_person_names', TRUE) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    PERFORM public.reprocess_charters_person_names(ARRAY(SELECT id FROM new_charters));
+    RETURN NULL;
+END;
+$function$;
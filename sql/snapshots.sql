@@ -0,0 +1,327 @@
+-- Storage mode that keeps the history of successive imports as snapshots. The
+-- schema snapshots survives the reset of the schema public before each import
+-- and only stores the rows whose content changed since the previous snapshot.
+
+CREATE SCHEMA IF NOT EXISTS snapshots;
+
+-- Table for recording the imported snapshots by the date of their backup
+CREATE TABLE IF NOT EXISTS snapshots.snapshots (
+    snapshot_date DATE PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+);
+
+-- Table for storing the versions of the rows of every snapshot source by their
+-- natural key. A version is valid from the snapshot in which its content first
+-- appeared until the snapshot in which it changed or disappeared.
+CREATE TABLE IF NOT EXISTS snapshots.versions (
+    source TEXT NOT NULL,
+    key TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    content JSONB NOT NULL,
+    valid_from DATE NOT NULL,
+    valid_to DATE,
+    PRIMARY KEY (source, key, valid_from)
+);
+CREATE INDEX IF NOT EXISTS versions_current_idx
+ON snapshots.versions (source, key) INCLUDE (hash) WHERE valid_to IS NULL;
+CREATE INDEX IF NOT EXISTS versions_valid_to_idx
+ON snapshots.versions (source, valid_to);
+
+-- Returns the rows of a snapshot source as of the given date
+CREATE OR REPLACE FUNCTION snapshots.as_of(source_name TEXT, as_of_date DATE)
+RETURNS TABLE (key TEXT, content JSONB)
+LANGUAGE sql
+STABLE
+AS $function$
+    SELECT v.key, v.content
+    FROM snapshots.versions v
+    WHERE
+        v.source = source_name
+        AND v.valid_from <= as_of_date
+        AND (v.valid_to IS NULL OR v.valid_to > as_of_date);
+$function$;
+
+-- The rows added, changed and removed by every snapshot after the first one
+CREATE OR REPLACE VIEW snapshots.changes AS
+SELECT
+    COALESCE(n.valid_from, o.valid_to) AS snapshot_date,
+    COALESCE(n.source, o.source) AS source,
+    COALESCE(n.key, o.key) AS key,
+    CASE
+        WHEN o.key IS NULL THEN 'added'
+        WHEN n.key IS NULL THEN 'removed'
+        ELSE 'changed'
+    END AS change,
+    o.content AS old_content,
+    n.content AS new_content
+FROM (
+    SELECT * FROM snapshots.versions
+    WHERE valid_from > (SELECT MIN(snapshot_date) FROM snapshots.snapshots)
+) n
+FULL JOIN (
+    SELECT * FROM snapshots.versions WHERE valid_to IS NOT NULL
+) o ON o.source = n.source AND o.key = n.key AND o.valid_to = n.valid_from;
+
+-- The versions of the charters with the columns of the charters table. The sort
+-- date of undated charters is the date of their import and not part of the
+-- snapshot content, so it is NULL.
+CREATE OR REPLACE VIEW snapshots.charters AS
+SELECT
+    key AS atom_id,
+    (content ->> 'abstract') AS abstract,
+    (content ->> 'idno_id') AS idno_id,
+    (content ->> 'idno_text') AS idno_text,
+    (content ->> 'issued_date')::DATERANGE AS issued_date,
+    (content ->> 'issued_date_text') AS issued_date_text,
+    (content ->> 'last_editor') AS last_editor,
+    (content ->> 'sort_date')::DATE AS sort_date,
+    (content ->> 'tenor') AS tenor,
+    (content ->> 'url') AS url,
+    (content -> 'images') AS images,
+    valid_from,
+    valid_to
+FROM snapshots.versions
+WHERE source = 'charters';
+
+-- Returns the XML as text without the ids of its person names and persons, which
+-- change with every import. The persons are part of the snapshot content by their
+-- natural keys through the person names.
+CREATE OR REPLACE FUNCTION public.snapshot_xml(input_xml XML)
+RETURNS TEXT
+LANGUAGE plpgsql
+IMMUTABLE STRICT PARALLEL SAFE
+AS $function$
+BEGIN
+    RETURN regexp_replace(
+        input_xml::TEXT, '<\?(person_names|persons) [0-9]+\?>', '', 'g'
+    );
+END;
+$function$;
+
+-- The contents of the person names, by the natural keys of their references
+CREATE VIEW snapshot_person_name_contents AS
+SELECT
+    pn.id,
+    jsonb_build_object(
+        'key', pn.key,
+        'location', l.location,
+        'person', COALESCE(p.mom_iri, p.wikidata_iri, p.label),
+        'reg', pn.reg,
+        'text', pn.text
+    ) AS content
+FROM person_names pn
+JOIN index_locations l ON l.id = pn.location_id
+LEFT JOIN persons p ON p.id = pn.person_id;
+
+-- The snapshot sources. Every source has a natural key and the content of its
+-- rows, with references given by the natural keys of the referenced rows, so
+-- that the ids assigned by an import don't show up as changes.
+CREATE VIEW snapshot_users AS
+SELECT
+    u.email AS key,
+    jsonb_build_object(
+        'first_name', u.first_name,
+        'moderator', m.email,
+        'name', u.name
+    ) AS content
+FROM users u
+LEFT JOIN users m ON m.id = u.moderator_id;
+
+CREATE VIEW snapshot_persons AS
+SELECT
+    COALESCE(mom_iri, wikidata_iri, label) AS key,
+    jsonb_build_object(
+        'label', label,
+        'mom_iri', mom_iri,
+        'wikidata_iri', wikidata_iri
+    ) AS content
+FROM persons;
+
+CREATE VIEW snapshot_archives AS
+SELECT
+    atom_id AS key,
+    jsonb_build_object(
+        'country_code', country_code,
+        'name', name,
+        'oai_shared', oai_shared,
+        'repository_id', repository_id
+    ) AS content
+FROM archives;
+
+CREATE VIEW snapshot_fonds AS
+SELECT
+    f.atom_id AS key,
+    jsonb_build_object(
+        'archive', a.atom_id,
+        'free_image_access', f.free_image_access,
+        'identifier', f.identifier,
+        'image_base', f.image_base,
+        'oai_shared', f.oai_shared,
+        'title', f.title
+    ) AS content
+FROM fonds f
+JOIN archives a ON a.id = f.archive_id;
+
+CREATE VIEW snapshot_private_collections AS
+SELECT
+    pc.atom_id AS key,
+    jsonb_build_object(
+        'identifier', pc.identifier,
+        'owner', u.email,
+        'title', pc.title
+    ) AS content
+FROM private_collections pc
+JOIN users u ON u.id = pc.owner_id;
+
+CREATE VIEW snapshot_collections AS
+SELECT
+    c.atom_id AS key,
+    jsonb_build_object(
+        'fonds', (
+            SELECT jsonb_agg(f.atom_id ORDER BY f.atom_id)
+            FROM collection_fonds cf
+            JOIN fonds f ON f.id = cf.fond_id
+            WHERE cf.collection_id = c.id
+        ),
+        'identifier', c.identifier,
+        'image_base', c.image_base,
+        'oai_shared', c.oai_shared,
+        'source_collection', pc.atom_id,
+        'title', c.title
+    ) AS content
+FROM collections c
+LEFT JOIN private_collections pc ON pc.id = c.source_collection_id;
+
+CREATE VIEW snapshot_images AS
+SELECT
+    url AS key,
+    jsonb_build_object('is_external', is_external) AS content
+FROM images;
+
+CREATE VIEW snapshot_image_reconciliation AS
+SELECT
+    key,
+    jsonb_build_object(
+        'charter_count', charter_count,
+        'status', status,
+        'url', url
+    ) AS content
+FROM image_reconciliation;
+
+CREATE VIEW snapshot_charters AS
+SELECT
+    c.atom_id AS key,
+    jsonb_build_object(
+        'abstract', public.snapshot_xml(c.abstract),
+        'collections', (
+            SELECT jsonb_agg(co.atom_id ORDER BY co.atom_id)
+            FROM collections_charters cc
+            JOIN collections co ON co.id = cc.collection_id
+            WHERE cc.charter_id = c.id
+        ),
+        'fonds', (
+            SELECT jsonb_agg(f.atom_id ORDER BY f.atom_id)
+            FROM fonds_charters fc
+            JOIN fonds f ON f.id = fc.fond_id
+            WHERE fc.charter_id = c.id
+        ),
+        'idno_id', c.idno_id,
+        'idno_text', c.idno_text,
+        'images', (
+            SELECT jsonb_agg(i.url ORDER BY i.url)
+            FROM charters_images ci
+            JOIN images i ON i.id = ci.image_id
+            WHERE ci.charter_id = c.id
+        ),
+        'issued_date', c.issued_date::TEXT,
+        'issued_date_text', c.issued_date_text,
+        'last_editor', u.email,
+        'person_names', (
+            SELECT jsonb_agg(n.content ORDER BY n.content)
+            FROM charters_person_names cpn
+            JOIN snapshot_person_name_contents n ON n.id = cpn.person_name_id
+            WHERE cpn.charter_id = c.id
+        ),
+        'sort_date', CASE WHEN c.issued_date IS NULL THEN NULL ELSE c.sort_date END,
+        'tenor', public.snapshot_xml(c.tenor),
+        'url', c.url
+    ) AS content
+FROM charters c
+LEFT JOIN users u ON u.id = c.last_editor_id;
+
+CREATE VIEW snapshot_user_charter_bookmarks AS
+SELECT
+    u.email || ' ' || c.atom_id AS key,
+    jsonb_build_object('note', b.note) AS content
+FROM user_charter_bookmarks b
+JOIN users u ON u.id = b.user_id
+JOIN charters c ON c.id = b.charter_id;
+
+CREATE VIEW snapshot_saved_charters AS
+SELECT
+    s.atom_id AS key,
+    jsonb_build_object(
+        'abstract', public.snapshot_xml(s.abstract),
+        'editor', u.email,
+        'idno_id', s.idno_id,
+        'idno_text', s.idno_text,
+        'images', (
+            SELECT jsonb_agg(i.url ORDER BY i.url)
+            FROM saved_charters_images si
+            JOIN images i ON i.id = si.image_id
+            WHERE si.saved_charter_id = s.id
+        ),
+        'is_released', s.is_released,
+        'issued_date', s.issued_date::TEXT,
+        'issued_date_text', s.issued_date_text,
+        'original_charter', c.atom_id,
+        'person_names', (
+            SELECT jsonb_agg(n.content ORDER BY n.content)
+            FROM saved_charters_person_names spn
+            JOIN snapshot_person_name_contents n ON n.id = spn.person_name_id
+            WHERE spn.saved_charter_id = s.id
+        ),
+        'sort_date', CASE WHEN s.issued_date IS NULL THEN NULL ELSE s.sort_date END,
+        'start_time', s.start_time,
+        'tenor', public.snapshot_xml(s.tenor),
+        'url', s.url
+    ) AS content
+FROM saved_charters s
+JOIN users u ON u.id = s.editor_id
+JOIN charters c ON c.id = s.original_charter_id;
+
+CREATE VIEW snapshot_private_charters AS
+SELECT
+    pc.atom_id || ' ' || p.atom_id AS key,
+    jsonb_build_object(
+        'abstract', public.snapshot_xml(p.abstract),
+        'idno_id', p.idno_id,
+        'idno_text', p.idno_text,
+        'images', (
+            SELECT jsonb_agg(i.url ORDER BY i.url)
+            FROM private_charters_images pci
+            JOIN images i ON i.id = pci.image_id
+            WHERE pci.private_charter_id = p.id
+        ),
+        'issued_date', p.issued_date::TEXT,
+        'issued_date_text', p.issued_date_text,
+        'person_names', (
+            SELECT jsonb_agg(n.content ORDER BY n.content)
+            FROM private_charters_person_names ppn
+            JOIN snapshot_person_name_contents n ON n.id = ppn.person_name_id
+            WHERE ppn.private_charter_id = p.id
+        ),
+        'shared_with', (
+            SELECT jsonb_agg(u.email ORDER BY u.email)
+            FROM private_charter_user_shares us
+            JOIN users u ON u.id = us.user_id
+            WHERE us.private_charter_id = p.id
+        ),
+        'sort_date', CASE WHEN p.issued_date IS NULL THEN NULL ELSE p.sort_date END,
+        'source_charter', c.atom_id,
+        'tenor', public.snapshot_xml(p.tenor)
+    ) AS content
+FROM private_charters p
+JOIN private_collections pc ON pc.id = p.private_collection_id
+LEFT JOIN charters c ON c.id = p.source_charter_id;
@@ -0,0 +1,17 @@
+-- Keep the charter full text index in sync with the charters table
+CREATE TRIGGER IF NOT EXISTS charters_fulltext_after_insert AFTER INSERT ON charters BEGIN
+    INSERT INTO charters_fulltext (rowid, abstract_fulltext, tenor_fulltext)
+    VALUES (new.id, new.abstract_fulltext, new.tenor_fulltext);
+END;
+
+CREATE TRIGGER IF NOT EXISTS charters_fulltext_after_delete AFTER DELETE ON charters BEGIN
+    INSERT INTO charters_fulltext (charters_fulltext, rowid, abstract_fulltext, tenor_fulltext)
+    VALUES ('delete', old.id, old.abstract_fulltext, old.tenor_fulltext);
+END;
+
+CREATE TRIGGER IF NOT EXISTS charters_fulltext_after_update AFTER UPDATE ON charters BEGIN
+    INSERT INTO charters_fulltext (charters_fulltext, rowid, abstract_fulltext, tenor_fulltext)
+    VALUES ('delete', old.id, old.abstract_fulltext, old.tenor_fulltext);
+    INSERT INTO charters_fulltext (rowid, abstract_fulltext, tenor_fulltext)
+    VALUES (new.id, new.abstract_fulltext, new.tenor_fulltext);
+END;
@@ -0,0 +1,11 @@
+-- Statement-level triggers for bulk write operations on the charters table.
+-- Alternative to triggers.sql that processes all rows of a statement at once.
+CREATE TRIGGER charters_after_insert_statement
+AFTER INSERT ON public.charters
+REFERENCING NEW TABLE AS new_charters
+FOR EACH STATEMENT EXECUTE FUNCTION public.charters_on_upsert_statement();
+
+CREATE TRIGGER charters_after_update_statement
+AFTER UPDATE ON public.charters
+REFERENCING NEW TABLE AS new_charters
+FOR EACH STATEMENT EXECUTE FUNCTION public.charters_on_upsert_statement();
@@ -249,3 +249,36 @@ CREATE TABLE IF NOT EXISTS private_charters_person_names (
 );
 CREATE INDEX ON private_charters_person_names (private_charter_id);
 CREATE INDEX ON private_charters_person_names (person_name_id);
+
+-- Table for storing the reconciliation of the images on the image server with the
+-- images of all charters by canonical url key
+CREATE TABLE IF NOT EXISTS image_reconciliation (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    status TEXT NOT NULL CHECK (status IN ('used', 'unused', 'dangling')),
+    charter_count INTEGER NOT NULL
+);
+CREATE INDEX ON image_reconciliation (status);
+
+-- Table for storing the number of used, unused and dangling images per fond
+CREATE TABLE IF NOT EXISTS fonds_image_reconciliation (
+    fond_id INTEGER PRIMARY KEY REFERENCES fonds (id),
+    used_count INTEGER NOT NULL,
+    unused_count INTEGER NOT NULL,
+    dangling_count INTEGER NOT NULL
+);
+
+-- Table for storing the number of used, unused and dangling images per collection
+CREATE TABLE IF NOT EXISTS collections_image_reconciliation (
+    collection_id INTEGER PRIMARY KEY REFERENCES collections (id),
+    used_count INTEGER NOT NULL,
+    unused_count INTEGER NOT NULL,
+    dangling_count INTEGER NOT NULL
+);
+
+-- Table for recording the completed stages of an import, to resume it after a failure
+CREATE TABLE IF NOT EXISTS import_stages (
+    stage TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    completed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+);
@@ -0,0 +1,88 @@
+-- Images on the image server that are not used by any charter
+CREATE MATERIALIZED VIEW IF NOT EXISTS unused_images AS
+SELECT i.id, i.url, i.is_external
+FROM images i
+WHERE NOT EXISTS (SELECT 1 FROM charters_images ci WHERE ci.image_id = i.id)
+    AND NOT EXISTS (SELECT 1 FROM saved_charters_images sci WHERE sci.image_id = i.id)
+    AND NOT EXISTS (SELECT 1 FROM private_charters_images pci WHERE pci.image_id = i.id);
+CREATE UNIQUE INDEX IF NOT EXISTS unused_images_id_idx ON unused_images (id);
+CREATE INDEX IF NOT EXISTS unused_images_is_external_idx ON unused_images (is_external);
+
+-- Charters that lack a date, an abstract, images or a last editor
+CREATE MATERIALIZED VIEW IF NOT EXISTS incomplete_charters AS
+SELECT
+    c.id,
+    c.atom_id,
+    c.url,
+    c.issued_date IS NULL AS missing_date,
+    c.abstract_fulltext IS NULL AS missing_abstract,
+    NOT EXISTS (SELECT 1 FROM charters_images ci WHERE ci.charter_id = c.id) AS missing_images,
+    c.last_editor_id IS NULL AS missing_editor
+FROM charters c
+WHERE c.issued_date IS NULL
+    OR c.abstract_fulltext IS NULL
+    OR c.last_editor_id IS NULL
+    OR NOT EXISTS (SELECT 1 FROM charters_images ci WHERE ci.charter_id = c.id);
+CREATE UNIQUE INDEX IF NOT EXISTS incomplete_charters_id_idx ON incomplete_charters (id);
+CREATE INDEX IF NOT EXISTS incomplete_charters_missing_idx ON incomplete_charters (missing_date, missing_abstract, missing_images, missing_editor);
+
+-- Users together with their moderators
+CREATE MATERIALIZED VIEW IF NOT EXISTS user_moderators AS
+SELECT
+    u.id AS user_id,
+    u.email AS user_email,
+    m.id AS moderator_id,
+    m.email AS moderator_email
+FROM users u
+LEFT JOIN users m ON m.id = u.moderator_id;
+CREATE UNIQUE INDEX IF NOT EXISTS user_moderators_user_id_idx ON user_moderators (user_id);
+CREATE INDEX IF NOT EXISTS user_moderators_moderator_id_idx ON user_moderators (moderator_id);
+CREATE INDEX IF NOT EXISTS user_moderators_moderator_email_idx ON user_moderators (moderator_email);
+
+-- Released saved charters with their editors and moderators
+CREATE MATERIALIZED VIEW IF NOT EXISTS released_saved_charters AS
+SELECT
+    s.id,
+    s.atom_id,
+    s.original_charter_id,
+    s.start_time,
+    s.editor_id,
+    u.email AS editor_email,
+    u.moderator_id,
+    u.moderator_id IS NULL AS missing_moderator
+FROM saved_charters s
+JOIN users u ON u.id = s.editor_id
+WHERE s.is_released;
+CREATE UNIQUE INDEX IF NOT EXISTS released_saved_charters_id_idx ON released_saved_charters (id);
+CREATE INDEX IF NOT EXISTS released_saved_charters_moderator_id_idx ON released_saved_charters (moderator_id);
+CREATE INDEX IF NOT EXISTS released_saved_charters_start_time_idx ON released_saved_charters (start_time);
+
+-- Fonds without any charters
+CREATE MATERIALIZED VIEW IF NOT EXISTS empty_fonds AS
+SELECT f.id, f.archive_id, f.atom_id, f.identifier
+FROM fonds f
+WHERE NOT EXISTS (SELECT 1 FROM fonds_charters fc WHERE fc.fond_id = f.id);
+CREATE UNIQUE INDEX IF NOT EXISTS empty_fonds_id_idx ON empty_fonds (id);
+CREATE INDEX IF NOT EXISTS empty_fonds_archive_id_idx ON empty_fonds (archive_id);
+
+-- Collections without any charters and the number of their linked fonds
+-- without any charters
+CREATE MATERIALIZED VIEW IF NOT EXISTS empty_collections AS
+SELECT
+    c.id,
+    c.atom_id,
+    c.identifier,
+    NOT EXISTS (SELECT 1 FROM collections_charters cc WHERE cc.collection_id = c.id) AS missing_charters,
+    (
+        SELECT count(*) FROM collection_fonds cf
+        WHERE cf.collection_id = c.id
+            AND NOT EXISTS (SELECT 1 FROM fonds_charters fc WHERE fc.fond_id = cf.fond_id)
+    ) AS empty_fond_count
+FROM collections c
+WHERE NOT EXISTS (SELECT 1 FROM collections_charters cc WHERE cc.collection_id = c.id)
+    OR EXISTS (
+        SELECT 1 FROM collection_fonds cf
+        WHERE cf.collection_id = c.id
+            AND NOT EXISTS (SELECT 1 FROM fonds_charters fc WHERE fc.fond_id = cf.fond_id)
+    );
+CREATE UNIQUE INDEX IF NOT EXISTS empty_collections_id_idx ON empty_collections (id);
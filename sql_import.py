@@ -1,9 +1,23 @@
 import os
+from datetime import date
 
+from modules.change_feed import ChangeFeed
+from modules.image_reconciliation import ImageReconciliation
+from modules.import_checkpoint import ImportCheckpoint
+from modules.import_sample import ImportSample
 from modules.logger import Logger
 from modules.models.charter_db import CharterDb
+from modules.models.charter_store import CharterStore
+from modules.models.dry_run_db import DryRunDb
 from modules.models.images_file import ImagesFile
 from modules.models.mom_backup import MomBackup
+from modules.models.parquet_db import ParquetDb
+from modules.models.shard_db import ShardDb
+from modules.models.sqlite_db import SqliteDb
+from modules.progress import Progress
+from modules.shard import Shard
+from modules.stage_profiler import StageProfiler
+from modules.stage_report import StageReport
 
 log = Logger()
 
@@ -16,125 +30,508 @@ image_files_path = str(os.environ.get("IMAGE_LIST_PATH"))
 # Postgres settings
 pg_password = str(os.environ.get("PG_PW"))
 pg_host = str(os.environ.get("PG_HOST"))
+pg_port = int(os.environ.get("PG_PORT", "5432"))
+pg_user = str(os.environ.get("PG_USER", "postgres"))
+pg_db = str(os.environ.get("PG_DB", "momcheck"))
+deduplicate_xml = os.environ.get("DEDUPLICATE_XML", "").lower() in [
+    "1",
+    "true",
+    "yes",
+]
 
-log.info(f"Connecting to database at {pg_host}")
-with CharterDb(pg_host, pg_password) as db:
+# Parquet settings
+parquet_path = os.environ.get("PARQUET_PATH")
+
+# SQLite settings
+sqlite_path = os.environ.get("SQLITE_PATH")
+
+# Dry run settings
+dry_run = os.environ.get("DRY_RUN", "").lower() in ["1", "true", "yes"]
+
+# Sample settings
+sample_fraction = os.environ.get("SAMPLE_FRACTION")
+sample_seed = int(os.environ.get("SAMPLE_SEED", "0"))
+sample: None | ImportSample = None
+if sample_fraction is not None:
+    sample = ImportSample(float(sample_fraction), sample_seed)
+
+# Shard settings
+shard_count = os.environ.get("SHARD_COUNT")
+shard_index = int(os.environ.get("SHARD_INDEX", "0"))
+shard_id_range = int(os.environ.get("SHARD_ID_RANGE", "100000000"))
+shard_path = os.environ.get("SHARD_PATH", "shards")
+shard: None | Shard = None
+if shard_count is not None:
+    shard = Shard(int(shard_count), shard_index, shard_id_range)
+
+# Checkpoint settings
+checkpoint_path = os.environ.get("CHECKPOINT_PATH")
+resume = os.environ.get("RESUME", "").lower() in ["1", "true", "yes"]
+if resume and checkpoint_path is None:
+    log.warn("Resuming requires CHECKPOINT_PATH. Importing from the start")
+
+# Snapshot settings
+snapshot_date_text = os.environ.get("SNAPSHOT_DATE")
+snapshot_date: None | date = None
+if snapshot_date_text is not None:
+    snapshot_date = date.fromisoformat(snapshot_date_text)
+    if (
+        shard is not None
+        or dry_run
+        or parquet_path is not None
+        or sqlite_path is not None
+    ):
+        log.warn("Snapshots are only supported in Postgres. Skipping")
+        snapshot_date = None
+
+# Change feed settings
+change_feed_path = os.environ.get("CHANGE_FEED_PATH")
+change_feed: None | ChangeFeed = None
+if change_feed_path is not None:
+    if shard is not None or dry_run or sample is not None:
+        log.warn("The change feed needs a complete import. Skipping")
+    else:
+        change_feed = ChangeFeed(change_feed_path)
+
+# Image reconciliation settings
+reconcile_images = os.environ.get("RECONCILE_IMAGES", "").lower() in [
+    "1",
+    "true",
+    "yes",
+]
+if reconcile_images and shard is not None:
+    log.warn("Images can't be reconciled in a sharded import. Skipping")
+    reconcile_images = False
+
+# Profiling settings
+profile_stages = os.environ.get("PROFILE_STAGES", "").split(",")
+profile_memory = os.environ.get("PROFILE_MEMORY", "").lower() in ["1", "true", "yes"]
+
+# Logging settings
+aggregate_warnings = os.environ.get("AGGREGATE_WARNINGS", "").lower() in [
+    "1",
+    "true",
+    "yes",
+]
+warning_samples = int(os.environ.get("WARNING_SAMPLES", "5"))
+if aggregate_warnings:
+    log.aggregate_warnings(warning_samples)
+
+# Progress settings
+Progress.interval = float(os.environ.get("PROGRESS_INTERVAL", "10"))
+
+output: CharterStore
+if shard is not None:
+    log.info(f"Importing {shard.name}")
+    shard.reserve_ids()
+    output = ShardDb(os.path.join(shard_path, shard.name), shard)
+elif dry_run:
+    log.info("Dry run, parsing the backup without writing any records")
+    output = DryRunDb()
+elif parquet_path is not None:
+    log.info(f"Writing parquet files to {parquet_path}")
+    output = ParquetDb(parquet_path)
+elif sqlite_path is not None:
+    log.info(f"Writing SQLite database to {sqlite_path}")
+    output = SqliteDb(sqlite_path)
+else:
+    log.info(f"Connecting to database at {pg_host}")
+    output = CharterDb(
+        pg_host,
+        pg_password,
+        pg_port,
+        pg_user,
+        pg_db,
+        atomic_stages=checkpoint_path is not None,
+        deduplicate_xml=deduplicate_xml,
+        snapshots=snapshot_date is not None,
+    )
+
+with output as db:
     log.info(f"Opening zip file {backup_zip}...")
-    with MomBackup(backup_zip) as backup:
-        log.info("Setting up database...")
-        db.setup_db()
+    with MomBackup(backup_zip) as backup, ImportCheckpoint(
+        checkpoint_path, db, backup.fingerprint()
+    ) as checkpoint:
+        profiler: None | StageProfiler = None
+        if profile_memory or profile_stages != [""]:
+            log_path = log.file_path()
+            prefix = (
+                os.path.splitext(log_path)[0] if log_path is not None else "logs/log"
+            )
+            profiler = StageProfiler(profile_stages, profile_memory, prefix)
+        report = StageReport(
+            lambda: (backup.bytes_read, backup.bytes_decompressed), profiler
+        )
+        if resume:
+            checkpoint.resume()
+
+        if not checkpoint.restored("setup"):
+            with report.stage("setup"):
+                log.info("Setting up database...")
+                db.setup_db()
+            checkpoint.complete("setup")
 
         # insert index locations
-        log.info("Inserting index locations...")
-        db.insert_index_locations()
+        if not checkpoint.restored("index locations"):
+            with report.stage("index locations"):
+                log.info("Inserting index locations...")
+                db.insert_index_locations()
+            checkpoint.complete("index locations")
 
         # insert users
-        log.info("Listing users...")
-        users = backup.list_users()
-        log.info(f"Inserting {len(users)} users...")
-        db.insert_users(users)
+        if checkpoint.restored("users"):
+            users = checkpoint.state["users"]
+            sample = checkpoint.state["sample"]
+            backup.sample = sample
+        else:
+            with report.stage("users") as stage:
+                with stage.phase("list"):
+                    log.info("Listing users...")
+                    users = backup.list_users()
+                    if sample is not None:
+                        users = backup.apply_sample(sample, users)
+                    stage.rows = len(users)
+                with stage.phase("insert"):
+                    log.info(f"Inserting {len(users)} users...")
+                    db.insert_users(users)
+            checkpoint.complete("users", users=users, sample=sample)
 
         # insert images
-        log.info("Listing images...")
-        images = ImagesFile(image_files_path).list_images()
-        log.info(f"Inserting {len(images)} images...")
-        db.insert_images(images)
+        reconciliation: None | ImageReconciliation = None
+        if checkpoint.restored("images"):
+            reconciliation = checkpoint.state["reconciliation"]
+            change_feed = checkpoint.state["change_feed"]
+        else:
+            with report.stage("images") as stage:
+                log.info("Streaming images...")
+                images = ImagesFile(image_files_path).iter_images()
+                if sample is not None:
+                    images = sample.filter_images(images)
+                if reconcile_images:
+                    reconciliation = ImageReconciliation()
+                    images = reconciliation.track_server_images(images)
+                if change_feed is not None:
+                    images = change_feed.track_images(images)
+                stage.rows = db.insert_images(images)
+                log.info(f"Inserted {stage.rows} images")
+            checkpoint.complete(
+                "images", reconciliation=reconciliation, change_feed=change_feed
+            )
 
         # Initialize person index
-        log.info("Initializing person index...")
-        person_index = backup.init_person_index()
+        if checkpoint.restored("person index"):
+            person_index = checkpoint.state["person_index"]
+        else:
+            with report.stage("person index") as stage:
+                log.info("Initializing person index...")
+                person_index = backup.init_person_index()
+                stage.rows = person_index.count_persons()
+            checkpoint.complete("person index", person_index=person_index)
 
         # insert archives
-        log.info("Listing archives...")
-        archives = backup.list_archives()
-        log.info(f"Inserting {len(archives)} archives...")
-        db.insert_archives(archives)
+        if checkpoint.restored("archives"):
+            archives = checkpoint.state["archives"]
+        else:
+            with report.stage("archives") as stage:
+                with stage.phase("list"):
+                    log.info("Listing archives...")
+                    archives = backup.list_archives()
+                    stage.rows = len(archives)
+                with stage.phase("insert"):
+                    log.info(f"Inserting {len(archives)} archives...")
+                    db.insert_archives(archives)
+            checkpoint.complete("archives", archives=archives)
 
         # insert fonds
-        log.info("Listing fonds...")
-        fonds = backup.list_fonds(archives)
-        log.info(f"Inserting {len(fonds)} fonds...")
-        db.insert_fonds(fonds)
+        if checkpoint.restored("fonds"):
+            fonds = checkpoint.state["fonds"]
+        else:
+            with report.stage("fonds") as stage:
+                with stage.phase("list"):
+                    log.info("Listing fonds...")
+                    fonds = backup.list_fonds(archives)
+                    stage.rows = len(fonds)
+                with stage.phase("insert"):
+                    log.info(f"Inserting {len(fonds)} fonds...")
+                    db.insert_fonds(fonds)
+            checkpoint.complete("fonds", fonds=fonds)
 
         # insert fond charters
-        log.info("Listing fond charters...")
-        fond_charters = backup.list_fond_charters(fonds, users, person_index)
-        log.info(f"Inserting {len(fond_charters)} fond charters...")
-        db.insert_fonds_charters(fond_charters)
+        if checkpoint.restored("fond charters"):
+            fond_charters = checkpoint.state["fond_charters"]
+        else:
+            with report.stage("fond charters") as stage:
+                with stage.phase("list"):
+                    log.info("Listing fond charters...")
+                    owned_fonds = (
+                        fonds
+                        if shard is None
+                        else shard.select(fonds, lambda fond: fond.archive_file)
+                    )
+                    fond_charters = backup.list_fond_charters(
+                        owned_fonds, users, person_index
+                    )
+                    stage.rows = len(fond_charters)
+                with stage.phase("insert"):
+                    log.info(f"Inserting {len(fond_charters)} fond charters...")
+                    db.insert_fonds_charters(fond_charters)
+            checkpoint.complete("fond charters", fond_charters=fond_charters)
 
         # insert collections
-        log.info("Listing collections...")
-        collections = backup.list_collections(fonds)
-        log.info(f"Inserting {len(collections)} collections...")
-        db.insert_collections(collections)
+        if checkpoint.restored("collections"):
+            collections = checkpoint.state["collections"]
+        else:
+            with report.stage("collections") as stage:
+                with stage.phase("list"):
+                    log.info("Listing collections...")
+                    collections = backup.list_collections(fonds)
+                    stage.rows = len(collections)
+                with stage.phase("insert"):
+                    log.info(f"Inserting {len(collections)} collections...")
+                    db.insert_collections(collections)
+            checkpoint.complete("collections", collections=collections)
 
         # insert collection charters
-        log.info("Listing collection charters...")
-        collection_charters = backup.list_collection_charters(
-            collections, users, person_index
-        )
-        log.info(f"Inserting {len(collection_charters)} collection charters...")
-        db.insert_collections_charters(collection_charters)
+        if checkpoint.restored("collection charters"):
+            collection_charters = checkpoint.state["collection_charters"]
+        else:
+            with report.stage("collection charters") as stage:
+                with stage.phase("list"):
+                    log.info("Listing collection charters...")
+                    owned_collections = (
+                        collections
+                        if shard is None
+                        else shard.select(
+                            collections, lambda collection: collection.file
+                        )
+                    )
+                    collection_charters = backup.list_collection_charters(
+                        owned_collections, users, person_index
+                    )
+                    stage.rows = len(collection_charters)
+                with stage.phase("insert"):
+                    log.info(
+                        f"Inserting {len(collection_charters)} collection charters..."
+                    )
+                    db.insert_collections_charters(collection_charters)
+            checkpoint.complete(
+                "collection charters", collection_charters=collection_charters
+            )
 
         public_charters = fond_charters + collection_charters
+        owned_users = (
+            users
+            if shard is None
+            else shard.select(users, lambda user: user.email.lower())
+        )
 
         # insert user bookmarks
-        log.info("Inserting user charter bookmarks...")
-        db.insert_user_charter_bookmarks(users)
+        if not checkpoint.restored("bookmarks"):
+            with report.stage("bookmarks") as stage:
+                log.info("Inserting user charter bookmarks...")
+                stage.rows = sum(len(user.bookmarks) for user in owned_users)
+                db.insert_user_charter_bookmarks(owned_users)
+            checkpoint.complete("bookmarks")
 
         # insert saved charters
-        log.info("Listing saved charters...")
-        saved_charters = backup.list_saved_charters(
-            users, fonds, collections, person_index
-        )
-        log.info(f"Inserting {len(saved_charters)} saved charters...")
-        db.insert_saved_charters(saved_charters)
+        if checkpoint.restored("saved charters"):
+            saved_charters = checkpoint.state["saved_charters"]
+        else:
+            with report.stage("saved charters") as stage:
+                with stage.phase("list"):
+                    log.info("Listing saved charters...")
+                    saved_charters = backup.list_saved_charters(
+                        users, fonds, collections, person_index
+                    )
+                    if shard is not None:
+                        owned_user_ids = set(user.id for user in owned_users)
+                        saved_charters = [
+                            charter
+                            for charter in saved_charters
+                            if charter.editor_id in owned_user_ids
+                        ]
+                    stage.rows = len(saved_charters)
+                with stage.phase("insert"):
+                    log.info(f"Inserting {len(saved_charters)} saved charters...")
+                    db.insert_saved_charters(saved_charters)
+            checkpoint.complete("saved charters", saved_charters=saved_charters)
 
         # insert private mycollections
-        log.info("Listing private collections...")
-        private_mycollections = backup.list_private_mycollections(users)
-        log.info(f"Inserting {len(private_mycollections)} private mycollections...")
-        db.insert_private_collections(private_mycollections)
+        if checkpoint.restored("private mycollections"):
+            private_mycollections = checkpoint.state["private_mycollections"]
+        else:
+            with report.stage("private mycollections") as stage:
+                with stage.phase("list"):
+                    log.info("Listing private collections...")
+                    private_mycollections = backup.list_private_mycollections(users)
+                    stage.rows = len(private_mycollections)
+                with stage.phase("insert"):
+                    log.info(
+                        f"Inserting {len(private_mycollections)} private mycollections..."
+                    )
+                    db.insert_private_collections(private_mycollections)
+            checkpoint.complete(
+                "private mycollections", private_mycollections=private_mycollections
+            )
 
         # insert private mycollection charters
-        log.info("Listing private collection charters...")
-        private_mycharters = backup.list_private_charters(
-            users, private_mycollections, public_charters, person_index
-        )
-        log.info(f"Inserting {len(private_mycharters)} private collection charters...")
-        db.insert_private_mycharters(private_mycharters)
+        if checkpoint.restored("private mycharters"):
+            private_mycharters = checkpoint.state["private_mycharters"]
+        else:
+            with report.stage("private mycharters") as stage:
+                with stage.phase("list"):
+                    log.info("Listing private collection charters...")
+                    owned_private_mycollections = (
+                        private_mycollections
+                        if shard is None
+                        else shard.select(
+                            private_mycollections,
+                            lambda mycollection: mycollection.owner_email.lower(),
+                        )
+                    )
+                    private_mycharters = backup.list_private_charters(
+                        users,
+                        owned_private_mycollections,
+                        public_charters,
+                        person_index,
+                    )
+                    stage.rows = len(private_mycharters)
+                with stage.phase("insert"):
+                    log.info(
+                        f"Inserting {len(private_mycharters)} private collection charters..."
+                    )
+                    db.insert_private_mycharters(private_mycharters)
+            checkpoint.complete(
+                "private mycharters", private_mycharters=private_mycharters
+            )
 
         # insert public mycollections
-        log.info("Listing public collections...")
-        public_mycollections = backup.list_public_mycollections(
-            users, private_mycollections
-        )
-        log.info(f"Inserting {len(public_mycollections)} public mycollections...")
-        db.insert_public_mycollections(public_mycollections)
+        if checkpoint.restored("public mycollections"):
+            public_mycollections = checkpoint.state["public_mycollections"]
+        else:
+            with report.stage("public mycollections") as stage:
+                with stage.phase("list"):
+                    log.info("Listing public collections...")
+                    public_mycollections = backup.list_public_mycollections(
+                        users, private_mycollections
+                    )
+                    stage.rows = len(public_mycollections)
+                with stage.phase("insert"):
+                    log.info(
+                        f"Inserting {len(public_mycollections)} public mycollections..."
+                    )
+                    db.insert_public_mycollections(public_mycollections)
+            checkpoint.complete(
+                "public mycollections", public_mycollections=public_mycollections
+            )
 
         # insert public mycollection charters
-        log.info("Listing public collection charters...")
-        public_mycharters = backup.list_public_charters(
-            private_mycharters, public_mycollections, person_index
-        )
-        log.info(f"Inserting {len(public_mycharters)} public collection charters...")
-        db.insert_public_mycharters(public_mycharters)
+        if checkpoint.restored("public mycharters"):
+            public_mycharters = checkpoint.state["public_mycharters"]
+        else:
+            with report.stage("public mycharters") as stage:
+                with stage.phase("list"):
+                    log.info("Listing public collection charters...")
+                    owned_public_mycollections = (
+                        public_mycollections
+                        if shard is None
+                        else shard.select(
+                            public_mycollections,
+                            lambda mycollection: mycollection.owner_email.lower(),
+                        )
+                    )
+                    public_mycharters = backup.list_public_charters(
+                        private_mycharters, owned_public_mycollections, person_index
+                    )
+                    stage.rows = len(public_mycharters)
+                with stage.phase("insert"):
+                    log.info(
+                        f"Inserting {len(public_mycharters)} public collection charters..."
+                    )
+                    db.insert_public_mycharters(public_mycharters)
+            checkpoint.complete(
+                "public mycharters", public_mycharters=public_mycharters
+            )
 
         public_charters = public_charters + public_mycharters
 
         # insert persons
-        log.info(f"Inserting {person_index.count_persons()} indexes...")
-        db.insert_persons(
-            person_index, public_charters, private_mycharters, saved_charters
-        )
+        if not checkpoint.restored("persons"):
+            with report.stage("persons") as stage:
+                log.info(f"Inserting {person_index.count_persons()} indexes...")
+                stage.rows = sum(
+                    len(charter.person_names)
+                    for charters in [
+                        public_charters,
+                        private_mycharters,
+                        saved_charters,
+                    ]
+                    for charter in charters
+                )
+                db.insert_persons(
+                    person_index, public_charters, private_mycharters, saved_charters
+                )
+            checkpoint.complete("persons")
+
+        # reconcile images
+        if reconciliation is not None and not checkpoint.restored(
+            "image reconciliation"
+        ):
+            with report.stage("image reconciliation") as stage:
+                log.info("Reconciling images...")
+                reconciliation.add_fonds(fonds)
+                reconciliation.add_collections(collections + public_mycollections)
+                reconciliation.add_charters(public_charters)
+                reconciliation.add_charters(private_mycharters)
+                reconciliation.add_charters(saved_charters)
+                reconciliation.reconcile()
+                stage.rows = len(reconciliation.images)
+                db.insert_image_reconciliation(reconciliation)
+            checkpoint.complete("image reconciliation")
+
+        if not checkpoint.restored("finalize"):
+            with report.stage("finalize"):
+                # reset sequences
+                log.info("Resetting id sequences...")
+                db.reset_serial_id_sequences()
+
+                # enable triggers
+                log.info("Enabling triggers...")
+                db.enable_triggers()
+
+                # create diagnostic views
+                log.info("Creating diagnostic views...")
+                db.create_diagnostic_views()
+            checkpoint.complete("finalize")
 
-        # reset sequences
-        log.info("Resetting id sequences...")
-        db.reset_serial_id_sequences()
+        # take snapshot
+        if snapshot_date is not None and not checkpoint.restored("snapshot"):
+            with report.stage("snapshot") as stage:
+                log.info(f"Taking snapshot of {snapshot_date}...")
+                stage.rows = db.take_snapshot(snapshot_date, backup.fingerprint())
+            checkpoint.complete("snapshot")
 
-        # enable triggers
-        log.info("Enabling triggers...")
-        db.enable_triggers()
+        # write change feed
+        if change_feed is not None and not checkpoint.restored("change feed"):
+            with report.stage("change feed") as stage:
+                log.info("Writing change feed...")
+                change_feed.add_charters(public_charters)
+                change_feed.add_saved_charters(saved_charters)
+                change_feed.add_private_charters(private_mycharters)
+                change_feed.add_persons(person_index.list_persons())
+                stage.rows = change_feed.write()
+            checkpoint.complete("change feed")
 
         # finished
         log.info("Database import complete")
+        report.log_summary()
+        if sample is not None:
+            sample.log_summary()
+        log.log_warning_totals()
+        if profiler is not None:
+            profiler.close()
+        log_path = log.file_path()
+        if log_path is not None:
+            report_path = f"{os.path.splitext(log_path)[0]}.metrics.json"
+            report.write_json(report_path)
+            log.info(f"Metrics written to {report_path}")
@@ -0,0 +1,242 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.image_reconciliation import ImageReconciliation
+from modules.import_sample import ImportSample
+from modules.logger import Logger
+from modules.models.async_charter_db import AsyncCharterDb
+from modules.models.images_file import ImagesFile
+from modules.models.mom_backup import MomBackup
+from modules.progress import Progress
+from modules.utils import iterate_in_executor
+
+log = Logger()
+
+# Backup settings
+backup_zip = str(os.environ.get("BACKUP_PATH"))
+
+# Image file list settings
+image_files_path = str(os.environ.get("IMAGE_LIST_PATH"))
+
+# Postgres settings
+pg_password = str(os.environ.get("PG_PW"))
+pg_host = str(os.environ.get("PG_HOST"))
+pg_port = int(os.environ.get("PG_PORT", "5432"))
+pg_user = str(os.environ.get("PG_USER", "postgres"))
+pg_db = str(os.environ.get("PG_DB", "momcheck"))
+
+# Sample settings
+sample_fraction = os.environ.get("SAMPLE_FRACTION")
+sample_seed = int(os.environ.get("SAMPLE_SEED", "0"))
+sample: None | ImportSample = None
+if sample_fraction is not None:
+    sample = ImportSample(float(sample_fraction), sample_seed)
+
+# Image reconciliation settings
+reconcile_images = os.environ.get("RECONCILE_IMAGES", "").lower() in [
+    "1",
+    "true",
+    "yes",
+]
+
+# Logging settings
+aggregate_warnings = os.environ.get("AGGREGATE_WARNINGS", "").lower() in [
+    "1",
+    "true",
+    "yes",
+]
+warning_samples = int(os.environ.get("WARNING_SAMPLES", "5"))
+if aggregate_warnings:
+    log.aggregate_warnings(warning_samples)
+
+# Progress settings
+Progress.interval = float(os.environ.get("PROGRESS_INTERVAL", "10"))
+
+
+async def main():
+    # All parsing runs in order on a single worker thread, so that the next stage
+    # is parsed while the previous one is being written to the database.
+    parser = ThreadPoolExecutor(max_workers=1)
+    loop = asyncio.get_running_loop()
+
+    def parse(func, *args):
+        return loop.run_in_executor(parser, func, *args)
+
+    log.info(f"Connecting to database at {pg_host}")
+    async with AsyncCharterDb(pg_host, pg_password, pg_port, pg_user, pg_db) as db:
+        log.info(f"Opening zip file {backup_zip}...")
+        with MomBackup(backup_zip) as backup:
+            log.info("Parsing users, images, person index and archives...")
+            # Sampling happens before the next parsing job starts, as they run in order
+            users_future = parse(
+                lambda: (
+                    backup.list_users()
+                    if sample is None
+                    else backup.apply_sample(sample, backup.list_users())
+                )
+            )
+            reconciliation: None | ImageReconciliation = None
+            images = ImagesFile(image_files_path).iter_images()
+            if sample is not None:
+                images = sample.filter_images(images)
+            if reconcile_images:
+                reconciliation = ImageReconciliation()
+                images = reconciliation.track_server_images(images)
+            images_stream = iterate_in_executor(parser, lambda: images)
+            person_index_future = parse(backup.init_person_index)
+            archives_future = parse(backup.list_archives)
+
+            log.info("Setting up database...")
+            await db.setup_db()
+
+            # insert index locations
+            log.info("Inserting index locations...")
+            await db.insert_index_locations()
+
+            # insert users
+            users = await users_future
+            log.info(f"Inserting {len(users)} users...")
+            await db.insert_users(users)
+
+            # insert images
+            log.info("Streaming images...")
+            images_count = await db.insert_images(images_stream)
+            log.info(f"Inserted {images_count} images")
+
+            # insert archives
+            person_index = await person_index_future
+            archives = await archives_future
+            fonds_future = parse(backup.list_fonds, archives)
+            log.info(f"Inserting {len(archives)} archives...")
+            await db.insert_archives(archives)
+
+            # insert fonds
+            fonds = await fonds_future
+            collections_future = parse(backup.list_collections, fonds)
+            fond_charters_stream = iterate_in_executor(
+                parser, lambda: backup.iter_fond_charters(fonds, users, person_index)
+            )
+            log.info(f"Inserting {len(fonds)} fonds...")
+            await db.insert_fonds(fonds)
+
+            # insert fond charters
+            log.info("Streaming fond charters...")
+            fond_charters = await db.insert_fonds_charters(fond_charters_stream)
+            log.info(f"Inserted {len(fond_charters)} fond charters")
+
+            # insert collections
+            collections = await collections_future
+            collection_charters_stream = iterate_in_executor(
+                parser,
+                lambda: backup.iter_collection_charters(
+                    collections, users, person_index
+                ),
+            )
+            saved_charters_future = parse(
+                backup.list_saved_charters, users, fonds, collections, person_index
+            )
+            private_mycollections_future = parse(
+                backup.list_private_mycollections, users
+            )
+            log.info(f"Inserting {len(collections)} collections...")
+            await db.insert_collections(collections)
+
+            # insert collection charters
+            log.info("Streaming collection charters...")
+            collection_charters = await db.insert_collections_charters(
+                collection_charters_stream
+            )
+            log.info(f"Inserted {len(collection_charters)} collection charters")
+
+            public_charters = fond_charters + collection_charters
+
+            # insert user bookmarks
+            log.info("Inserting user charter bookmarks...")
+            await db.insert_user_charter_bookmarks(users)
+
+            # insert saved charters
+            saved_charters = await saved_charters_future
+            log.info(f"Inserting {len(saved_charters)} saved charters...")
+            await db.insert_saved_charters(saved_charters)
+
+            # insert private mycollections
+            private_mycollections = await private_mycollections_future
+            private_mycharters_future = parse(
+                backup.list_private_charters,
+                users,
+                private_mycollections,
+                public_charters,
+                person_index,
+            )
+            public_mycollections_future = parse(
+                backup.list_public_mycollections, users, private_mycollections
+            )
+            log.info(f"Inserting {len(private_mycollections)} private mycollections...")
+            await db.insert_private_collections(private_mycollections)
+
+            # insert private mycollection charters
+            private_mycharters = await private_mycharters_future
+            public_mycollections = await public_mycollections_future
+            public_mycharters_stream = iterate_in_executor(
+                parser,
+                lambda: backup.list_public_charters(
+                    private_mycharters, public_mycollections, person_index
+                ),
+            )
+            log.info(
+                f"Inserting {len(private_mycharters)} private collection charters..."
+            )
+            await db.insert_private_mycharters(private_mycharters)
+
+            # insert public mycollections
+            log.info(f"Inserting {len(public_mycollections)} public mycollections...")
+            await db.insert_public_mycollections(public_mycollections)
+
+            # insert public mycollection charters
+            log.info("Streaming public collection charters...")
+            public_mycharters = await db.insert_public_mycharters(
+                public_mycharters_stream
+            )
+            log.info(f"Inserted {len(public_mycharters)} public collection charters")
+
+            public_charters = public_charters + public_mycharters
+
+            # insert persons
+            log.info(f"Inserting {person_index.count_persons()} indexes...")
+            await db.insert_persons(
+                person_index, public_charters, private_mycharters, saved_charters
+            )
+
+            # reconcile images
+            if reconciliation is not None:
+                log.info("Reconciling images...")
+                reconciliation.add_fonds(fonds)
+                reconciliation.add_collections(collections + public_mycollections)
+                reconciliation.add_charters(public_charters)
+                reconciliation.add_charters(private_mycharters)
+                reconciliation.add_charters(saved_charters)
+                reconciliation.reconcile()
+                await db.insert_image_reconciliation(reconciliation)
+
+            # reset sequences
+            log.info("Resetting id sequences...")
+            await db.reset_serial_id_sequences()
+
+            # enable triggers
+            log.info("Enabling triggers...")
+            await db.enable_triggers()
+
+            # create diagnostic views
+            log.info("Creating diagnostic views...")
+            await db.create_diagnostic_views()
+
+            # finished
+            log.info("Database import complete")
+            log.log_warning_summary("the import")
+            if sample is not None:
+                sample.log_summary()
+    parser.shutdown()
+
+
+asyncio.run(main())
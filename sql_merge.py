@@ -0,0 +1,26 @@
+import os
+
+from modules.logger import Logger
+from modules.models.charter_db import CharterDb
+from modules.shard_merge import ShardMerge, list_shards
+
+log = Logger()
+
+# Shard settings
+shard_path = os.environ.get("SHARD_PATH", "shards")
+
+# Postgres settings
+pg_password = str(os.environ.get("PG_PW"))
+pg_host = str(os.environ.get("PG_HOST"))
+pg_port = int(os.environ.get("PG_PORT", "5432"))
+pg_user = str(os.environ.get("PG_USER", "postgres"))
+pg_db = str(os.environ.get("PG_DB", "momcheck"))
+
+paths = list_shards(shard_path)
+log.info(f"Merging {len(paths)} shards from {shard_path}")
+
+log.info(f"Connecting to database at {pg_host}")
+with CharterDb(pg_host, pg_password, pg_port, pg_user, pg_db) as db:
+    ShardMerge(paths).load(db)
+    log.info("Database merge complete")
+    log.log_warning_totals()